@@ -0,0 +1,65 @@
+"""leads: contact_keys text[] with normalized contacts for single-statement upsert
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Копия нормализации контактов app.leads на момент этой ревизии: повтор миграции не должен зависеть
+# от последующих изменений кода приложения
+def _normalize_contact(s: str) -> str:
+    s = s.strip().lower()
+    digits = "".join(c for c in s if c.isdigit() or c == "+")
+    if not digits:
+        return s
+    if digits.startswith("+7"):
+        digits = "8" + digits[2:]
+    elif digits.startswith("7") and len(digits) == 11:
+        digits = "8" + digits[1:]
+    if digits.startswith("8") and len(digits) == 11:
+        return digits
+    if len(digits) == 10 and digits[0] == "9":
+        return "8" + digits
+    return digits
+
+
+def _contact_keys(parts: list[str]) -> list[str]:
+    keys = []
+    for p in parts:
+        p = p.strip()
+        key = _normalize_contact(p) if p else ""
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def upgrade() -> None:
+    op.add_column(
+        "leads",
+        sa.Column("contact_keys", ARRAY(sa.Text()), server_default="{}", nullable=False),
+    )
+    # Заполняем ключи существующих лидов той же нормализацией, что и при сохранении (копия выше)
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, contact_text FROM leads")).all()
+    for row in rows:
+        keys = _contact_keys(row.contact_text.split(" | "))
+        conn.execute(
+            sa.text("UPDATE leads SET contact_keys = :keys WHERE id = :id"),
+            {"keys": keys, "id": row.id},
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("leads", "contact_keys")
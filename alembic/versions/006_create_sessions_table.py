@@ -0,0 +1,47 @@
+"""create sessions summary table and backfill it from messages/leads
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sessions",
+        sa.Column("user_id", sa.String(255), primary_key=True),
+        sa.Column("dialog_id", sa.String(255), primary_key=True),
+        sa.Column("first_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("has_lead", sa.Boolean(), server_default=sa.text("false"), nullable=False),
+    )
+    op.create_index(
+        "ix_sessions_last_at",
+        "sessions",
+        [sa.text("last_at DESC"), sa.text("user_id DESC"), sa.text("dialog_id DESC")],
+    )
+    op.execute(
+        sa.text("""
+            INSERT INTO sessions (user_id, dialog_id, first_at, last_at, message_count, has_lead)
+            SELECT m.user_id, m.dialog_id, min(m.created_at), max(m.created_at), count(*),
+                   EXISTS (SELECT 1 FROM leads l WHERE l.user_id = m.user_id AND l.dialog_id = m.dialog_id)
+            FROM messages m
+            GROUP BY m.user_id, m.dialog_id
+        """)
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sessions_last_at", table_name="sessions")
+    op.drop_table("sessions")
@@ -0,0 +1,35 @@
+"""create daily_stats rollup table and messages(created_at) index
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_messages_created_at", "messages", ["created_at"])
+    # Заполняется фоновой задачей приложения (app/stats.py) при первом запуске
+    op.create_table(
+        "daily_stats",
+        sa.Column("tz", sa.String(64), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("sessions", sa.Integer(), nullable=False),
+        sa.Column("unique_users", sa.Integer(), nullable=False),
+        sa.Column("messages", sa.Integer(), nullable=False),
+        sa.Column("refreshed_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_stats")
+    op.drop_index("ix_messages_created_at", table_name="messages")
@@ -0,0 +1,33 @@
+"""create response_cache table
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "response_cache",
+        sa.Column("key", sa.String(64), primary_key=True),
+        sa.Column("prompt_hash", sa.String(64), nullable=False),
+        sa.Column("reply", sa.Text(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_response_cache_prompt_hash", "response_cache", ["prompt_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_response_cache_prompt_hash", table_name="response_cache")
+    op.drop_table("response_cache")
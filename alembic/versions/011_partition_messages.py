@@ -0,0 +1,92 @@
+"""messages: monthly range partitioning by created_at
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18
+
+Таблица пересоздаётся секционированной, данные переносятся одним INSERT ... SELECT в той же транзакции
+(на время миграции запись в messages заблокирована — выполнять в окно обслуживания).
+Создаются секции от месяца самого старого сообщения до текущего + 2 вперёд и секция по умолчанию;
+дальше секции ведёт app/partitions.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = {
+    "ix_messages_user_id": "(user_id)",
+    "ix_messages_dialog_id": "(dialog_id)",
+    "ix_messages_created_at": "(created_at)",
+    "ix_messages_user_dialog_created_at": "(user_id, dialog_id, created_at DESC)",
+}
+
+_COLUMNS = """
+    id uuid NOT NULL,
+    user_id varchar(255) NOT NULL,
+    dialog_id varchar(255) NOT NULL,
+    role varchar(32) NOT NULL,
+    content text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+"""
+
+# Месячные секции (границы по UTC) от месяца первого сообщения в source до текущего + 2
+_CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    m timestamptz;
+    last timestamptz := date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '2 months';
+BEGIN
+    SELECT coalesce(
+        date_trunc('month', min(created_at) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+        date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+    ) INTO m FROM messages_unpartitioned;
+    WHILE m <= last LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            'messages_y' || to_char(m AT TIME ZONE 'UTC', 'YYYY') || 'm' || to_char(m AT TIME ZONE 'UTC', 'MM'),
+            m, m + interval '1 month'
+        );
+        m := m + interval '1 month';
+    END LOOP;
+END $$
+"""
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey")
+    for name in _INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_old")
+
+    op.execute(f"CREATE TABLE messages ({_COLUMNS}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)")
+    for name, columns in _INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON messages {columns}")
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    op.execute(_CREATE_PARTITIONS)
+
+    op.execute(
+        "INSERT INTO messages (id, user_id, dialog_id, role, content, created_at) "
+        "SELECT id, user_id, dialog_id, role, content, created_at FROM messages_unpartitioned"
+    )
+    op.execute("DROP TABLE messages_unpartitioned")
+    op.execute("ANALYZE messages")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    for name in _INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_part")
+    op.execute(f"CREATE TABLE messages ({_COLUMNS}, PRIMARY KEY (id))")
+    for name, columns in _INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON messages {columns}")
+    op.execute(
+        "INSERT INTO messages (id, user_id, dialog_id, role, content, created_at) "
+        "SELECT id, user_id, dialog_id, role, content, created_at FROM messages_partitioned"
+    )
+    op.execute("DROP TABLE messages_partitioned")
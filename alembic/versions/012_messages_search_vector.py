@@ -0,0 +1,30 @@
+"""messages: generated tsvector column (russian + english) with GIN index for admin search
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18
+
+Добавление STORED-колонки переписывает все секции messages (выполнять в окно обслуживания).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "012"
+down_revision: Union[str, None] = "011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE messages ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('russian'::regconfig, content) || to_tsvector('english'::regconfig, content)) STORED"
+    )
+    op.execute("CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)")
+    op.execute("ANALYZE messages")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX ix_messages_search_vector")
+    op.execute("ALTER TABLE messages DROP COLUMN search_vector")
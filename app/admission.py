@@ -0,0 +1,267 @@
+"""
+Допуск запросов к /api/chat: ограничение частоты (token bucket) и числа одновременных стримов
+на пользователя и на воркер, с очередью ограниченной длины и времени ожидания.
+Отказ — AdmissionRejected с retry_after (маршрут отвечает 429 и заголовком Retry-After).
+
+Частота ограничивается в памяти процесса (ADMISSION_RATE_BACKEND=memory) или общим для всех воркеров
+счётчиком в PostgreSQL (postgres): одна строка на пользователя, пополнение и списание — одним UPSERT
+под блокировкой строки. Одновременные стримы всегда считаются в процессе (на воркер).
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Protocol
+
+from sqlalchemy import text
+
+from app.config import get_settings
+from app.database import session_scope
+from app.metrics import Counter, Gauge, Histogram, metrics_enabled
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Отказов в допуске к чату (rate — частота, concurrency — очередь заполнена, timeout — не дождались слота)",
+    ("reason",),
+)
+ADMISSION_WAIT_SECONDS = Histogram("admission_wait_seconds", "Ожидание слота для стрима в очереди допуска")
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен; retry_after — через сколько секунд имеет смысл повторить."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter(Protocol):
+    async def take(self, key: str) -> float:
+        """Списывает токен; 0 — допущен, иначе секунды до появления токена."""
+        ...
+
+
+class MemoryTokenBucket:
+    """Token bucket в памяти процесса: rate токенов в секунду, не больше burst в запасе."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    async def take(self, key: str) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        """Удаляет полностью пополненные корзины: для них отсутствие записи равнозначно."""
+        full_after = self.burst / self.rate
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+
+
+# Пополнение и списание одной командой; при нехватке токенов строка не меняется и не возвращается.
+_TAKE_TOKEN = text(
+    """
+    INSERT INTO rate_limits (key, tokens, updated_at)
+    VALUES (:key, :burst - 1, clock_timestamp())
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = LEAST(:burst, rate_limits.tokens
+            + EXTRACT(EPOCH FROM clock_timestamp() - rate_limits.updated_at) * :rate) - 1,
+        updated_at = clock_timestamp()
+    WHERE LEAST(:burst, rate_limits.tokens
+        + EXTRACT(EPOCH FROM clock_timestamp() - rate_limits.updated_at) * :rate) >= 1
+    RETURNING tokens
+    """
+)
+_TOKENS_LEFT = text(
+    """
+    SELECT LEAST(:burst, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * :rate)
+    FROM rate_limits WHERE key = :key
+    """
+)
+
+
+class PostgresTokenBucket:
+    """Token bucket, общий для всех воркеров: таблица rate_limits (UNLOGGED), см. миграцию 008."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+
+    async def take(self, key: str) -> float:
+        params = {"key": key, "rate": self.rate, "burst": self.burst}
+        async with session_scope() as session:
+            result = await session.execute(_TAKE_TOKEN, params)
+            if result.first() is not None:
+                return 0.0
+            tokens = float((await session.execute(_TOKENS_LEFT, params)).scalar() or 0)
+        return max(1 - tokens, 0.0) / self.rate or 1 / self.rate
+
+
+class AdmissionTicket:
+    """Занятые слоты одного запроса; release() идемпотентен (вызывается из генератора стрима и BackgroundTask)."""
+
+    def __init__(self, admission: "Admission", user_id: str) -> None:
+        self._admission = admission
+        self._user_id = user_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._admission._release(self._user_id)
+
+
+class Admission:
+    """
+    Допуск к стриму: сначала лимит частоты, затем слот пользователя и общий слот воркера.
+    Сверх лимита запрос встаёт в очередь (FIFO, не больше queue_max, не дольше queue_timeout);
+    освободившийся слот передаётся первому ожидающему, которому он подходит. 0 в лимитах — без ограничения.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_streams: int,
+        max_streams_per_user: int,
+        queue_timeout: float,
+        queue_max: int,
+        rate_limiter: RateLimiter | None = None,
+    ) -> None:
+        self.max_streams = max_streams
+        self.max_streams_per_user = max_streams_per_user
+        self.queue_timeout = queue_timeout
+        self.queue_max = queue_max
+        self.rate_limiter = rate_limiter
+        self.active = 0
+        self._per_user: dict[str, int] = {}
+        self._waiters: deque[tuple[str, asyncio.Future]] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _can_enter(self, user_id: str) -> bool:
+        if self.max_streams and self.active >= self.max_streams:
+            return False
+        if self.max_streams_per_user and self._per_user.get(user_id, 0) >= self.max_streams_per_user:
+            return False
+        return True
+
+    def _enter(self, user_id: str) -> None:
+        self.active += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+
+    async def acquire(self, user_id: str) -> AdmissionTicket:
+        """Допускает запрос или бросает AdmissionRejected."""
+        if self.rate_limiter is not None:
+            retry_after = await self.rate_limiter.take(user_id)
+            if retry_after > 0:
+                self._reject("rate")
+                raise AdmissionRejected("rate", retry_after)
+        # Ожидающие в очереди войти не могут (им передаётся каждый освободившийся слот),
+        # поэтому новый запрос, которому слот есть, никого не обгоняет
+        if self._can_enter(user_id):
+            self._enter(user_id)
+        else:
+            if self.waiting >= self.queue_max or self.queue_timeout <= 0:
+                self._reject("concurrency")
+                raise AdmissionRejected("concurrency", 1.0)
+            await self._wait_for_slot(user_id)
+        return AdmissionTicket(self, user_id)
+
+    async def _wait_for_slot(self, user_id: str) -> None:
+        started = time.perf_counter()
+        waiter = (user_id, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Слот мог быть передан одновременно с истечением таймаута — возвращаем его
+            if waiter[1].done() and not waiter[1].cancelled():
+                self._release(user_id)
+            self._reject("timeout")
+            raise AdmissionRejected("timeout", max(1.0, self.queue_timeout)) from None
+        except asyncio.CancelledError:
+            # Слот мог быть передан в момент отмены — возвращаем его
+            if waiter[1].done() and not waiter[1].cancelled():
+                self._release(user_id)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if metrics_enabled():
+                ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    def _release(self, user_id: str) -> None:
+        self.active -= 1
+        left = self._per_user.get(user_id, 1) - 1
+        if left:
+            self._per_user[user_id] = left
+        else:
+            self._per_user.pop(user_id, None)
+        for waiter in list(self._waiters):
+            waiting_user, future = waiter
+            if future.done():
+                continue
+            if self._can_enter(waiting_user):
+                self._waiters.remove(waiter)
+                self._enter(waiting_user)
+                future.set_result(None)
+            elif self.max_streams and self.active >= self.max_streams:
+                break
+
+    @staticmethod
+    def _reject(reason: str) -> None:
+        if metrics_enabled():
+            ADMISSION_REJECTED.inc(reason=reason)
+
+
+_admission: Admission | None = None
+
+
+def get_admission() -> Admission | None:
+    """Допуск процесса; None, если ограничения отключены (ADMISSION_ENABLED=false)."""
+    global _admission
+    settings = get_settings()
+    if not settings.ADMISSION_ENABLED:
+        return None
+    if _admission is None:
+        rate_limiter: RateLimiter | None = None
+        if settings.ADMISSION_RATE_PER_MINUTE > 0:
+            rate = settings.ADMISSION_RATE_PER_MINUTE / 60
+            burst = settings.ADMISSION_RATE_BURST or math.ceil(settings.ADMISSION_RATE_PER_MINUTE)
+            if settings.ADMISSION_RATE_BACKEND == "postgres":
+                rate_limiter = PostgresTokenBucket(rate, burst)
+            else:
+                rate_limiter = MemoryTokenBucket(rate, burst)
+        _admission = Admission(
+            max_streams=settings.ADMISSION_MAX_STREAMS,
+            max_streams_per_user=settings.ADMISSION_MAX_STREAMS_PER_USER,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            queue_max=settings.ADMISSION_QUEUE_MAX,
+            rate_limiter=rate_limiter,
+        )
+    return _admission
+
+
+Gauge(
+    "admission_active_streams",
+    "Допущенных стримов чата в воркере",
+    callback=lambda: _admission.active if _admission is not None else 0,
+)
+Gauge(
+    "admission_waiting",
+    "Запросов в очереди допуска",
+    callback=lambda: _admission.waiting if _admission is not None else 0,
+)
@@ -1,19 +1,35 @@
 """
 Конфигурация приложения. Все переменные читаются только из .env.
+Settings создаётся один раз на процесс (get_settings мемоизирован).
 """
-import os
+from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
+from pydantic import BaseModel, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
 def _resolve_prompt_path(v: str) -> Path:
     p = Path(v)
     if not p.is_absolute():
-        p = Path(__file__).resolve().parent.parent / p
+        p = _PROJECT_ROOT / p
     return p
 
 
+class UpstreamConfig(BaseModel):
+    """Один апстрим LLM из LLM_UPSTREAMS; пустые api_key/model берутся из LLM_API_KEY/LLM_MODEL."""
+
+    url: str
+    api_key: str = ""
+    model: str = ""
+    weight: float = 1.0
+    name: str = ""
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -27,13 +43,126 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = ""
     POSTGRES_DB: str = "aichatbot"
 
+    # Пул соединений SQLAlchemy/asyncpg
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
     LLM_URL: str = "https://api.deepseek.com"
     LLM_API_KEY: str = ""
     LLM_MODEL: str = "deepseek-chat"
     LLM_TEMPERATURE: float = 0.7
 
+    # Пул соединений к LLM (общий httpx.AsyncClient на время жизни приложения)
+    LLM_HTTP2: bool = True
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 60.0
+
+    # Несколько апстримов LLM с весами (JSON-список UpstreamConfig); пусто — один апстрим LLM_URL/LLM_MODEL.
+    # Имена (name, по умолчанию url) должны быть уникальны: по ним метки метрик апстримов
+    LLM_UPSTREAMS: list[UpstreamConfig] = []
+    # Повторы на другом апстриме до первого токена; хеджирование — второй запрос, если первого токена нет
+    # дольше LLM_HEDGE_AFTER_MS (0 — выключено); circuit breaker — ошибок подряд до исключения апстрима и пауза (сек)
+    LLM_RETRIES: int = 1
+    LLM_HEDGE_AFTER_MS: float = 0.0
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_COOLDOWN: float = 30.0
+
+    # Окно контекста: бюджет токенов на историю, максимум сообщений из БД, закреплённый префикс диалога
+    HISTORY_TOKEN_BUDGET: int = 6000
+    HISTORY_MAX_MESSAGES: int = 200
+    HISTORY_PINNED_MESSAGES: int = 0
+
+    # Кэш истории диалогов в памяти воркера (LRU + TTL, ограничение по суммарному размеру)
+    HISTORY_CACHE_ENABLED: bool = True
+    HISTORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    HISTORY_CACHE_TTL: float = 600.0
+
+    # Сводка диалога: когда несжатая история длиннее SUMMARY_TRIGGER_TOKENS, фоновая задача сжимает всё, кроме
+    # последних SUMMARY_KEEP_MESSAGES сообщений, в сводку (таблица dialog_summaries) частями до SUMMARY_INPUT_TOKENS
+    SUMMARY_ENABLED: bool = False
+    SUMMARY_TRIGGER_TOKENS: int = 4000
+    SUMMARY_KEEP_MESSAGES: int = 10
+    SUMMARY_INPUT_TOKENS: int = 8000
+    SUMMARY_PROMPT_FILE_PATH: str = "prompts/summary.txt"
+    SUMMARY_WORKERS: int = 1
+    SUMMARY_QUEUE_MAX: int = 1000
+
+    # Сохранение сообщений: sync — в транзакции хода; write_behind — очередь с пакетной записью
+    PERSIST_MODE: Literal["sync", "write_behind"] = "sync"
+    PERSIST_BATCH_SIZE: int = 200
+    PERSIST_FLUSH_INTERVAL_MS: float = 50.0
+    PERSIST_WAIT_FOR_FLUSH: bool = True
+    PERSIST_QUEUE_MAX: int = 10000
+
     PROMPT_FILE_PATH: str = "prompts/system.txt"
+    # Именованные промпты по префиксу dialog_id (JSON: {"sales-": "prompts/sales.txt"}), иначе — PROMPT_FILE_PATH
+    PROMPT_ROUTES: dict[str, str] = {}
+    # Как часто (сек) проверять mtime файла промпта; PROMPT_WATCH — следить за изменениями через inotify (watchfiles)
+    PROMPT_RELOAD_INTERVAL: float = 2.0
+    PROMPT_WATCH: bool = False
     ADMIN_KEY: str = ""
+    # Админка: размер страницы по умолчанию и максимальный, размер пачки строк при выгрузке
+    ADMIN_PAGE_SIZE: int = 100
+    ADMIN_PAGE_SIZE_MAX: int = 1000
+    ADMIN_EXPORT_BATCH_SIZE: int = 1000
+    # Статистика по дням: часовой пояс свёртки, период фоновой свёртки (сек), сколько последних дней пересчитывать
+    STATS_TIMEZONE: str = "UTC"
+    STATS_REFRESH_ENABLED: bool = True
+    STATS_REFRESH_INTERVAL: float = 300.0
+    STATS_RECOMPUTE_DAYS: int = 1
+    # Поиск по сообщениям в админке: окно по умолчанию (дней назад), если date_from не задан; 0 — без ограничения
+    SEARCH_DEFAULT_DAYS: int = 90
+    # Секции messages по месяцам: обслуживание (вкл/выкл, период, сек), сколько месяцев создавать вперёд,
+    # срок хранения в месяцах (0 — бессрочно) и что делать со старыми секциями: detach — отсоединить (архив), drop — удалить
+    PARTITION_MAINTENANCE_ENABLED: bool = True
+    PARTITION_MAINTENANCE_INTERVAL: float = 3600.0
+    PARTITION_MONTHS_AHEAD: int = 2
+    PARTITION_RETENTION_MONTHS: int = 0
+    PARTITION_RETENTION_MODE: Literal["detach", "drop"] = "detach"
+    # Кэш ответов LLM на повторяющиеся вопросы: вкл/выкл, записей в памяти воркера, TTL (сек),
+    # общий уровень в PostgreSQL (таблица response_cache), сколько сообщений истории допускается (0 — только первый вопрос),
+    # размер фрагмента (символов) при отдаче сохранённого ответа
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_TTL: float = 86400.0
+    RESPONSE_CACHE_DB: bool = True
+    RESPONSE_CACHE_MAX_HISTORY: int = 0
+    RESPONSE_CACHE_CHUNK_CHARS: int = 16
+    # Допуск к /api/chat: одновременных стримов на воркер и на пользователя (0 — без ограничения),
+    # ожидание слота в очереди (сек; 0 — сразу 429) и длина очереди. По умолчанию выключено:
+    # при включении каждый пользователь получает не больше ADMISSION_MAX_STREAMS_PER_USER ответов одновременно
+    ADMISSION_ENABLED: bool = False
+    ADMISSION_MAX_STREAMS: int = 200
+    ADMISSION_MAX_STREAMS_PER_USER: int = 2
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0
+    ADMISSION_QUEUE_MAX: int = 100
+    # Частота запросов пользователя (token bucket): в минуту (0 — без ограничения), запас (0 — равен минутной норме),
+    # где хранить: memory — в воркере, postgres — общий для всех воркеров (таблица rate_limits)
+    ADMISSION_RATE_PER_MINUTE: float = 0.0
+    ADMISSION_RATE_BURST: int = 0
+    ADMISSION_RATE_BACKEND: Literal["memory", "postgres"] = "memory"
+    # Склейка фрагментов ответа в одно событие SSE: окно (мс, 0 — каждый фрагмент отдельно) и предел размера (байт, 0 — без предела)
+    SSE_COALESCE_MS: float = 0.0
+    SSE_COALESCE_BYTES: int = 0
+    # Возобновляемые стримы: id событий SSE и буфер ответа (байт на генерацию) для переподключения по Last-Event-ID;
+    # после обрыва генерация ждёт клиента SSE_RESUME_GRACE сек, завершённая хранится столько же
+    SSE_RESUME_ENABLED: bool = False
+    SSE_RESUME_GRACE: float = 60.0
+    SSE_RESUME_BUFFER_BYTES: int = 256 * 1024
+    # Согласование кэшей воркеров через LISTEN/NOTIFY (отдельное соединение на воркер) и канал уведомлений
+    PUBSUB_ENABLED: bool = False
+    PUBSUB_CHANNEL: str = "aichatbot_events"
+    # Метрики Prometheus (/metrics) и замеры этапов чата; false — без накладных расходов, /metrics отвечает 404
+    METRICS_ENABLED: bool = True
+    # Токен для /metrics (Authorization: Bearer ...); пустой — /metrics закрыт (403)
+    METRICS_TOKEN: str = ""
 
     @property
     def database_url(self) -> str:
@@ -42,10 +171,53 @@ class Settings(BaseSettings):
             f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
 
+    @field_validator("LLM_UPSTREAMS")
+    @classmethod
+    def _unique_upstream_names(cls, upstreams: list[UpstreamConfig]) -> list[UpstreamConfig]:
+        names = [u.name or u.url for u in upstreams]
+        duplicates = sorted({n for n in names if names.count(n) > 1})
+        if duplicates:
+            raise ValueError(f"Повторяющиеся имена апстримов LLM (задайте name): {', '.join(duplicates)}")
+        return upstreams
+
+    @property
+    def llm_upstreams(self) -> list[UpstreamConfig]:
+        """Апстримы LLM с подставленными значениями по умолчанию."""
+        configured = self.LLM_UPSTREAMS or [UpstreamConfig(url=self.LLM_URL)]
+        return [
+            u.model_copy(
+                update={
+                    "api_key": u.api_key or self.LLM_API_KEY,
+                    "model": u.model or self.LLM_MODEL,
+                    "name": u.name or u.url,
+                }
+            )
+            for u in configured
+        ]
+
+    @property
+    def summary_prompt_path(self) -> Path:
+        return _resolve_prompt_path(self.SUMMARY_PROMPT_FILE_PATH)
+
     @property
     def prompt_path(self) -> Path:
         return _resolve_prompt_path(self.PROMPT_FILE_PATH)
 
+    def prompt_path_for(self, dialog_id: str | None) -> Path:
+        """Путь к промпту для диалога: самый длинный подходящий префикс из PROMPT_ROUTES или промпт по умолчанию."""
+        if dialog_id and self.PROMPT_ROUTES:
+            matches = [prefix for prefix in self.PROMPT_ROUTES if dialog_id.startswith(prefix)]
+            if matches:
+                return _resolve_prompt_path(self.PROMPT_ROUTES[max(matches, key=len)])
+        return self.prompt_path
+
+    @property
+    def prompt_paths(self) -> list[Path]:
+        """Все настроенные файлы промптов (по умолчанию + именованные)."""
+        return [self.prompt_path, *(_resolve_prompt_path(v) for v in self.PROMPT_ROUTES.values())]
+
 
+@lru_cache
 def get_settings() -> Settings:
+    """Настройки процесса. Для перечитывания .env (тесты) — get_settings.cache_clear()."""
     return Settings()
@@ -0,0 +1,57 @@
+"""
+Окно контекста для LLM: выбор самых новых сообщений диалога, помещающихся в бюджет токенов.
+Токены оцениваются локально, без токенизатора модели — быстро и с запасом.
+"""
+# Служебные токены на одно сообщение (роль, разделители) в формате chat/completions
+MESSAGE_OVERHEAD_TOKENS = 4
+# Роль сообщения со сводкой ранней части диалога (app.summaries); в истории оно всегда первое
+SUMMARY_ROLE = "system"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов: ~4 байта UTF-8 на токен.
+    Для кириллицы (2 байта на символ) это ~2 символа на токен — оценка сверху, что безопасно для лимита модели.
+    """
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def message_tokens(message: dict[str, str]) -> int:
+    """Оценка токенов одного сообщения с учётом служебных."""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def summary_message(summary: str) -> dict[str, str]:
+    return {"role": SUMMARY_ROLE, "content": f"Краткое содержание предыдущей части диалога:\n{summary}"}
+
+
+def pinned_prefix(history: list[dict[str, str]], pinned: int) -> int:
+    """Сколько первых сообщений истории закреплено: сводка диалога заменяет закреплённый префикс."""
+    if history and history[0]["role"] == SUMMARY_ROLE:
+        return 1
+    return pinned
+
+
+def build_context_window(
+    history: list[dict[str, str]],
+    budget: int,
+    *,
+    pinned: int = 0,
+) -> list[dict[str, str]]:
+    """
+    Возвращает подсписок истории (в хронологическом порядке), помещающийся в budget токенов:
+    первые pinned сообщений (закреплённый префикс) включаются всегда, остальное место
+    заполняется самыми новыми сообщениями. Набор непрерывен: после первого непоместившегося
+    сообщения более старые не берутся, чтобы в контексте не было «дыр».
+    """
+    pinned = max(0, min(pinned, len(history)))
+    head = history[:pinned]
+    remaining = budget - sum(message_tokens(m) for m in head)
+    start = len(history)
+    while start > pinned:
+        cost = message_tokens(history[start - 1])
+        if cost > remaining:
+            break
+        remaining -= cost
+        start -= 1
+    return [*head, *history[start:]]
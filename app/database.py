@@ -1,15 +1,54 @@
 """
 Подключение к PostgreSQL. Async SQLAlchemy + asyncpg.
+Параметры пула соединений — из .env; состояние пула отдаётся в метриках (/metrics).
 """
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import get_settings
+from app.metrics import Counter, Gauge, Histogram, metrics_enabled
 from app.models import Base
 
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Ожидание соединения из пула")
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Отказов из-за исчерпания пула (pool_timeout)")
+
+
+class _TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время ожидания соединения (включая открытие нового)."""
+
+    def _do_get(self):
+        if not metrics_enabled():
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+
 _settings = get_settings()
 engine = create_async_engine(
     _settings.database_url,
     echo=False,
+    poolclass=_TimedQueuePool,
+    pool_size=_settings.DB_POOL_SIZE,
+    max_overflow=_settings.DB_MAX_OVERFLOW,
+    pool_timeout=_settings.DB_POOL_TIMEOUT,
+    pool_recycle=_settings.DB_POOL_RECYCLE,
+    pool_pre_ping=_settings.DB_POOL_PRE_PING,
+    connect_args={
+        # Кэш подготовленных выражений asyncpg и адаптера SQLAlchemy (0 — для pgbouncer в режиме transaction)
+        "statement_cache_size": _settings.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": _settings.DB_STATEMENT_CACHE_SIZE,
+    },
 )
 async_session_factory = async_sessionmaker(
     engine,
@@ -19,6 +58,11 @@ async_session_factory = async_sessionmaker(
     autoflush=False,
 )
 
+Gauge("db_pool_size", "Размер пула соединений", callback=lambda: engine.pool.size())
+Gauge("db_pool_checked_out", "Соединений выдано из пула", callback=lambda: engine.pool.checkedout())
+Gauge("db_pool_checked_in", "Свободных соединений в пуле", callback=lambda: engine.pool.checkedin())
+Gauge("db_pool_overflow", "Соединений сверх pool_size (max_overflow)", callback=lambda: max(0, engine.pool.overflow()))
+
 
 async def get_db() -> AsyncSession:
     async with async_session_factory() as session:
@@ -32,6 +76,21 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Короткая транзакция вне Depends: commit при успехе, rollback при ошибке.
+    Соединение возвращается в пул сразу по выходе из блока, а не по окончании HTTP-ответа.
+    """
+    async with async_session_factory() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+
 async def init_db() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,185 @@
+"""
+Возобновляемые ответы чата: генерация ответа идёт фоновой задачей воркера, фрагменты копятся
+в ограниченном буфере (SSE_RESUME_BUFFER_BYTES), и клиент, у которого оборвалось соединение, дочитывает
+ответ через GET /api/chat/{generation_id}/stream с заголовком Last-Event-ID (id события SSE —
+"{generation_id}:{seq}").
+
+Без подписчиков генерация продолжается SSE_RESUME_GRACE секунд: дошла до конца — ответ сохраняется как
+обычно; не дождалась клиента — отменяется (запрос к LLM закрывается, частичный ответ не сохраняется).
+Завершённая генерация хранится ещё SSE_RESUME_GRACE секунд для поздних переподключений.
+Буфер — в памяти воркера: переподключение должно попасть на тот же воркер (sticky-маршрутизация).
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+from uuid import uuid4
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayGap(Exception):
+    """Запрошенные события уже вытеснены из буфера генерации."""
+
+
+class Generation:
+    """Фрагменты одного ответа с номерами (seq с 1) и его итог: завершён, ошибка (status, detail)."""
+
+    def __init__(self, user_id: str, dialog_id: str, max_bytes: int) -> None:
+        self.id = uuid4().hex
+        self.user_id = user_id
+        self.dialog_id = dialog_id
+        self.seq = 0
+        self.finished = False
+        self.error: tuple[int, str] | None = None
+        self.subscribers = 0
+        self.task: asyncio.Task | None = None
+        self._max_bytes = max_bytes
+        self._chunks: deque[tuple[int, str, int]] = deque()
+        self._size = 0
+        self._changed = asyncio.Event()
+        self._abandon_timer: asyncio.TimerHandle | None = None
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    def push(self, chunk: str) -> None:
+        self.seq += 1
+        size = len(chunk.encode("utf-8"))
+        self._chunks.append((self.seq, chunk, size))
+        self._size += size
+        # Последний фрагмент остаётся всегда, даже если он один больше лимита
+        while self._size > self._max_bytes and len(self._chunks) > 1:
+            self._size -= self._chunks.popleft()[2]
+        self._notify()
+
+    def finish(self, error: tuple[int, str] | None = None) -> None:
+        if not self.finished:
+            self.finished = True
+            self.error = error
+            self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def events_after(self, seq: int) -> list[tuple[int, str]]:
+        """Фрагменты с номером больше seq; ReplayGap, если часть из них уже вытеснена."""
+        if seq > self.seq:
+            raise ReplayGap
+        if seq == self.seq:
+            return []
+        if not self._chunks or self._chunks[0][0] > seq + 1:
+            raise ReplayGap
+        return [(s, chunk) for s, chunk, _ in self._chunks if s > seq]
+
+    async def follow(self, after: int = 0) -> AsyncIterator[tuple[int, str]]:
+        """(seq, фрагмент) после after: сначала накопленные, затем новые — до завершения генерации."""
+        while True:
+            changed = self._changed
+            for seq, chunk in self.events_after(after):
+                after = seq
+                yield seq, chunk
+            if self.finished:
+                return
+            await changed.wait()
+
+
+class GenerationRegistry:
+    """Генерации воркера по id: запуск, подписка клиентов, отмена без клиентов и удаление по истечении grace."""
+
+    def __init__(self, grace: float, max_bytes: int) -> None:
+        self._grace = grace
+        self._max_bytes = max_bytes
+        self._items: dict[str, Generation] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, generation_id: str) -> Generation | None:
+        return self._items.get(generation_id)
+
+    def start(
+        self,
+        user_id: str,
+        dialog_id: str,
+        produce: Callable[[Generation], Awaitable[None]],
+    ) -> Generation:
+        """Создаёт генерацию и запускает produce(generation) фоновой задачей."""
+        generation = Generation(user_id, dialog_id, self._max_bytes)
+        self._items[generation.id] = generation
+        generation.task = asyncio.create_task(self._run(generation, produce))
+        # Без подписчика (клиент не успел начать читать) генерация живёт grace секунд
+        self._schedule_abandon(generation)
+        return generation
+
+    async def _run(self, generation: Generation, produce: Callable[[Generation], Awaitable[None]]) -> None:
+        try:
+            await produce(generation)
+        except asyncio.CancelledError:
+            generation.finish(error=(499, "Генерация отменена"))
+            raise
+        except Exception:
+            logger.exception("Ошибка генерации ответа %s", generation.id)
+            generation.finish(error=(500, "Ошибка генерации ответа"))
+        finally:
+            generation.finish()
+            self._cancel_abandon(generation)
+            asyncio.get_running_loop().call_later(self._grace, self._items.pop, generation.id, None)
+
+    def attach(self, generation: Generation) -> None:
+        generation.subscribers += 1
+        self._cancel_abandon(generation)
+
+    def detach(self, generation: Generation) -> None:
+        generation.subscribers -= 1
+        if generation.subscribers == 0 and not generation.finished:
+            self._schedule_abandon(generation)
+
+    def _schedule_abandon(self, generation: Generation) -> None:
+        self._cancel_abandon(generation)
+        generation._abandon_timer = asyncio.get_running_loop().call_later(self._grace, self._abandon, generation)
+
+    @staticmethod
+    def _cancel_abandon(generation: Generation) -> None:
+        if generation._abandon_timer is not None:
+            generation._abandon_timer.cancel()
+            generation._abandon_timer = None
+
+    @staticmethod
+    def _abandon(generation: Generation) -> None:
+        generation._abandon_timer = None
+        if generation.subscribers == 0 and generation.task is not None and not generation.task.done():
+            logger.info("Генерация %s отменена: клиент не переподключился", generation.id)
+            generation.task.cancel()
+
+    async def close(self) -> None:
+        """Отменяет незавершённые генерации (остановка воркера)."""
+        tasks = [g.task for g in self._items.values() if g.task is not None and not g.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._items.clear()
+
+
+_registry: GenerationRegistry | None = None
+
+
+def get_generation_registry() -> GenerationRegistry | None:
+    """Реестр генераций процесса; None, если возобновление стримов отключено (SSE_RESUME_ENABLED=false)."""
+    global _registry
+    settings = get_settings()
+    if not settings.SSE_RESUME_ENABLED:
+        return None
+    if _registry is None:
+        _registry = GenerationRegistry(settings.SSE_RESUME_GRACE, settings.SSE_RESUME_BUFFER_BYTES)
+    return _registry
+
+
+async def close_generation_registry() -> None:
+    global _registry
+    if _registry is not None:
+        await _registry.close()
+        _registry = None
@@ -0,0 +1,182 @@
+"""
+Кэш истории диалогов в памяти процесса (на воркер): LRU с TTL и ограничением по суммарному размеру.
+Ключ — (user_id, dialog_id), значение — история в том виде, в каком её возвращает загрузка из БД.
+Заполняется при чтении истории, обновляется сквозной записью после сохранения сообщений.
+Попадания, промахи, вытеснения и объём кэша отдаются на /metrics (history_cache_*).
+"""
+import time
+from collections import OrderedDict
+
+from app.config import get_settings
+from app.context import pinned_prefix
+from app.metrics import Counter, Gauge
+
+# Накладные расходы на одно сообщение (dict, строка роли) — для оценки размера записи
+_MESSAGE_OVERHEAD_BYTES = 200
+# Сколько последних сбросов помнить для put(..., since=...)
+_MAX_TOMBSTONES = 10_000
+
+HistoryKey = tuple[str, str]
+
+
+def extend_history(
+    history: list[dict[str, str]],
+    messages: list[dict[str, str]],
+    *,
+    limit: int,
+    pinned: int = 0,
+) -> list[dict[str, str]]:
+    """
+    История после сохранения messages в той же форме, что и загрузка из БД:
+    первые pinned сообщений (или сводка) + не более limit последних.
+    """
+    pinned = pinned_prefix(history, pinned)
+    history = [*history, *messages]
+    if len(history) > pinned + limit:
+        history = [*history[:pinned], *history[pinned:][-limit:]]
+    return history
+
+
+def _history_size(history: list[dict[str, str]]) -> int:
+    """Оценка занимаемой памяти: кириллица в str занимает 2 байта на символ."""
+    return sum(2 * len(m["content"]) + _MESSAGE_OVERHEAD_BYTES for m in history)
+
+
+class HistoryCache:
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        # key -> (expires_at, size, history)
+        self._entries: OrderedDict[HistoryKey, tuple[float, int, list[dict[str, str]]]] = OrderedDict()
+        # Номер последнего сброса ключа (invalidate): история, прочитанная из БД раньше, в кэш не кладётся
+        self._seq = 0
+        self._tombstones: OrderedDict[HistoryKey, int] = OrderedDict()
+        self._tombstone_floor = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: HistoryKey) -> list[dict[str, str]] | None:
+        """Возвращает копию истории или None (промах, в т.ч. по истечении TTL)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, history = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(history)
+
+    @property
+    def version(self) -> int:
+        """Отметка перед чтением истории из БД — для put(..., since=version)."""
+        return self._seq
+
+    def put(self, key: HistoryKey, history: list[dict[str, str]], *, since: int | None = None) -> None:
+        """
+        since — отметка version до чтения history из БД: если ключ с тех пор сбрасывался (например, по событию
+        другого воркера, app.pubsub), прочитанная история могла устареть и не кэшируется.
+        """
+        if since is not None and self.invalidated_since(key, since):
+            return
+        self._remove(key)
+        size = _history_size(history)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, list(history))
+        self.total_bytes += size
+        self._evict()
+
+    def append(
+        self,
+        key: HistoryKey,
+        messages: list[dict[str, str]],
+        *,
+        limit: int,
+        pinned: int = 0,
+    ) -> None:
+        """
+        Сквозная запись: дописывает сохранённые сообщения к закэшированной истории, сохраняя
+        ту же форму, что и загрузка из БД (первые pinned сообщений или сводка + не более limit последних).
+        Если записи нет, ничего не делает — неполную историю кэшировать нельзя.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        self.put(key, extend_history(entry[2], messages, limit=limit, pinned=pinned))
+
+    def invalidated_since(self, key: HistoryKey, version: int) -> bool:
+        """Сбрасывался ли ключ после отметки version (история, прочитанная до неё, могла устареть)."""
+        return max(self._tombstones.get(key, 0), self._tombstone_floor) > version
+
+    def invalidate(self, key: HistoryKey) -> None:
+        self._remove(key)
+        self._seq += 1
+        self._tombstones[key] = self._seq
+        self._tombstones.move_to_end(key)
+        if len(self._tombstones) > _MAX_TOMBSTONES:
+            _, self._tombstone_floor = self._tombstones.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+        self._seq += 1
+        self._tombstones.clear()
+        self._tombstone_floor = self._seq
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+        }
+
+    def _remove(self, key: HistoryKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+
+_cache: HistoryCache | None = None
+
+
+def get_history_cache() -> HistoryCache | None:
+    """Кэш истории процесса; None, если кэш отключён в конфигурации."""
+    global _cache
+    settings = get_settings()
+    if not settings.HISTORY_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = HistoryCache(settings.HISTORY_CACHE_MAX_BYTES, settings.HISTORY_CACHE_TTL)
+    return _cache
+
+
+def _stat(name: str) -> int:
+    return _cache.stats()[name] if _cache is not None else 0
+
+
+Counter("history_cache_hits_total", "Ходов, история которых взята из кэша воркера", callback=lambda: _stat("hits"))
+Counter("history_cache_misses_total", "Ходов, история которых прочитана из БД", callback=lambda: _stat("misses"))
+Counter(
+    "history_cache_evictions_total",
+    "Историй, вытесненных из кэша по лимиту HISTORY_CACHE_MAX_BYTES",
+    callback=lambda: _stat("evictions"),
+)
+Gauge("history_cache_entries", "Диалогов в кэше истории воркера", callback=lambda: _stat("entries"))
+Gauge("history_cache_bytes", "Оценка объёма кэша истории воркера (байт)", callback=lambda: _stat("bytes"))
@@ -6,10 +6,10 @@ import re
 from datetime import datetime, timezone
 from uuid import uuid4
 
-from sqlalchemy import select
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Lead
+from app.pubsub import publish
 
 # Email и телефон (русский/международный формат)
 EMAIL_RE = re.compile(
@@ -22,20 +22,52 @@ PHONE_RE = re.compile(
 )
 
 
+# Телефону из PHONE_RE нужно не меньше 7 цифр (вторая альтернатива: 1+2+2+2), email — символ «@».
+# Без них регулярные выражения не запускаются: большинство сообщений чата отсекается этой проверкой.
+_PHONE_MIN_DIGITS = 7
+_DIGIT_RE = re.compile(r"\d")
+# Всё, кроме цифр и «+», что может входить в совпадение PHONE_RE: пробельные символы (\s), «-», «(», «)»
+_PHONE_SEPARATORS = str.maketrans("", "", "-()" + "".join(c for c in map(chr, range(0x3001)) if c.isspace()))
+
+
+def _normalize_phone(match: re.Match) -> str:
+    """
+    То же, что _normalize_contact, для совпадения PHONE_RE: в нём только цифры, «+» и разделители,
+    поэтому строка цифр получается одним translate без посимвольной сборки.
+    """
+    digits = match.group(0).translate(_PHONE_SEPARATORS)
+    if digits.startswith("+7"):
+        digits = "8" + digits[2:]
+    elif digits.startswith("7") and len(digits) == 11:
+        digits = "8" + digits[1:]
+    if digits.startswith("8") and len(digits) == 11:
+        return digits
+    if len(digits) == 10 and digits[0] == "9":
+        return "8" + digits
+    return digits
+
+
 def _extract_contact_parts(text: str) -> list[str]:
     """Извлекает все контакты (email, телефон) из текста как список уникальных строк."""
+    scan_emails = "@" in text
+    scan_phones = len(_DIGIT_RE.findall(text)) >= _PHONE_MIN_DIGITS
+    if not scan_emails and not scan_phones:
+        return []
     parts = []
     seen = set()
-    for m in EMAIL_RE.finditer(text):
-        s = m.group(0).strip().lower()
-        if s and s not in seen:
-            seen.add(s)
-            parts.append(m.group(0).strip())
-    for m in PHONE_RE.finditer(text):
-        s = _normalize_contact(m.group(0))
-        if s and s not in seen:
-            seen.add(s)
-            parts.append(m.group(0).strip())
+    if scan_emails:
+        for m in EMAIL_RE.finditer(text):
+            email = m.group(0)
+            key = email.lower()
+            if key not in seen:
+                seen.add(key)
+                parts.append(email)
+    if scan_phones:
+        for m in PHONE_RE.finditer(text):
+            key = _normalize_phone(m)
+            if key not in seen:
+                seen.add(key)
+                parts.append(m.group(0).strip())
     return parts
 
 
@@ -50,27 +82,6 @@ def extract_contact_text(text: str) -> str | None:
     return " | ".join(parts)
 
 
-def _merge_contacts(existing_text: str | None, new_parts: list[str]) -> str:
-    """Объединяет уже сохранённые контакты с новыми (без дубликатов), порядок: существующие + новые."""
-    seen = set()
-    parts = []
-    if existing_text:
-        for p in (x.strip() for x in existing_text.split(" | ") if x.strip()):
-            p_norm = _normalize_contact(p)
-            if p_norm and p_norm not in seen:
-                seen.add(p_norm)
-                parts.append(p.strip())
-    for p in new_parts:
-        p = p.strip()
-        if not p:
-            continue
-        p_norm = _normalize_contact(p)
-        if p_norm and p_norm not in seen:
-            seen.add(p_norm)
-            parts.append(p)
-    return " | ".join(parts)
-
-
 def _normalize_contact(s: str) -> str:
     """
     Нормализация для сравнения: только цифры и +; для российских номеров — каноническая форма 8 + 10 цифр,
@@ -93,6 +104,48 @@ def _normalize_contact(s: str) -> str:
     return digits
 
 
+def _contact_keys(parts: list[str]) -> tuple[list[str], list[str]]:
+    """Контакты без дубликатов и их нормализованные ключи (для сравнения с уже сохранёнными)."""
+    unique, keys = [], []
+    for p in parts:
+        p = p.strip()
+        key = _normalize_contact(p) if p else ""
+        if key and key not in keys:
+            unique.append(p)
+            keys.append(key)
+    return unique, keys
+
+
+# Один запрос вместо SELECT + UPDATE/INSERT: новые контакты дописываются к существующим в порядке появления,
+# уже известные (по нормализованному ключу в contact_keys) пропускаются. Если добавить нечего — строка
+# не обновляется и RETURNING ничего не возвращает. Конкурентные сообщения одного диалога не конфликтуют
+# на uq_leads_user_dialog: Postgres сериализует их на блокировке строки.
+_UPSERT_LEAD = text("""
+    INSERT INTO leads (id, user_id, dialog_id, contact_text, contact_keys, created_at, updated_at)
+    VALUES (:id, :user_id, :dialog_id, :contact_text, CAST(:contact_keys AS text[]), :now, :now)
+    ON CONFLICT (user_id, dialog_id) DO UPDATE SET
+        contact_text = leads.contact_text || COALESCE((
+            SELECT string_agg(' | ' || n.part, '' ORDER BY n.ord)
+            FROM unnest(CAST(:parts AS text[]), CAST(:contact_keys AS text[])) WITH ORDINALITY AS n(part, key, ord)
+            WHERE n.key <> ALL (leads.contact_keys)
+        ), ''),
+        contact_keys = leads.contact_keys || ARRAY(
+            SELECT n.key
+            FROM unnest(CAST(:contact_keys AS text[])) WITH ORDINALITY AS n(key, ord)
+            WHERE n.key <> ALL (leads.contact_keys)
+            ORDER BY n.ord
+        ),
+        updated_at = EXCLUDED.updated_at
+    WHERE NOT (EXCLUDED.contact_keys <@ leads.contact_keys)
+    RETURNING id
+""")
+
+_MARK_SESSION_HAS_LEAD = text("""
+    UPDATE sessions SET has_lead = true
+    WHERE user_id = :user_id AND dialog_id = :dialog_id AND NOT has_lead
+""")
+
+
 async def save_lead_if_contact(
     db: AsyncSession,
     user_id: str,
@@ -102,32 +155,26 @@ async def save_lead_if_contact(
     """
     Если в сообщении пользователя есть контакты (email/телефон и т.д.), сохраняет или обновляет лид.
     Один лид на сессию (user_id, dialog_id): контакты накапливаются — телефон, почта и др. (без дубликатов).
-    Возвращает True, если лид сохранён или обновлён.
+    Слияние выполняется в БД одним INSERT ... ON CONFLICT DO UPDATE; у сессии ставится has_lead,
+    другим воркерам после коммита уходит событие lead (app.pubsub). Возвращает True, если лид сохранён или обновлён.
     """
-    new_parts = _extract_contact_parts(user_message)
-    if not new_parts:
+    parts, keys = _contact_keys(_extract_contact_parts(user_message))
+    if not parts:
         return False
     result = await db.execute(
-        select(Lead).where(Lead.user_id == user_id, Lead.dialog_id == dialog_id)
-    )
-    existing = result.scalar_one_or_none()
-    now = datetime.now(timezone.utc)
-    if existing:
-        merged = _merge_contacts(existing.contact_text, new_parts)
-        if merged == existing.contact_text:
-            return False
-        existing.contact_text = merged
-        existing.updated_at = now
-        await db.flush()
-        return True
-    lead = Lead(
-        id=uuid4(),
-        user_id=user_id,
-        dialog_id=dialog_id,
-        contact_text=" | ".join(p.strip() for p in new_parts),
-        created_at=now,
-        updated_at=now,
+        _UPSERT_LEAD,
+        {
+            "id": uuid4(),
+            "user_id": user_id,
+            "dialog_id": dialog_id,
+            "contact_text": " | ".join(parts),
+            "contact_keys": keys,
+            "parts": parts,
+            "now": datetime.now(timezone.utc),
+        },
     )
-    db.add(lead)
-    await db.flush()
+    if result.first() is None:
+        return False
+    await db.execute(_MARK_SESSION_HAS_LEAD, {"user_id": user_id, "dialog_id": dialog_id})
+    await publish(db, "lead", user_id=user_id, dialog_id=dialog_id)
     return True
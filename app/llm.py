@@ -1,13 +1,31 @@
 """
-HTTP-клиент к LLM DeepSeek с поддержкой стриминга. URL и ключ только из конфигурации (.env).
+HTTP-клиент к LLM DeepSeek с поддержкой стриминга. URL, ключи и модели только из конфигурации (.env).
+Общий пул соединений (HTTP/2, keep-alive) создаётся в lifespan приложения и закрывается при остановке.
 """
-import json
+import time
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
 from typing import AsyncIterator
 
 import httpx
 
-from app.config import get_settings
+from app.config import Settings, get_settings
+from app.metrics import Counter, Histogram, metrics_enabled
+from app.sse import delta_content, is_done, iter_sse_data
+from app.upstreams import Upstream, get_upstream_pool
+
+LLM_CONNECT_SECONDS = Histogram("llm_connect_seconds", "От отправки запроса к LLM до заголовков ответа")
+LLM_TTFT_SECONDS = Histogram("llm_time_to_first_token_seconds", "От отправки запроса к LLM до первого фрагмента ответа")
+LLM_TOKEN_GAP_SECONDS = Histogram(
+    "llm_inter_token_seconds",
+    "Интервал между соседними фрагментами ответа LLM",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LLM_STREAM_SECONDS = Histogram("llm_stream_seconds", "Полное время стрима ответа LLM")
+LLM_TOKENS = Counter("llm_tokens_streamed_total", "Фрагментов content (≈токенов), полученных от LLM")
+LLM_ERRORS = Counter("llm_errors_total", "Ошибки запросов к LLM по HTTP-статусу (transport — сетевые ошибки и таймауты)", ("status",))
+
+_client: httpx.AsyncClient | None = None
 
 
 def load_system_prompt(path: Path) -> str:
@@ -17,46 +35,142 @@ def load_system_prompt(path: Path) -> str:
     return path.read_text(encoding="utf-8").strip()
 
 
-async def stream_chat(
+def create_llm_client(settings: Settings) -> httpx.AsyncClient:
+    """Создаёт httpx.AsyncClient с пулом соединений и таймаутами из конфигурации."""
+    return httpx.AsyncClient(
+        http2=settings.LLM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.LLM_READ_TIMEOUT,
+            connect=settings.LLM_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+async def init_llm_client() -> httpx.AsyncClient:
+    """Открывает общий клиент LLM (вызывается из lifespan)."""
+    global _client
+    if _client is None:
+        _client = create_llm_client(get_settings())
+    return _client
+
+
+async def close_llm_client() -> None:
+    """Закрывает общий клиент LLM и его соединения (вызывается при остановке приложения)."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+@asynccontextmanager
+async def _llm_client() -> AsyncIterator[httpx.AsyncClient]:
+    """Общий клиент из пула; вне lifespan (скрипты, тесты) — временный клиент на один запрос."""
+    if _client is not None:
+        yield _client
+        return
+    async with create_llm_client(get_settings()) as client:
+        yield client
+
+
+async def _stream_upstream(
+    client: httpx.AsyncClient,
+    upstream: Upstream,
     messages: list[dict[str, str]],
-    *,
     system_prompt: str,
+    track: bool = True,
 ) -> AsyncIterator[str]:
     """
-    Вызов DeepSeek chat/completions со stream=True.
-    Yields фрагменты content из delta.
-    При ошибке LLM пробрасывает httpx.HTTPStatusError (502/503).
+    Один запрос chat/completions к апстриму; фрагменты content из delta (поток SSE разбирается по байтам, app.sse).
+    track=False — фоновый запрос, в метрики LLM не попадает.
     """
     settings = get_settings()
-    url = f"{settings.LLM_URL.rstrip('/')}/chat/completions"
+    url = f"{upstream.config.url.rstrip('/')}/chat/completions"
     headers = {
-        "Authorization": f"Bearer {settings.LLM_API_KEY}",
+        "Authorization": f"Bearer {upstream.config.api_key}",
         "Content-Type": "application/json",
     }
     body = {
-        "model": settings.LLM_MODEL,
+        "model": upstream.config.model,
         "messages": [{"role": "system", "content": system_prompt}, *messages],
         "stream": True,
         "temperature": settings.LLM_TEMPERATURE,
     }
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    enabled = track and metrics_enabled()
+    started = time.perf_counter()
+    try:
         async with client.stream("POST", url, json=body, headers=headers) as response:
+            if enabled:
+                LLM_CONNECT_SECONDS.observe(time.perf_counter() - started)
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if not line or line.strip() != line:
+            done = False
+            async for batch in iter_sse_data(response.aiter_bytes()):
+                if done:
                     continue
-                if line.startswith("data: "):
-                    data = line[6:].strip()
-                    if data == "[DONE]":
-                        return
-                    try:
-                        chunk = json.loads(data)
-                    except json.JSONDecodeError:
-                        continue
-                    choices = chunk.get("choices") or []
-                    if not choices:
-                        continue
-                    delta = choices[0].get("delta") or {}
-                    content = delta.get("content")
+                for data in batch:
+                    if is_done(data):
+                        # Дочитываем тело до конца: иначе соединение закрывается и не возвращается в пул
+                        done = True
+                        break
+                    content = delta_content(data)
                     if content:
                         yield content
+    except httpx.HTTPStatusError as e:
+        if enabled:
+            LLM_ERRORS.inc(status=str(e.response.status_code))
+        raise
+    except httpx.TransportError:
+        if enabled:
+            LLM_ERRORS.inc(status="transport")
+        raise
+
+
+async def stream_chat(
+    messages: list[dict[str, str]],
+    *,
+    system_prompt: str,
+) -> AsyncIterator[str]:
+    """
+    Вызов chat/completions со stream=True через пул апстримов (app.upstreams): до первого фрагмента
+    ошибки апстрима повторяются на другом, при долгом ожидании первого токена запрос хеджируется.
+    Yields фрагменты content из delta.
+    При ошибке LLM пробрасывает httpx.HTTPStatusError (502/503), если доступных апстримов нет — NoUpstreamAvailable.
+    """
+    enabled = metrics_enabled()
+    started = time.perf_counter()
+    last_token_at = 0.0
+    async with _llm_client() as client:
+        chunks = get_upstream_pool().stream(
+            lambda upstream: _stream_upstream(client, upstream, messages, system_prompt)
+        )
+        async with aclosing(chunks):
+            async for content in chunks:
+                if enabled:
+                    now = time.perf_counter()
+                    if last_token_at:
+                        LLM_TOKEN_GAP_SECONDS.observe(now - last_token_at)
+                    else:
+                        LLM_TTFT_SECONDS.observe(now - started)
+                    last_token_at = now
+                    LLM_TOKENS.inc()
+                yield content
+    if enabled:
+        LLM_STREAM_SECONDS.observe(time.perf_counter() - started)
+
+
+async def complete_background(messages: list[dict[str, str]], *, system_prompt: str) -> str:
+    """
+    Полный ответ LLM для фоновых задач (сводки диалогов): тот же пул апстримов с повторами, но без
+    метрик чата (TTFT, токены, время стрима) и без учёта в circuit breaker'ах апстримов.
+    """
+    async with _llm_client() as client:
+        chunks = get_upstream_pool().stream(
+            lambda upstream: _stream_upstream(client, upstream, messages, system_prompt, track=False),
+            track=False,
+        )
+        async with aclosing(chunks):
+            return "".join([content async for content in chunks])
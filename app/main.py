@@ -1,21 +1,58 @@
 """
-FastAPI-приложение: API чата (POST /api/chat → SSE) и раздача статики для iframe.
+FastAPI-приложение: API чата (POST /api/chat → SSE, WebSocket /api/ws/chat) и раздача статики для iframe.
 """
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
+from app.config import get_settings
 from app.database import init_db
+from app.generations import close_generation_registry
+from app.llm import close_llm_client, init_llm_client
+from app.partitions import run_partition_maintenance
+from app.persistence import start_message_writer, stop_message_writer
+from app.prompts import get_prompt_store
+from app.pubsub import run_listener
 from app.routes.admin import router as admin_router
 from app.routes.chat import router as chat_router
+from app.routes.metrics import router as metrics_router
+from app.routes.ws_chat import router as ws_chat_router
+from app.stats import run_stats_refresher
+from app.summaries import start_summarizer, stop_summarizer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    settings = get_settings()
     await init_db()
-    yield
+    await init_llm_client()
+    if settings.PERSIST_MODE == "write_behind":
+        await start_message_writer()
+    if settings.SUMMARY_ENABLED:
+        await start_summarizer()
+    tasks: list[asyncio.Task] = []
+    if settings.PROMPT_WATCH:
+        tasks.append(asyncio.create_task(get_prompt_store().watch(settings.prompt_paths)))
+    if settings.PUBSUB_ENABLED:
+        tasks.append(asyncio.create_task(run_listener()))
+    if settings.PARTITION_MAINTENANCE_ENABLED:
+        tasks.append(asyncio.create_task(run_partition_maintenance()))
+    if settings.STATS_REFRESH_ENABLED:
+        tasks.append(asyncio.create_task(run_stats_refresher()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await close_generation_registry()
+        await stop_summarizer()
+        await stop_message_writer()
+        await close_llm_client()
 
 
 app = FastAPI(
@@ -25,7 +62,9 @@ app = FastAPI(
 )
 
 app.include_router(chat_router)
+app.include_router(ws_chat_router)
 app.include_router(admin_router)
+app.include_router(metrics_router)
 
 # Статика для страницы iframe (форма + приём SSE)
 static_path = Path(__file__).resolve().parent.parent / "static"
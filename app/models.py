@@ -1,11 +1,11 @@
 """
 Модели БД: сообщения с привязкой к user_id и dialog_id.
 """
-from datetime import datetime
+from datetime import date, datetime
 from uuid import uuid4
 
-from sqlalchemy import DateTime, String, Text, UniqueConstraint, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import DDL, Boolean, Computed, Date, DateTime, Float, Index, Integer, String, Text, UniqueConstraint, event, func
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -13,8 +13,17 @@ class Base(DeclarativeBase):
     pass
 
 
+SEARCH_VECTOR_SQL = "to_tsvector('russian'::regconfig, content) || to_tsvector('english'::regconfig, content)"
+
+
 class Message(Base):
+    """
+    Сообщения диалогов. Таблица секционирована по месяцам created_at (RANGE, UTC): секции messages_yYYYYmMM
+    создаёт и удаляет по сроку хранения app/partitions.py, строки вне созданных секций попадают в messages_default.
+    Ключ секционирования входит в первичный ключ — этого требует PostgreSQL.
+    """
     __tablename__ = "messages"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     id: Mapped[uuid4] = mapped_column(
         UUID(as_uuid=True),
@@ -27,9 +36,39 @@ class Message(Base):
     content: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
+        primary_key=True,
         server_default=func.now(),
         nullable=False,
     )
+    # Полнотекстовый индекс content (русская и английская морфология), вычисляется PostgreSQL при записи
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR,
+        Computed(SEARCH_VECTOR_SQL, persisted=True),
+        deferred=True,
+    )
+
+
+# Секция по умолчанию при создании схемы через create_all (миграция 011 создаёт её сама)
+event.listen(
+    Message.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"),
+)
+
+
+# Поиск по переписке в админке (search_vector @@ запрос)
+Index("ix_messages_search_vector", Message.search_vector, postgresql_using="gin")
+
+# Диапазонные выборки по времени (статистика за день/период)
+Index("ix_messages_created_at", Message.created_at)
+
+# Чтение хвоста истории диалога: WHERE user_id, dialog_id ORDER BY created_at DESC LIMIT N
+Index(
+    "ix_messages_user_dialog_created_at",
+    Message.user_id,
+    Message.dialog_id,
+    Message.created_at.desc(),
+)
 
 
 class Lead(Base):
@@ -45,6 +84,8 @@ class Lead(Base):
     user_id: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     dialog_id: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     contact_text: Mapped[str] = mapped_column(Text, nullable=False)
+    # Нормализованные ключи контактов из contact_text (для дедупликации в INSERT ... ON CONFLICT)
+    contact_keys: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=False, server_default="{}")
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=func.now(),
@@ -56,3 +97,94 @@ class Lead(Base):
         onupdate=func.now(),
         nullable=False,
     )
+
+
+class ChatSession(Base):
+    """
+    Сводка по сессии (user_id, dialog_id): первое/последнее сообщение, число сообщений, есть ли лид.
+    Обновляется при каждой записи сообщений (upsert), чтобы список сессий в админке не требовал GROUP BY по messages.
+    """
+    __tablename__ = "sessions"
+
+    user_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    dialog_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    first_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    has_lead: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
+
+
+# Список сессий в админке: ORDER BY last_at DESC, user_id DESC, dialog_id DESC с keyset-курсором
+Index(
+    "ix_sessions_last_at",
+    ChatSession.last_at.desc(),
+    ChatSession.user_id.desc(),
+    ChatSession.dialog_id.desc(),
+)
+
+
+class DailyStats(Base):
+    """
+    Дневные агрегаты для /api/admin/stats (по дням в часовом поясе tz): сессии, уникальные пользователи, сообщения.
+    Заполняется фоновой задачей за завершённые дни; текущий день считается на лету.
+    """
+    __tablename__ = "daily_stats"
+
+    tz: Mapped[str] = mapped_column(String(64), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    sessions: Mapped[int] = mapped_column(Integer, nullable=False)
+    unique_users: Mapped[int] = mapped_column(Integer, nullable=False)
+    messages: Mapped[int] = mapped_column(Integer, nullable=False)
+    refreshed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+
+class RateLimit(Base):
+    """
+    Корзина token bucket для ADMISSION_RATE_BACKEND=postgres: остаток токенов на момент updated_at.
+    Таблица UNLOGGED — после сбоя счётчики просто начинаются заново.
+    """
+    __tablename__ = "rate_limits"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class ResponseCacheEntry(Base):
+    """Сохранённый ответ LLM для кэша ответов (app/response_cache.py); ключ — sha256 от модели, промпта и истории."""
+    __tablename__ = "response_cache"
+    __table_args__ = (Index("ix_response_cache_prompt_hash", "prompt_hash"),)
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    prompt_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    reply: Mapped[str] = mapped_column(Text, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+
+class DialogSummary(Base):
+    """
+    Сводка ранней части диалога (app/summaries.py): сообщения до covered_until включительно сжаты в summary,
+    в контекст LLM идут сводка и сообщения после covered_until.
+    """
+    __tablename__ = "dialog_summaries"
+
+    user_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    dialog_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+    covered_until: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    covered_messages: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
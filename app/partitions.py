@@ -0,0 +1,162 @@
+"""
+Секции таблицы messages (RANGE по created_at, по месяцам в UTC): создание будущих секций,
+срок хранения (старые секции отсоединяются для архивации или удаляются) и условия выборки,
+при которых PostgreSQL отсекает лишние секции.
+
+Обслуживание — фоновая задача воркера (PARTITION_MAINTENANCE_INTERVAL); при нескольких воркерах
+её в каждый момент выполняет один (advisory-блокировка). Новая секция создаётся через
+CREATE TABLE + перенос строк её месяца из messages_default + ATTACH PARTITION: так она подключается,
+даже если задача опоздала и строки уже легли в секцию по умолчанию.
+"""
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import DateTime, cast, func, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import session_scope
+from app.models import ChatSession, Message
+
+logger = logging.getLogger(__name__)
+
+_MAINTENANCE_LOCK_KEY = 0x50415254  # "PART"
+_PARTITION_RE = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+_LIST_PARTITIONS = text(
+    """
+    SELECT c.relname FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relname = 'messages'
+    """
+)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"messages_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> date | None:
+    match = _PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _bound(month: date) -> str:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc).isoformat()
+
+
+def dialog_filter(user_id: str, dialog_id: str) -> tuple:
+    """
+    Условия выборки сообщений одного диалога с нижней границей created_at = sessions.first_at.
+    Граница известна только при выполнении (подзапрос), и PostgreSQL отсекает секции до начала диалога
+    на этапе исполнения; без строки в sessions граница — -infinity (все секции).
+    """
+    first_at = select(ChatSession.first_at).where(
+        ChatSession.user_id == user_id,
+        ChatSession.dialog_id == dialog_id,
+    ).scalar_subquery()
+    return (
+        Message.user_id == user_id,
+        Message.dialog_id == dialog_id,
+        Message.created_at >= func.coalesce(first_at, cast(literal("-infinity"), DateTime(timezone=True))),
+    )
+
+
+async def list_partitions(session: AsyncSession) -> dict[date, str]:
+    """Месячные секции messages: месяц -> имя таблицы (секция по умолчанию не входит)."""
+    names = (await session.execute(_LIST_PARTITIONS)).scalars().all()
+    return {month: name for name in names if (month := partition_month(name)) is not None}
+
+
+async def create_partition(session: AsyncSession, month: date) -> None:
+    """Создаёт секцию месяца и переносит в неё строки этого месяца из messages_default."""
+    name = partition_name(month)
+    start, end = _bound(month), _bound(add_months(month, 1))
+    await session.execute(
+        text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)")
+    )
+    # search_vector — вычисляемая колонка, при переносе она пересчитывается
+    await session.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM messages_default WHERE created_at >= :start AND created_at < :end
+                RETURNING id, user_id, dialog_id, role, content, created_at
+            )
+            INSERT INTO {name} (id, user_id, dialog_id, role, content, created_at) SELECT * FROM moved
+            """
+        ),
+        {"start": datetime.fromisoformat(start), "end": datetime.fromisoformat(end)},
+    )
+    await session.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+
+async def apply_retention(session: AsyncSession, partitions: dict[date, str], cutoff: date, mode: str) -> list[str]:
+    """
+    Секции целиком старше cutoff отсоединяются (detach — остаются отдельными таблицами для архивации)
+    или удаляются (drop). Сессии, последнее сообщение которых старше cutoff, удаляются из sessions.
+    """
+    expired = [name for month, name in sorted(partitions.items()) if add_months(month, 1) <= cutoff]
+    for name in expired:
+        if mode == "drop":
+            await session.execute(text(f"DROP TABLE {name}"))
+        else:
+            await session.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+    if expired:
+        await session.execute(
+            ChatSession.__table__.delete().where(
+                ChatSession.last_at < datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc)
+            )
+        )
+    return expired
+
+
+async def maintain_partitions(session: AsyncSession, today: date | None = None) -> tuple[list[str], list[str]]:
+    """Создаёт секции до PARTITION_MONTHS_AHEAD месяцев вперёд и применяет срок хранения. (созданные, снятые)"""
+    settings = get_settings()
+    locked = (
+        await session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _MAINTENANCE_LOCK_KEY})
+    ).scalar()
+    if not locked:
+        return [], []
+    current = month_start(today or datetime.now(timezone.utc).date())
+    partitions = await list_partitions(session)
+    created = []
+    for offset in range(settings.PARTITION_MONTHS_AHEAD + 1):
+        month = add_months(current, offset)
+        if month not in partitions:
+            await create_partition(session, month)
+            partitions[month] = partition_name(month)
+            created.append(partition_name(month))
+    removed: list[str] = []
+    if settings.PARTITION_RETENTION_MONTHS > 0:
+        cutoff = add_months(current, -settings.PARTITION_RETENTION_MONTHS)
+        removed = await apply_retention(session, partitions, cutoff, settings.PARTITION_RETENTION_MODE)
+    return created, removed
+
+
+async def run_partition_maintenance() -> None:
+    """Фоновая задача (из lifespan): периодически ведёт секции messages."""
+    settings = get_settings()
+    while True:
+        try:
+            async with session_scope() as session:
+                created, removed = await maintain_partitions(session)
+            if created or removed:
+                logger.info("Секции messages: созданы %s, сняты по сроку хранения (%s) %s",
+                            created, settings.PARTITION_RETENTION_MODE, removed)
+        except Exception:
+            logger.exception("Ошибка обслуживания секций messages")
+        await asyncio.sleep(settings.PARTITION_MAINTENANCE_INTERVAL)
@@ -0,0 +1,214 @@
+"""
+Сохранение сообщений чата: сразу в транзакции хода (PERSIST_MODE=sync) или через очередь
+write-behind (PERSIST_MODE=write_behind), которая пишет пачками многострочным INSERT.
+
+write-behind: сообщения и лиды ставятся в asyncio-очередь процесса и сбрасываются в БД одной
+транзакцией по достижении PERSIST_BATCH_SIZE или по таймеру PERSIST_FLUSH_INTERVAL_MS. Каждый лид
+сохраняется в своей точке сохранения: ошибка лида не откатывает сообщения пачки. Если пачка не записалась,
+история её диалогов сбрасывается в кэше воркера (туда сообщения попали до записи).
+PERSIST_WAIT_FOR_FLUSH=true — запрос ждёт коммита своей пачки (групповой коммит: надёжность как
+у sync, но меньше транзакций); false — не ждёт (минимальная задержка, при падении процесса
+несброшенная очередь теряется). При остановке приложения очередь дописывается полностью.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import session_scope
+from app.history_cache import get_history_cache
+from app.leads import save_lead_if_contact
+from app.models import ChatSession, Message
+from app.pubsub import publish_dialogs
+
+logger = logging.getLogger(__name__)
+
+
+def message_row(user_id: str, dialog_id: str, role: str, content: str) -> dict:
+    """
+    Строка для таблицы messages. created_at ставится в момент создания, а не коммита:
+    сообщения из одной пачки сохраняют порядок.
+    """
+    return {
+        "id": uuid4(),
+        "user_id": user_id,
+        "dialog_id": dialog_id,
+        "role": role,
+        "content": content,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+async def write_messages(session: AsyncSession, rows: list[dict]) -> None:
+    """
+    Вставляет сообщения одним многострочным INSERT и обновляет сводку сессий (таблица sessions)
+    в той же транзакции; другим воркерам после коммита уходит событие об изменении диалогов (app.pubsub).
+    """
+    if not rows:
+        return
+    await session.execute(insert(Message), rows)
+    await _touch_sessions(session, rows)
+    await publish_dialogs(session, [(row["user_id"], row["dialog_id"]) for row in rows])
+
+
+async def _touch_sessions(session: AsyncSession, rows: list[dict]) -> None:
+    """Upsert сводки по каждой затронутой сессии: границы по времени и счётчик сообщений."""
+    summary: dict[tuple[str, str], dict] = {}
+    for row in rows:
+        key = (row["user_id"], row["dialog_id"])
+        item = summary.get(key)
+        if item is None:
+            summary[key] = {
+                "user_id": row["user_id"],
+                "dialog_id": row["dialog_id"],
+                "first_at": row["created_at"],
+                "last_at": row["created_at"],
+                "message_count": 1,
+            }
+        else:
+            item["first_at"] = min(item["first_at"], row["created_at"])
+            item["last_at"] = max(item["last_at"], row["created_at"])
+            item["message_count"] += 1
+    # Единый порядок блокировки строк: параллельные пачки не взаимоблокируются
+    values = [summary[key] for key in sorted(summary)]
+    stmt = pg_insert(ChatSession).values(values)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ChatSession.user_id, ChatSession.dialog_id],
+            set_={
+                "first_at": func.least(ChatSession.first_at, stmt.excluded.first_at),
+                "last_at": func.greatest(ChatSession.last_at, stmt.excluded.last_at),
+                "message_count": ChatSession.message_count + stmt.excluded.message_count,
+            },
+        )
+    )
+
+
+@dataclass
+class _Item:
+    rows: list[dict]
+    # (user_id, dialog_id, текст сообщения пользователя) для извлечения контактов
+    lead: tuple[str, str, str] | None = None
+    done: asyncio.Future | None = field(default=None, repr=False)
+
+
+class MessageWriter:
+    def __init__(self, batch_size: int, flush_interval: float, wait_for_flush: bool, max_queue: int) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.wait_for_flush = wait_for_flush
+        self.batches = 0
+        self.rows_written = 0
+        self._queue: asyncio.Queue[_Item | None] = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает всё, что уже в очереди, и останавливает фоновую задачу."""
+        if self._task is None:
+            return
+        # Маркер конца: очередь FIFO, поэтому всё поставленное до него будет записано
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, rows: list[dict], lead: tuple[str, str, str] | None = None) -> None:
+        """Ставит сообщения (и лид) в очередь; при wait_for_flush ждёт коммита пачки."""
+        done = asyncio.get_running_loop().create_future() if self.wait_for_flush else None
+        await self._queue.put(_Item(rows, lead, done))
+        if done is not None:
+            await done
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[_Item]) -> None:
+        rows = [row for item in batch for row in item.rows]
+        try:
+            async with session_scope() as session:
+                await write_messages(session, rows)
+                for item in batch:
+                    if item.lead is not None:
+                        await self._save_lead(session, item.lead)
+        except Exception as e:
+            logger.exception("Не удалось сохранить пачку сообщений (%d строк)", len(rows))
+            cache = get_history_cache()
+            if cache is not None:
+                for key in {(row["user_id"], row["dialog_id"]) for row in rows}:
+                    cache.invalidate(key)
+            for item in batch:
+                if item.done is not None and not item.done.done():
+                    item.done.set_exception(e)
+            return
+        self.batches += 1
+        self.rows_written += len(rows)
+        for item in batch:
+            if item.done is not None and not item.done.done():
+                item.done.set_result(None)
+
+    @staticmethod
+    async def _save_lead(session: AsyncSession, lead: tuple[str, str, str]) -> None:
+        """Лид в точке сохранения (SAVEPOINT): при ошибке откатывается только он."""
+        try:
+            async with session.begin_nested():
+                await save_lead_if_contact(session, *lead)
+        except Exception:
+            logger.exception("Не удалось сохранить лид (user_id=%s, dialog_id=%s)", lead[0], lead[1])
+
+
+_writer: MessageWriter | None = None
+
+
+def get_message_writer() -> MessageWriter | None:
+    """Очередь write-behind, если она запущена (PERSIST_MODE=write_behind), иначе None."""
+    return _writer
+
+
+async def start_message_writer() -> MessageWriter:
+    global _writer
+    if _writer is None:
+        settings = get_settings()
+        _writer = MessageWriter(
+            batch_size=settings.PERSIST_BATCH_SIZE,
+            flush_interval=settings.PERSIST_FLUSH_INTERVAL_MS / 1000,
+            wait_for_flush=settings.PERSIST_WAIT_FOR_FLUSH,
+            max_queue=settings.PERSIST_QUEUE_MAX,
+        )
+        _writer.start()
+    return _writer
+
+
+async def stop_message_writer() -> None:
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        await writer.stop()
@@ -0,0 +1,110 @@
+"""
+Хранилище системных промптов: файл читается один раз и держится в памяти процесса.
+Изменения подхватываются без перезапуска — по mtime (не чаще PROMPT_RELOAD_INTERVAL)
+или, при PROMPT_WATCH, по событиям inotify через watchfiles (тогда проверок mtime на запросе нет вовсе).
+О смене текста промпта сообщается подписчикам (add_listener) — например, кэшу ответов.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from app.config import get_settings
+from app.llm import load_system_prompt
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CachedPrompt:
+    text: str
+    mtime_ns: int
+    size: int
+    checked_at: float
+
+
+class PromptStore:
+    def __init__(self, reload_interval: float) -> None:
+        self.reload_interval = reload_interval
+        self.watching = False
+        self._entries: dict[Path, _CachedPrompt] = {}
+        # Текст сброшенных записей — чтобы при перечитывании понять, изменился ли промпт
+        self._replaced: dict[Path, str] = {}
+        self._listeners: list[Callable[[Path, str], None]] = []
+
+    def add_listener(self, callback: Callable[[Path, str], None]) -> None:
+        """callback(path, old_text) вызывается, когда перечитанный промпт отличается от прежнего."""
+        self._listeners.append(callback)
+
+    def get(self, path: Path) -> str:
+        """
+        Текст промпта из памяти; файл перечитывается, только если изменился.
+        Если файла нет — FileNotFoundError (отсутствие не кэшируется).
+        """
+        entry = self._entries.get(path)
+        now = time.monotonic()
+        if entry is not None and (self.watching or now - entry.checked_at < self.reload_interval):
+            return entry.text
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._entries.pop(path, None)
+            raise FileNotFoundError(f"Файл промпта не найден: {path}")
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            entry.checked_at = now
+            return entry.text
+        text = load_system_prompt(path)
+        self._entries[path] = _CachedPrompt(text, st.st_mtime_ns, st.st_size, now)
+        old_text = entry.text if entry is not None else self._replaced.pop(path, None)
+        if old_text is not None:
+            logger.info("Промпт перечитан: %s", path)
+            if old_text != text:
+                for callback in self._listeners:
+                    callback(path, old_text)
+        return text
+
+    def invalidate(self, path: Path | None = None) -> None:
+        """Сбрасывает кэш одного файла (или всех) — следующий get перечитает его с диска."""
+        paths = list(self._entries) if path is None else [path]
+        for p in paths:
+            entry = self._entries.pop(p, None)
+            if entry is not None:
+                self._replaced[p] = entry.text
+
+    async def watch(self, paths: list[Path]) -> None:
+        """
+        Следит за каталогами промптов через watchfiles (inotify) и сбрасывает изменённые файлы.
+        Без установленного watchfiles остаётся проверка по mtime.
+        """
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            logger.warning("watchfiles не установлен, промпты перечитываются по mtime")
+            return
+        dirs = sorted({str(p.parent) for p in paths if p.parent.exists()})
+        if not dirs:
+            return
+        self.watching = True
+        try:
+            async for changes in awatch(*dirs):
+                for _, changed in changes:
+                    self.invalidate(Path(changed))
+        finally:
+            self.watching = False
+
+
+_store: PromptStore | None = None
+
+
+def get_prompt_store() -> PromptStore:
+    global _store
+    if _store is None:
+        _store = PromptStore(get_settings().PROMPT_RELOAD_INTERVAL)
+    return _store
+
+
+def get_system_prompt(dialog_id: str | None = None) -> str:
+    """Системный промпт для диалога (по префиксу dialog_id или промпт по умолчанию)."""
+    return get_prompt_store().get(get_settings().prompt_path_for(dialog_id))
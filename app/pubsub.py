@@ -0,0 +1,209 @@
+"""
+Согласование кэшей между воркерами и узлами через PostgreSQL LISTEN/NOTIFY.
+
+Писатели вызывают publish() в своей транзакции (pg_notify): событие уходит подписчикам только после
+коммита и пропадает при откате. Каждый воркер держит одно отдельное соединение asyncpg с LISTEN
+(задача из lifespan) и по событиям других воркеров сбрасывает свои кэши: историю диалога и кэш ответов.
+Свои события (тот же origin) пропускаются — локальный кэш уже обновлён сквозной записью.
+После потери соединения уведомления за время разрыва не восстановить, поэтому при переподключении
+кэши сбрасываются целиком.
+
+События (JSON): {"origin": ..., "kind": "dialog", "keys": [[user_id, dialog_id], ...]},
+{"kind": "lead", "user_id", "dialog_id"}, {"kind": "response_cache", "prompt_hash": str | null}.
+Размер NOTIFY ограничен 8000 байт — длинные списки ключей делятся на части.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Callable
+from uuid import uuid4
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import session_scope
+from app.history_cache import get_history_cache
+from app.metrics import Counter, metrics_enabled
+from app.response_cache import get_response_cache
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_EVENTS = Counter(
+    "pubsub_events_total",
+    "События согласования кэшей: sent — отправлено, received — получено от других воркеров",
+    ("kind", "direction"),
+)
+PUBSUB_RECONNECTS = Counter("pubsub_reconnects_total", "Переподключений слушателя LISTEN (кэши сброшены целиком)")
+
+# Идентификатор процесса: свои уведомления слушатель пропускает
+WORKER_ID = uuid4().hex
+# Предел полезной нагрузки NOTIFY — 8000 байт; ключи диалогов набираются в событие с запасом на служебные поля
+_MAX_KEYS_BYTES = 7000
+_RECONNECT_DELAY = 1.0
+_RECONNECT_DELAY_MAX = 30.0
+
+_NOTIFY = text("SELECT pg_notify(:channel, :payload)")
+
+Handler = Callable[[dict[str, Any]], None]
+_handlers: dict[str, list[Handler]] = defaultdict(list)
+_resync_handlers: list[Callable[[], None]] = []
+
+
+def subscribe(kind: str, handler: Handler) -> None:
+    """handler(event) вызывается на событие kind от другого воркера."""
+    _handlers[kind].append(handler)
+
+
+def on_resync(handler: Callable[[], None]) -> None:
+    """handler() вызывается после (пере)подключения слушателя — события за время разрыва потеряны."""
+    _resync_handlers.append(handler)
+
+
+def _payload(kind: str, data: dict[str, Any]) -> str:
+    return json.dumps({"origin": WORKER_ID, "kind": kind, **data}, ensure_ascii=False, separators=(",", ":"))
+
+
+async def publish(session: AsyncSession, kind: str, **data: Any) -> None:
+    """Событие в транзакции session: доставляется после её коммита. Без PUBSUB_ENABLED ничего не делает."""
+    settings = get_settings()
+    if not settings.PUBSUB_ENABLED:
+        return
+    await session.execute(_NOTIFY, {"channel": settings.PUBSUB_CHANNEL, "payload": _payload(kind, data)})
+    if metrics_enabled():
+        PUBSUB_EVENTS.inc(kind=kind, direction="sent")
+
+
+async def publish_dialogs(session: AsyncSession, keys: list[tuple[str, str]]) -> None:
+    """Сообщает об изменении истории диалогов (новые сообщения, сводка)."""
+    if not get_settings().PUBSUB_ENABLED:
+        return
+    chunk: list[tuple[str, str]] = []
+    size = 0
+    for key in sorted(set(keys)):
+        key_size = len(json.dumps(key, ensure_ascii=False).encode("utf-8")) + 1
+        if chunk and size + key_size > _MAX_KEYS_BYTES:
+            await publish(session, "dialog", keys=chunk)
+            chunk, size = [], 0
+        chunk.append(key)
+        size += key_size
+    if chunk:
+        await publish(session, "dialog", keys=chunk)
+
+
+async def publish_now(kind: str, **data: Any) -> None:
+    """Событие в отдельной короткой транзакции (вне записи данных, например сброс кэша ответов)."""
+    if not get_settings().PUBSUB_ENABLED:
+        return
+    async with session_scope() as session:
+        await publish(session, kind, **data)
+
+
+def dispatch(payload: str) -> None:
+    """Разбирает уведомление и вызывает подписчиков; свои события и мусор пропускаются."""
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        logger.warning("Некорректное уведомление pub/sub: %.200s", payload)
+        return
+    if event.get("origin") == WORKER_ID:
+        return
+    kind = event.get("kind", "")
+    if metrics_enabled():
+        PUBSUB_EVENTS.inc(kind=kind, direction="received")
+    for handler in _handlers.get(kind, ()):
+        try:
+            handler(event)
+        except Exception:
+            logger.exception("Ошибка обработчика события %s", kind)
+
+
+def _resync() -> None:
+    for handler in _resync_handlers:
+        try:
+            handler()
+        except Exception:
+            logger.exception("Ошибка сброса кэша после переподключения pub/sub")
+
+
+async def _connect() -> asyncpg.Connection:
+    settings = get_settings()
+    return await asyncpg.connect(
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        database=settings.POSTGRES_DB,
+    )
+
+
+async def run_listener() -> None:
+    """
+    Фоновая задача lifespan: LISTEN на PUBSUB_CHANNEL с переподключением (пауза растёт до 30 с).
+    Соединение отдельное от пула SQLAlchemy — LISTEN держит его всё время работы воркера.
+    """
+    channel = get_settings().PUBSUB_CHANNEL
+    delay = _RECONNECT_DELAY
+    connected_before = False
+    while True:
+        try:
+            conn = await _connect()
+        except (OSError, asyncpg.PostgresError) as e:
+            logger.warning("pub/sub: нет соединения с PostgreSQL (%s), повтор через %.0f с", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _RECONNECT_DELAY_MAX)
+            continue
+        lost = asyncio.get_running_loop().create_future()
+
+        def on_terminate(_conn) -> None:
+            if not lost.done():
+                lost.set_result(None)
+
+        try:
+            conn.add_termination_listener(on_terminate)
+            await conn.add_listener(channel, lambda _conn, _pid, _channel, payload: dispatch(payload))
+            delay = _RECONNECT_DELAY
+            # Пока слушателя не было, чужие изменения могли пройти мимо — локальные кэши не доверяем
+            _resync()
+            if connected_before and metrics_enabled():
+                PUBSUB_RECONNECTS.inc()
+            connected_before = True
+            await lost
+            logger.warning("pub/sub: соединение LISTEN потеряно, переподключение")
+        except (OSError, asyncpg.PostgresError) as e:
+            logger.warning("pub/sub: ошибка соединения LISTEN (%s)", e)
+            await asyncio.sleep(delay)
+        finally:
+            if not conn.is_closed():
+                await conn.close()
+
+
+def _on_dialog(event: dict[str, Any]) -> None:
+    cache = get_history_cache()
+    if cache is not None:
+        for user_id, dialog_id in event.get("keys", ()):
+            cache.invalidate((user_id, dialog_id))
+
+
+def _on_response_cache(event: dict[str, Any]) -> None:
+    cache = get_response_cache()
+    if cache is not None:
+        cache.forget(event.get("prompt_hash"))
+
+
+def _clear_local_caches() -> None:
+    history = get_history_cache()
+    if history is not None:
+        history.clear()
+    responses = get_response_cache()
+    if responses is not None:
+        responses.forget(None)
+
+
+# История не дописывается по событию, а сбрасывается: воркер мог уже прочитать это сообщение из БД,
+# и дописывание дало бы дубль; следующий ход перечитает хвост одним запросом
+subscribe("dialog", _on_dialog)
+subscribe("response_cache", _on_response_cache)
+on_resync(_clear_local_caches)
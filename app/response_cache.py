@@ -0,0 +1,195 @@
+"""
+Кэш ответов LLM на повторяющиеся первые вопросы диалога (цены, контакты и т.п.).
+Ключ — модель, temperature, хеш системного промпта и нормализованная история с новым сообщением.
+Два уровня: LRU в памяти воркера и таблица response_cache в PostgreSQL (общая для воркеров), оба с TTL.
+При смене текста промпта записи со старым хешем удаляются (подписка на PromptStore).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import get_settings
+from app.database import session_scope
+from app.metrics import Counter, metrics_enabled
+from app.models import ResponseCacheEntry
+from app.prompts import get_prompt_store
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total",
+    "Поиски в кэше ответов: hit_memory, hit_db, miss",
+    ("result",),
+)
+
+_WORD_RE = re.compile(r"\S+\s*|\s+")
+# Истёкшие строки таблицы удаляются попутно, раз в столько записей
+_PURGE_EVERY_PUTS = 100
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def _normalize(content: str) -> str:
+    """Регистр и пробелы не влияют на ключ: «Сколько стоит?» и «сколько  стоит?» — один вопрос."""
+    return " ".join(content.split()).casefold()
+
+
+def cache_key(model: str, temperature: float, system_prompt_hash: str, messages: list[dict[str, str]]) -> str:
+    payload = json.dumps(
+        [model, temperature, system_prompt_hash, [(m["role"], _normalize(m["content"])) for m in messages]],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def replay_chunks(reply: str, chunk_chars: int) -> AsyncIterator[str]:
+    """
+    Сохранённый ответ фрагментами по границам слов (около chunk_chars символов), как при стриминге LLM;
+    между фрагментами управление отдаётся циклу событий.
+    """
+    buffer = ""
+    for word in _WORD_RE.findall(reply):
+        buffer += word
+        if len(buffer) >= chunk_chars:
+            yield buffer
+            buffer = ""
+            await asyncio.sleep(0)
+    if buffer:
+        yield buffer
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl: float, use_db: bool) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_db = use_db
+        # key -> (prompt_hash, reply, expires_at по time.monotonic)
+        self._entries: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self._puts = 0
+
+    async def get(self, key: str) -> str | None:
+        """Ответ из памяти, затем из БД (с подъёмом в память); None — промах или запись истекла."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[2] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count("hit_memory")
+                return entry[1]
+            del self._entries[key]
+        if self.use_db:
+            async with session_scope() as session:
+                row = (
+                    await session.execute(
+                        select(ResponseCacheEntry.prompt_hash, ResponseCacheEntry.reply, ResponseCacheEntry.expires_at)
+                        .where(ResponseCacheEntry.key == key, ResponseCacheEntry.expires_at > datetime.now(timezone.utc))
+                    )
+                ).first()
+            if row is not None:
+                left = (row.expires_at - datetime.now(timezone.utc)).total_seconds()
+                self._remember(key, row.prompt_hash, row.reply, left)
+                self._count("hit_db")
+                return row.reply
+        self._count("miss")
+        return None
+
+    async def put(self, key: str, system_prompt_hash: str, reply: str) -> None:
+        self._remember(key, system_prompt_hash, reply, self.ttl)
+        if not self.use_db:
+            return
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        stmt = pg_insert(ResponseCacheEntry).values(
+            key=key, prompt_hash=system_prompt_hash, reply=reply, expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ResponseCacheEntry.key],
+            set_={"prompt_hash": stmt.excluded.prompt_hash, "reply": stmt.excluded.reply, "expires_at": expires_at},
+        )
+        self._puts += 1
+        async with session_scope() as session:
+            await session.execute(stmt)
+            if self._puts % _PURGE_EVERY_PUTS == 0:
+                await session.execute(
+                    delete(ResponseCacheEntry).where(ResponseCacheEntry.expires_at <= datetime.now(timezone.utc))
+                )
+
+    def _remember(self, key: str, system_prompt_hash: str, reply: str, ttl: float) -> None:
+        self._entries[key] = (system_prompt_hash, reply, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, system_prompt_hash: str | None = None) -> None:
+        """Удаляет записи для промпта с данным хешем (None — все записи) в памяти и в БД."""
+        self.forget(system_prompt_hash)
+        if self.use_db:
+            await self._delete_rows(system_prompt_hash)
+
+    def forget(self, system_prompt_hash: str | None) -> None:
+        """Удаляет записи только из памяти этого воркера (None — все)."""
+        if system_prompt_hash is None:
+            self._entries.clear()
+            return
+        for key in [k for k, v in self._entries.items() if v[0] == system_prompt_hash]:
+            del self._entries[key]
+
+    async def _delete_rows(self, system_prompt_hash: str | None) -> None:
+        stmt = delete(ResponseCacheEntry)
+        if system_prompt_hash is not None:
+            stmt = stmt.where(ResponseCacheEntry.prompt_hash == system_prompt_hash)
+        async with session_scope() as session:
+            await session.execute(stmt)
+
+    def on_prompt_changed(self, path: Path, old_text: str) -> None:
+        """
+        Подписчик PromptStore. Ключ и так включает хеш промпта, поэтому старые ответы не отдаются;
+        здесь они удаляются, чтобы не занимать память и таблицу до истечения TTL.
+        """
+        old_hash = prompt_hash(old_text)
+        logger.info("Промпт %s изменён, кэш ответов для него сброшен", path)
+        self.forget(old_hash)
+        if self.use_db:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            task = loop.create_task(self._delete_rows(old_hash))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _count(result: str) -> None:
+        if metrics_enabled():
+            RESPONSE_CACHE_LOOKUPS.inc(result=result)
+
+
+_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Кэш ответов процесса; None, если он отключён (RESPONSE_CACHE_ENABLED=false)."""
+    global _cache
+    settings = get_settings()
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            settings.RESPONSE_CACHE_MAX_ENTRIES,
+            settings.RESPONSE_CACHE_TTL,
+            settings.RESPONSE_CACHE_DB,
+        )
+        get_prompt_store().add_listener(_cache.on_prompt_changed)
+    return _cache
@@ -1,14 +1,33 @@
 """
-Админ API: список сессий, история чата по сессии, список лидов, агрегация по дате.
+Админ API: список сессий, история чата по сессии, список лидов, агрегация по дате, поиск по переписке,
+выгрузка.
 Доступ по заголовку X-Admin-Key (значение из .env ADMIN_KEY).
+Списки постраничные (keyset): параметры limit и after, курсор следующей страницы — в заголовке
+X-Next-Cursor (нет заголовка — последняя страница). Выгрузка (NDJSON/CSV) читает БД курсором
+на стороне сервера и отдаётся потоком с постоянным расходом памяти.
 """
-from fastapi import APIRouter, Depends, Header, HTTPException
-from sqlalchemy import cast, select, func
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import AsyncIterator, Literal
+from uuid import UUID
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import get_settings
-from app.database import get_db
-from app.models import Lead, Message
+from app.database import get_db, session_scope
+from app.models import ChatSession, Lead, Message
+from app.partitions import dialog_filter
+from app.pubsub import publish_now
+from app.response_cache import get_response_cache
+from app.search import Order, cursor_key, cursor_types, search_messages, snippet_html
+from app.stats import get_stats
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -20,21 +39,71 @@ def _require_admin_key(x_admin_key: str | None = Header(None, alias="X-Admin-Key
     return x_admin_key
 
 
+def _encode_cursor(*values) -> str:
+    """Курсор keyset-пагинации: значения ключа сортировки последней строки страницы."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str, *types: type) -> tuple:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if len(raw) != len(types):
+            raise ValueError
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for t, v in zip(types, raw))
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+def _page_limit(limit: int | None) -> int:
+    settings = get_settings()
+    return min(limit or settings.ADMIN_PAGE_SIZE, settings.ADMIN_PAGE_SIZE_MAX)
+
+
+def _set_next_cursor(response: Response, rows: list, limit: int, *key) -> None:
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(*key)
+
+
+def _iso(value: datetime | None) -> str | None:
+    return value.isoformat() if value else None
+
+
 @router.get("/sessions")
 async def list_sessions(
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    after: str | None = None,
     _: str = Depends(_require_admin_key),
     db: AsyncSession = Depends(get_db),
 ):
-    """Список сессий: пары (user_id, dialog_id) с датой последнего сообщения."""
+    """
+    Список сессий: пары (user_id, dialog_id) с датой последнего сообщения, новые первыми.
+    Читается из сводной таблицы sessions по индексу ix_sessions_last_at.
+    """
+    limit = _page_limit(limit)
     q = (
-        select(Message.user_id, Message.dialog_id, func.max(Message.created_at).label("last_at"))
-        .group_by(Message.user_id, Message.dialog_id)
-        .order_by(func.max(Message.created_at).desc())
+        select(ChatSession)
+        .order_by(ChatSession.last_at.desc(), ChatSession.user_id.desc(), ChatSession.dialog_id.desc())
+        .limit(limit)
     )
-    result = await db.execute(q)
-    rows = result.all()
+    if after:
+        q = q.where(
+            tuple_(ChatSession.last_at, ChatSession.user_id, ChatSession.dialog_id)
+            < _decode_cursor(after, datetime, str, str)
+        )
+    rows = (await db.execute(q)).scalars().all()
+    if rows:
+        _set_next_cursor(response, rows, limit, rows[-1].last_at, rows[-1].user_id, rows[-1].dialog_id)
     return [
-        {"user_id": r.user_id, "dialog_id": r.dialog_id, "last_at": r.last_at.isoformat() if r.last_at else None}
+        {
+            "user_id": r.user_id,
+            "dialog_id": r.dialog_id,
+            "first_at": _iso(r.first_at),
+            "last_at": _iso(r.last_at),
+            "message_count": r.message_count,
+            "has_lead": r.has_lead,
+        }
         for r in rows
     ]
 
@@ -43,66 +112,206 @@ async def list_sessions(
 async def get_session_messages(
     user_id: str,
     dialog_id: str,
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    after: str | None = None,
     _: str = Depends(_require_admin_key),
     db: AsyncSession = Depends(get_db),
 ):
-    """История чата по сессии (user_id + dialog_id)."""
+    """История чата по сессии (user_id + dialog_id) в хронологическом порядке."""
+    limit = _page_limit(limit)
     q = (
-        select(Message.role, Message.content, Message.created_at)
-        .where(Message.user_id == user_id, Message.dialog_id == dialog_id)
-        .order_by(Message.created_at)
+        select(Message.id, Message.role, Message.content, Message.created_at)
+        .where(*dialog_filter(user_id, dialog_id))
+        .order_by(Message.created_at, Message.id)
+        .limit(limit)
+    )
+    if after:
+        q = q.where(tuple_(Message.created_at, Message.id) > _decode_cursor(after, datetime, UUID))
+    rows = (await db.execute(q)).all()
+    if rows:
+        _set_next_cursor(response, rows, limit, rows[-1].created_at, rows[-1].id)
+    return [
+        {"role": r.role, "content": r.content, "created_at": _iso(r.created_at)}
+        for r in rows
+    ]
+
+
+@router.get("/search")
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500),
+    order: Order = "rank",
+    limit: int | None = Query(None, ge=1),
+    after: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    role: Literal["user", "assistant"] | None = None,
+    user_id: str | None = None,
+    dialog_id: str | None = None,
+    _: str = Depends(_require_admin_key),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Полнотекстовый поиск по сообщениям (app.search): q в синтаксисе веб-поиска, сортировка по релевантности
+    (order=rank) или новые первыми (order=recent). Фильтры: даты date_from..date_to (дни в STATS_TIMEZONE;
+    без date_from — последние SEARCH_DEFAULT_DAYS дней), роль, user_id, dialog_id.
+    snippet — HTML: экранированные фрагменты текста, совпадения в <mark>…</mark>.
+    """
+    limit = _page_limit(limit)
+    cursor = _decode_cursor(after, *cursor_types(order)) if after else None
+    query = search_messages(
+        q, limit, order=order, after=cursor, date_from=date_from, date_to=date_to,
+        role=role, user_id=user_id, dialog_id=dialog_id,
     )
-    result = await db.execute(q)
-    rows = result.all()
+    rows = (await db.execute(query)).all()
+    if rows:
+        _set_next_cursor(response, rows, limit, *cursor_key(rows[-1], order))
     return [
-        {"role": r.role, "content": r.content, "created_at": r.created_at.isoformat() if r.created_at else None}
+        {
+            "id": str(r.id),
+            "user_id": r.user_id,
+            "dialog_id": r.dialog_id,
+            "role": r.role,
+            "created_at": _iso(r.created_at),
+            "rank": r.rank,
+            "snippet": snippet_html(r.snippet),
+        }
         for r in rows
     ]
 
 
 @router.get("/stats")
 async def list_stats(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    tz: str | None = None,
     _: str = Depends(_require_admin_key),
     db: AsyncSession = Depends(get_db),
 ):
-    """Агрегация по дате: дата, количество уникальных пользователей, количество сессий (диалогов)."""
-    from sqlalchemy import Date
-    day_col = cast(Message.created_at, Date)
-    subq = (
-        select(Message.user_id, Message.dialog_id, day_col.label("day"))
-        .where(Message.created_at.isnot(None))
-        .group_by(Message.user_id, Message.dialog_id, day_col)
-    ).subquery()
-    q = (
-        select(subq.c.day, func.count(subq.c.user_id).label("sessions"), func.count(func.distinct(subq.c.user_id)).label("unique_users"))
-        .group_by(subq.c.day)
-        .order_by(subq.c.day.desc())
-    )
-    result = await db.execute(q)
-    rows = result.all()
+    """
+    Агрегация по дате: дата, количество уникальных пользователей, количество сессий (диалогов), сообщений.
+    Необязательно: диапазон дат date_from..date_to и часовой пояс tz (по умолчанию STATS_TIMEZONE).
+    """
+    tz = tz or get_settings().STATS_TIMEZONE
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Неизвестный часовой пояс")
+    rows = await get_stats(db, tz, date_from, date_to)
     return [
-        {"day": r.day.isoformat() if r.day else None, "sessions": r.sessions, "unique_users": r.unique_users}
+        {"day": r["day"].isoformat(), "sessions": r["sessions"], "unique_users": r["unique_users"], "messages": r["messages"]}
         for r in rows
     ]
 
 
+@router.delete("/response-cache", status_code=204)
+async def clear_response_cache(_: str = Depends(_require_admin_key)):
+    """
+    Сбрасывает кэш ответов LLM (память этого воркера, общую таблицу и, через app.pubsub, память остальных
+    воркеров); 404, если кэш выключен.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Кэш ответов выключен")
+    await cache.invalidate()
+    await publish_now("response_cache", prompt_hash=None)
+    return Response(status_code=204)
+
+
+def _lead_dict(l: Lead) -> dict:
+    return {
+        "id": str(l.id),
+        "user_id": l.user_id,
+        "dialog_id": l.dialog_id,
+        "contact_text": l.contact_text,
+        "created_at": _iso(l.created_at),
+        "updated_at": _iso(l.updated_at),
+    }
+
+
 @router.get("/leads")
 async def list_leads(
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    after: str | None = None,
     _: str = Depends(_require_admin_key),
     db: AsyncSession = Depends(get_db),
 ):
-    """Список лидов (контакты для обратной связи)."""
-    q = select(Lead).order_by(Lead.created_at.desc())
-    result = await db.execute(q)
-    leads = result.scalars().all()
-    return [
-        {
-            "id": str(l.id),
-            "user_id": l.user_id,
-            "dialog_id": l.dialog_id,
-            "contact_text": l.contact_text,
-            "created_at": l.created_at.isoformat() if l.created_at else None,
-            "updated_at": l.updated_at.isoformat() if getattr(l, "updated_at", None) else None,
-        }
-        for l in leads
-    ]
+    """Список лидов (контакты для обратной связи), новые первыми."""
+    limit = _page_limit(limit)
+    q = select(Lead).order_by(Lead.created_at.desc(), Lead.id.desc()).limit(limit)
+    if after:
+        q = q.where(tuple_(Lead.created_at, Lead.id) < _decode_cursor(after, datetime, UUID))
+    leads = (await db.execute(q)).scalars().all()
+    if leads:
+        _set_next_cursor(response, leads, limit, leads[-1].created_at, leads[-1].id)
+    return [_lead_dict(l) for l in leads]
+
+
+async def _export_rows(query, fields: list[str], fmt: str) -> AsyncIterator[bytes]:
+    """
+    Построчная выгрузка через серверный курсор (stream + yield_per): в памяти только текущая пачка строк.
+    Сессия открывается внутри генератора и живёт столько же, сколько поток ответа.
+    """
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields) if fmt == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+        yield buf.getvalue().encode("utf-8")
+    batch_size = get_settings().ADMIN_EXPORT_BATCH_SIZE
+    async with session_scope() as session:
+        result = await session.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            buf.seek(0)
+            buf.truncate()
+            for row in partition:
+                item = {f: _iso(v) if isinstance(v, datetime) else (str(v) if isinstance(v, UUID) else v)
+                        for f, v in zip(fields, row)}
+                if writer is not None:
+                    writer.writerow(item)
+                else:
+                    buf.write(json.dumps(item, ensure_ascii=False))
+                    buf.write("\n")
+            yield buf.getvalue().encode("utf-8")
+
+
+def _export_response(query, fields: list[str], fmt: str, name: str) -> StreamingResponse:
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(query, fields, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{"csv" if fmt == "csv" else "ndjson"}"'},
+    )
+
+
+@router.get("/export/leads")
+async def export_leads(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    _: str = Depends(_require_admin_key),
+):
+    """Выгрузка всех лидов (NDJSON или CSV) потоком."""
+    fields = ["id", "user_id", "dialog_id", "contact_text", "created_at", "updated_at"]
+    q = select(*(getattr(Lead, f) for f in fields)).order_by(Lead.created_at, Lead.id)
+    return _export_response(q, fields, format, "leads")
+
+
+@router.get("/export/messages")
+async def export_messages(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    user_id: str | None = None,
+    dialog_id: str | None = None,
+    _: str = Depends(_require_admin_key),
+):
+    """Выгрузка переписок (всех или по user_id / dialog_id) потоком, по сессиям в хронологическом порядке."""
+    fields = ["user_id", "dialog_id", "role", "content", "created_at"]
+    q = select(*(getattr(Message, f) for f in fields)).order_by(
+        Message.user_id, Message.dialog_id, Message.created_at, Message.id
+    )
+    if user_id is not None and dialog_id is not None:
+        q = q.where(*dialog_filter(user_id, dialog_id))
+    elif user_id is not None:
+        q = q.where(Message.user_id == user_id)
+    elif dialog_id is not None:
+        q = q.where(Message.dialog_id == dialog_id)
+    return _export_response(q, fields, format, "messages")
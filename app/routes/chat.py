@@ -1,101 +1,506 @@
 """
 POST /api/chat: приём сообщения, стриминг ответа LLM по SSE, сохранение в БД.
+GET /api/chat/{generation_id}/stream: продолжение оборванного ответа (при SSE_RESUME_ENABLED, app.generations).
+Длительность этапов хода и объём стрима отдаются в метриках (/metrics).
 """
-from typing import AsyncIterator
+import asyncio
+import logging
+import math
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, Callable
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from httpx import HTTPStatusError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.admission import AdmissionRejected, get_admission
 from app.config import get_settings
-from app.database import get_db
+from app.context import build_context_window, pinned_prefix, summary_message
+from app.database import session_scope
+from app.generations import Generation, GenerationRegistry, ReplayGap, get_generation_registry
+from app.history_cache import get_history_cache
 from app.leads import save_lead_if_contact
-from app.llm import load_system_prompt, stream_chat
+from app.llm import stream_chat
+from app.metrics import Counter, Histogram, metrics_enabled, observe_time
 from app.models import Message
+from app.partitions import dialog_filter
+from app.persistence import get_message_writer, message_row, write_messages
+from app.prompts import get_system_prompt
+from app.response_cache import cache_key, get_response_cache, prompt_hash, replay_chunks
 from app.schemas import ChatRequest
+from app.sse import SSE_DONE, coalesce, sse_event, stop_when
+from app.summaries import get_summarizer, load_summary
+from app.upstreams import NoUpstreamAvailable
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Длительность этапов хода чата: prompt, history, user_message, lead, reply_commit",
+    ("stage",),
+)
+CHAT_STREAM_BYTES = Counter("chat_stream_bytes_total", "Байт SSE, отданных клиентам")
+CHAT_CLIENT_DISCONNECTS = Counter(
+    "chat_client_disconnects_total",
+    "Стримов, прерванных отключением клиента (запрос к LLM отменён, частичный ответ не сохранён)",
+)
+CHAT_RESUMES = Counter(
+    "chat_stream_resumes_total",
+    "Переподключений к генерации по Last-Event-ID: resumed, not_found, gap",
+    ("result",),
+)
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
 
-def _sse_message(data: str) -> str:
-    """Формирует одну SSE-строку: data: <content>."""
-    return f"data: {data}\n\n"
+async def _wait_disconnect(request: Request) -> None:
+    """Завершается, когда клиент закрыл соединение (ASGI-сообщение http.disconnect)."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _load_history(
+    session: AsyncSession,
+    user_id: str,
+    dialog_id: str,
+    *,
+    limit: int,
+    pinned: int = 0,
+    after: datetime | None = None,
+) -> list[dict[str, str]]:
+    """
+    Читает из БД только нужную часть истории: последние limit сообщений (LIMIT по индексу
+    (user_id, dialog_id, created_at DESC)) и, если диалог длиннее, первые pinned сообщений.
+    Первые pinned элементов результата — всегда начало диалога. after — только сообщения позже
+    этого момента (часть диалога до него сжата в сводку). Секции messages до начала диалога не читаются.
+    """
+    base = select(Message.role, Message.content, Message.created_at).where(*dialog_filter(user_id, dialog_id))
+    if after is not None:
+        base = base.where(Message.created_at > after)
+    result = await session.execute(base.order_by(Message.created_at.desc()).limit(limit))
+    tail = list(reversed(result.all()))
+    head = []
+    if pinned > 0 and len(tail) == limit:
+        result = await session.execute(
+            base.where(Message.created_at < tail[0].created_at).order_by(Message.created_at).limit(pinned)
+        )
+        head = result.all()
+    return [{"role": row.role, "content": row.content} for row in (*head, *tail)]
+
+
+async def _dialog_history(session: AsyncSession, user_id: str, dialog_id: str) -> list[dict[str, str]]:
+    """
+    История user_id и dialog_id из кэша воркера или БД (без обрезки по бюджету). Если у диалога есть
+    сводка (app.summaries), история — сводка и сообщения после неё.
+    """
+    settings = get_settings()
+    cache = get_history_cache()
+    history = cache.get((user_id, dialog_id)) if cache is not None else None
+    if history is None:
+        version = cache.version if cache is not None else 0
+        summary = await load_summary(session, user_id, dialog_id) if settings.SUMMARY_ENABLED else None
+        history = await _load_history(
+            session,
+            user_id,
+            dialog_id,
+            limit=settings.HISTORY_MAX_MESSAGES,
+            pinned=settings.HISTORY_PINNED_MESSAGES if summary is None else 0,
+            after=summary.covered_until if summary is not None else None,
+        )
+        if summary is not None:
+            history = [summary_message(summary.summary), *history]
+        if cache is not None:
+            cache.put((user_id, dialog_id), history, since=version)
+    return history
+
+
+def _context_window(user_id: str, dialog_id: str, history: list[dict[str, str]]) -> list[dict[str, str]]:
+    """
+    Обрезает историю по бюджету токенов (роль + content); слишком длинная несжатая история
+    ставится в очередь на сжатие.
+    """
+    settings = get_settings()
+    summarizer = get_summarizer()
+    if summarizer is not None:
+        summarizer.maybe_schedule((user_id, dialog_id), history)
+    return build_context_window(
+        history,
+        settings.HISTORY_TOKEN_BUDGET,
+        pinned=pinned_prefix(history, settings.HISTORY_PINNED_MESSAGES),
+    )
 
 
 async def _get_history(session: AsyncSession, user_id: str, dialog_id: str) -> list[dict[str, str]]:
-    """Загружает историю сообщений для user_id и dialog_id из БД (роль + content)."""
-    result = await session.execute(
-        select(Message.role, Message.content).where(
-            Message.user_id == user_id,
-            Message.dialog_id == dialog_id,
-        ).order_by(Message.created_at)
+    """Загружает историю для user_id и dialog_id (из кэша воркера или БД) и обрезает её по бюджету токенов."""
+    return _context_window(user_id, dialog_id, await _dialog_history(session, user_id, dialog_id))
+
+
+def _cache_saved_messages(user_id: str, dialog_id: str, messages: list[dict[str, str]] | None) -> None:
+    """
+    Сквозная запись в кэш истории после коммита. messages=None — исход неизвестен
+    (обрыв, ошибка коммита): запись сбрасывается, следующий ход перечитает историю из БД.
+    """
+    cache = get_history_cache()
+    if cache is None:
+        return
+    if messages is None:
+        cache.invalidate((user_id, dialog_id))
+        return
+    settings = get_settings()
+    cache.append(
+        (user_id, dialog_id),
+        messages,
+        limit=settings.HISTORY_MAX_MESSAGES,
+        pinned=settings.HISTORY_PINNED_MESSAGES,
     )
-    return [{"role": row.role, "content": row.content} for row in result.all()]
 
 
-@router.post("/chat")
-async def chat(
+async def _start_turn(
     body: ChatRequest,
-    db: AsyncSession = Depends(get_db),
-):
+    history: list[dict[str, str]] | None = None,
+) -> tuple[list[dict[str, str]], list[dict[str, str]]]:
     """
-    Принимает user_id и message, возвращает SSE-поток с ответом LLM.
-    После завершения стрима сохраняет сообщение пользователя и ответ ассистента в PostgreSQL.
-    При ошибке LLM — 502/503; сохраняем только сообщение пользователя без ответа ассистента.
-    При обрыве соединения клиентом — не сохраняем частичный ответ.
+    Первая короткая транзакция хода: история для LLM, сообщение пользователя и лид.
+    Возвращает (историю диалога, окно истории для LLM) — обе без нового сообщения; соединение
+    освобождается до начала стриминга. history — уже известная история диалога (WebSocket-сессия),
+    тогда она не читается. В режиме write-behind сообщение и лид уходят в очередь пакетной записи,
+    и при известной истории сессия БД не открывается вовсе.
+    """
+    row = message_row(body.user_id, body.dialog_id, "user", body.message)
+    writer = get_message_writer()
+    if history is None or writer is None:
+        async with session_scope() as session:
+            if history is None:
+                with observe_time(CHAT_STAGE_SECONDS, stage="history"):
+                    history = await _dialog_history(session, body.user_id, body.dialog_id)
+            if writer is None:
+                with observe_time(CHAT_STAGE_SECONDS, stage="user_message"):
+                    await write_messages(session, [row])
+                with observe_time(CHAT_STAGE_SECONDS, stage="lead"):
+                    await save_lead_if_contact(session, body.user_id, body.dialog_id, body.message)
+    if writer is not None:
+        with observe_time(CHAT_STAGE_SECONDS, stage="user_message"):
+            await writer.submit([row], lead=(body.user_id, body.dialog_id, body.message))
+    _cache_saved_messages(body.user_id, body.dialog_id, [{"role": "user", "content": body.message}])
+    return history, _context_window(body.user_id, body.dialog_id, history)
+
+
+async def _begin_turn(body: ChatRequest) -> list[dict[str, str]]:
+    """Первая транзакция хода POST /api/chat; возвращает окно истории для LLM (без нового сообщения)."""
+    return (await _start_turn(body))[1]
+
+
+async def _save_reply(body: ChatRequest, reply: str) -> None:
+    """Вторая короткая транзакция хода: ответ ассистента после завершения стрима."""
+    row = message_row(body.user_id, body.dialog_id, "assistant", reply)
+    writer = get_message_writer()
+    with observe_time(CHAT_STAGE_SECONDS, stage="reply_commit"):
+        if writer is not None:
+            await writer.submit([row])
+            return
+        async with session_scope() as session:
+            await write_messages(session, [row])
+
+
+async def _cached_reply(
+    system_prompt: str,
+    history: list[dict[str, str]],
+    messages: list[dict[str, str]],
+) -> tuple[str | None, str | None]:
+    """
+    (ключ, ответ) кэша ответов для хода; ключ None — ход не кэшируется (кэш выключен или диалог длиннее
+    RESPONSE_CACHE_MAX_HISTORY). Ошибка кэша не мешает ответу — считается промахом.
     """
     settings = get_settings()
+    cache = get_response_cache()
+    if cache is None or len(history) > settings.RESPONSE_CACHE_MAX_HISTORY:
+        return None, None
+    key = cache_key(settings.LLM_MODEL, settings.LLM_TEMPERATURE, prompt_hash(system_prompt), messages)
+    try:
+        return key, await cache.get(key)
+    except Exception:
+        logger.exception("Кэш ответов недоступен")
+        return key, None
+
+
+async def _remember_reply(key: str, system_prompt: str, reply: str) -> None:
+    cache = get_response_cache()
+    if cache is None or not reply:
+        return
     try:
-        system_prompt = load_system_prompt(settings.prompt_path)
+        await cache.put(key, prompt_hash(system_prompt), reply)
+    except Exception:
+        logger.exception("Не удалось сохранить ответ в кэш")
+
+
+def _reply_chunks(
+    system_prompt: str,
+    messages: list[dict[str, str]],
+    cached: str | None,
+    stop: asyncio.Future | None = None,
+) -> AsyncIterator[str]:
+    """
+    Фрагменты ответа: из кэша ответов (тем же путём, что и стрим LLM) или от LLM; stop — прервать поток
+    (отключение клиента). Фрагменты склеиваются в окна SSE_COALESCE_*.
+    """
+    settings = get_settings()
+    if cached is not None:
+        chunks = replay_chunks(cached, settings.RESPONSE_CACHE_CHUNK_CHARS)
+    else:
+        chunks = stream_chat(messages, system_prompt=system_prompt)
+    if stop is not None:
+        chunks = stop_when(chunks, stop)
+    if settings.SSE_COALESCE_MS > 0:
+        chunks = coalesce(chunks, settings.SSE_COALESCE_MS / 1000, settings.SSE_COALESCE_BYTES)
+    return chunks
+
+
+def _llm_error(e: Exception) -> tuple[int, str]:
+    """(статус, detail) ответа клиенту при ошибке LLM."""
+    if isinstance(e, NoUpstreamAvailable):
+        return 503, "LLM недоступна"
+    return (503 if e.response.status_code >= 500 else 502), "Ошибка LLM"
+
+
+async def _complete_turn(
+    body: ChatRequest,
+    system_prompt: str,
+    key: str | None,
+    cached: str | None,
+    reply: str,
+) -> list[dict[str, str]]:
+    """Сохраняет ответ ассистента (и кладёт его в кэш ответов); возвращает сохранённые сообщения для кэша истории."""
+    await _save_reply(body, reply)
+    if key is not None and cached is None:
+        await _remember_reply(key, system_prompt, reply)
+    return [{"role": "assistant", "content": reply}]
+
+
+async def _produce(
+    generation: Generation,
+    body: ChatRequest,
+    system_prompt: str,
+    messages: list[dict[str, str]],
+    key: str | None,
+    cached: str | None,
+    release: Callable[[], None] | None,
+) -> None:
+    """
+    Фоновая генерация возобновляемого ответа (app.generations): фрагменты — в буфер генерации, ответ
+    сохраняется после завершения, даже если клиент отключился. Отмена (клиент не вернулся за
+    SSE_RESUME_GRACE) закрывает запрос к LLM; частичный ответ не сохраняется.
+    """
+    full_reply: list[str] = []
+    saved: list[dict[str, str]] | None = None
+    try:
+        async with aclosing(_reply_chunks(system_prompt, messages, cached)) as chunks:
+            async for chunk in chunks:
+                full_reply.append(chunk)
+                generation.push(chunk)
+        generation.finish()
+        saved = await _complete_turn(body, system_prompt, key, cached, "".join(full_reply))
+    except (HTTPStatusError, NoUpstreamAvailable) as e:
+        saved = []
+        generation.finish(error=_llm_error(e))
+    except asyncio.CancelledError:
+        if metrics_enabled():
+            CHAT_CLIENT_DISCONNECTS.inc()
+        raise
+    finally:
+        if release is not None:
+            release()
+        _cache_saved_messages(body.user_id, body.dialog_id, saved)
+
+
+async def _follow(
+    generation: Generation,
+    after: int,
+    request: Request,
+    registry: GenerationRegistry,
+) -> AsyncIterator[bytes]:
+    """
+    SSE-поток генерации начиная с события после after (id событий — "{generation_id}:{seq}").
+    Отключение клиента только отписывает его: генерация продолжается SSE_RESUME_GRACE секунд.
+    """
+    enabled = metrics_enabled()
+    disconnected = asyncio.ensure_future(_wait_disconnect(request))
+    registry.attach(generation)
+    try:
+        async with aclosing(stop_when(generation.follow(after), disconnected)) as events:
+            async for seq, chunk in events:
+                data = sse_event(chunk, event_id=generation.event_id(seq))
+                if enabled:
+                    CHAT_STREAM_BYTES.inc(len(data))
+                yield data
+        if disconnected.done():
+            return
+        if generation.error is not None:
+            raise HTTPException(*generation.error)
+        yield SSE_DONE
+    finally:
+        disconnected.cancel()
+        registry.detach(generation)
+
+
+async def _admit(user_id: str) -> Callable[[], None] | None:
+    """Занимает слот допуска (app.admission); возвращает его освобождение или None, если допуск отключён."""
+    admission = get_admission()
+    if admission is None:
+        return None
+    try:
+        ticket = await admission.acquire(user_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много запросов",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    return ticket.release
+
+
+@router.post("/chat")
+async def chat(body: ChatRequest, request: Request):
+    """
+    Принимает user_id и message, возвращает SSE-поток с ответом LLM.
+    Сообщение пользователя (и лид) сохраняются в короткой транзакции до стрима, ответ ассистента —
+    во второй короткой транзакции после него; во время стриминга соединение с БД не удерживается.
+    При ошибке LLM — 502/503; сохранено только сообщение пользователя без ответа ассистента.
+    При обрыве соединения клиентом запрос к LLM сразу отменяется (не ждём следующего токена),
+    частичный ответ не сохраняется.
+    Сверх лимитов частоты и одновременных стримов (app.admission) — 429 с заголовком Retry-After.
+    Повторяющиеся первые вопросы могут отдаваться из кэша ответов (app.response_cache) без вызова LLM.
+    При SSE_RESUME_ENABLED ответ генерируется фоновой задачей (app.generations): у событий есть id,
+    в заголовке X-Generation-Id — идентификатор генерации для GET /api/chat/{generation_id}/stream,
+    и обрыв соединения не отменяет запрос к LLM в течение SSE_RESUME_GRACE.
+    """
+    try:
+        with observe_time(CHAT_STAGE_SECONDS, stage="prompt"):
+            system_prompt = get_system_prompt(body.dialog_id)
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="Файл промпта недоступен")
 
-    history = await _get_history(db, body.user_id, body.dialog_id)
-    messages = [*history, {"role": "user", "content": body.message}]
+    release = await _admit(body.user_id)
+    try:
+        history = await _begin_turn(body)
+        messages = [*history, {"role": "user", "content": body.message}]
+        key, cached = await _cached_reply(system_prompt, history, messages)
+    except BaseException:
+        if release is not None:
+            release()
+        raise
 
-    user_msg = Message(
-        user_id=body.user_id,
-        dialog_id=body.dialog_id,
-        role="user",
-        content=body.message,
-    )
-    db.add(user_msg)
-    await db.flush()
-    await save_lead_if_contact(db, body.user_id, body.dialog_id, body.message)
+    registry = get_generation_registry()
+    if registry is not None:
+        generation = registry.start(
+            body.user_id,
+            body.dialog_id,
+            lambda generation: _produce(generation, body, system_prompt, messages, key, cached, release),
+        )
+        if release is not None:
+            # Слот освобождается и тогда, когда задача генерации отменена до старта (release идемпотентен)
+            generation.task.add_done_callback(lambda _: release())
+        return StreamingResponse(
+            _follow(generation, 0, request, registry),
+            media_type="text/event-stream",
+            headers={**_SSE_HEADERS, "X-Generation-Id": generation.id},
+        )
 
     async def stream_and_save() -> AsyncIterator[bytes]:
+        enabled = metrics_enabled()
         full_reply: list[str] = []
+        saved: list[dict[str, str]] | None = None
+        disconnected = asyncio.ensure_future(_wait_disconnect(request))
+        chunks = _reply_chunks(system_prompt, messages, cached, stop=disconnected)
         try:
-            async for chunk in stream_chat(messages, system_prompt=system_prompt):
-                full_reply.append(chunk)
-                yield _sse_message(chunk).encode("utf-8")
-            yield _sse_message("[DONE]").encode("utf-8")
-            assistant_msg = Message(
-                user_id=body.user_id,
-                dialog_id=body.dialog_id,
-                role="assistant",
-                content="".join(full_reply),
-            )
-            db.add(assistant_msg)
-            await db.commit()
-        except HTTPStatusError as e:
-            await db.commit()
-            raise HTTPException(
-                status_code=503 if e.response.status_code >= 500 else 502,
-                detail="Ошибка LLM",
-            )
-        except Exception:
-            await db.commit()
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    full_reply.append(chunk)
+                    data = sse_event(chunk)
+                    if enabled:
+                        CHAT_STREAM_BYTES.inc(len(data))
+                    yield data
+            if disconnected.done():
+                # Клиент ушёл: апстрим уже закрыт, ответ ассистента не сохраняем (в БД и кэше только вопрос)
+                saved = []
+                if enabled:
+                    CHAT_CLIENT_DISCONNECTS.inc()
+                return
+            yield SSE_DONE
+            saved = await _complete_turn(body, system_prompt, key, cached, "".join(full_reply))
+        except (HTTPStatusError, NoUpstreamAvailable) as e:
+            saved = []
+            raise HTTPException(*_llm_error(e))
+        except (asyncio.CancelledError, GeneratorExit):
+            if enabled:
+                CHAT_CLIENT_DISCONNECTS.inc()
             raise
+        finally:
+            disconnected.cancel()
+            if release is not None:
+                release()
+            _cache_saved_messages(body.user_id, body.dialog_id, saved)
 
     return StreamingResponse(
         stream_and_save(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
+        headers=_SSE_HEADERS,
+        # Слот освобождается и тогда, когда тело ответа так и не начали отдавать (release идемпотентен)
+        background=BackgroundTask(release) if release is not None else None,
+    )
+
+
+@router.get("/chat/{generation_id}/stream")
+async def resume_chat(
+    generation_id: str,
+    request: Request,
+    user_id: str,
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+    after: str | None = None,
+):
+    """
+    Продолжение ответа после обрыва соединения: события генерации generation_id (заголовок X-Generation-Id
+    ответа POST /api/chat) после Last-Event-ID (или параметра after — для клиентов, не умеющих задать
+    заголовок); без них — с начала. 404 — генерации нет (отключено, истёк SSE_RESUME_GRACE, другой воркер),
+    410 — пропущенная часть уже вытеснена из буфера: ответ целиком появится в истории диалога.
+    """
+    registry = get_generation_registry()
+    generation = registry.get(generation_id) if registry is not None else None
+    enabled = metrics_enabled()
+    if generation is None or generation.user_id != user_id:
+        if enabled:
+            CHAT_RESUMES.inc(result="not_found")
+        raise HTTPException(status_code=404, detail="Генерация не найдена")
+    cursor = last_event_id or after
+    seq = 0
+    if cursor:
+        gid, _, raw_seq = cursor.rpartition(":")
+        if gid != generation_id or not raw_seq.isdigit():
+            raise HTTPException(status_code=400, detail="Некорректный Last-Event-ID")
+        seq = int(raw_seq)
+    try:
+        pending = generation.events_after(seq)
+    except ReplayGap:
+        if enabled:
+            CHAT_RESUMES.inc(result="gap")
+        raise HTTPException(status_code=410, detail="Часть ответа уже недоступна")
+    if enabled:
+        CHAT_RESUMES.inc(result="resumed")
+    if generation.finished and generation.error is not None and not pending:
+        raise HTTPException(*generation.error)
+    return StreamingResponse(
+        _follow(generation, seq, request, registry),
+        media_type="text/event-stream",
+        headers={**_SSE_HEADERS, "X-Generation-Id": generation.id},
     )
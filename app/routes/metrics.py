@@ -0,0 +1,33 @@
+"""
+GET /metrics: метрики приложения в текстовом формате Prometheus.
+Доступ по заголовку Authorization: Bearer <METRICS_TOKEN> (bearer_token в scrape-конфиге Prometheus);
+без заданного METRICS_TOKEN эндпоинт закрыт.
+"""
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.config import get_settings
+from app.metrics import metrics_enabled, render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+def _require_metrics_token(authorization: str | None) -> None:
+    token = get_settings().METRICS_TOKEN
+    scheme, _, value = (authorization or "").partition(" ")
+    if not token or scheme.lower() != "bearer" or not secrets.compare_digest(value.encode(), token.encode()):
+        raise HTTPException(status_code=403, detail="Неверный или отсутствующий токен метрик")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: str | None = Header(None)):
+    """
+    Текущие значения метрик (пул БД, этапы чата, стриминг LLM) для Prometheus.
+    404, если метрики выключены; 403 без верного токена.
+    """
+    if not metrics_enabled():
+        raise HTTPException(status_code=404, detail="Метрики отключены")
+    _require_metrics_token(authorization)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
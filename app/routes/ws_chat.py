@@ -0,0 +1,209 @@
+"""
+WebSocket-транспорт чата: /api/ws/chat?user_id=...&dialog_id=... — одно соединение на много ходов.
+Ход идёт тем же конвейером, что и POST /api/chat (история, лид, стрим LLM, сохранение, кэши), но без
+HTTP-запроса и заголовков SSE на каждое сообщение; личность (user_id, dialog_id) задаётся при подключении,
+история диалога хранится в состоянии соединения и между ходами из БД не перечитывается.
+
+Клиент → сервер (JSON):
+    {"type": "message", "message": "..."} — новый ход (пока идёт предыдущий — ошибка 409);
+    {"type": "cancel"} — отменить текущую генерацию (запрос к LLM закрывается, частичный ответ не сохраняется).
+Сервер → клиент (JSON):
+    {"type": "chunk", "text": "..."}, затем {"type": "done"} или {"type": "cancelled"};
+    {"type": "error", "status": 429, "detail": "...", "retry_after": 3} — коды как у POST /api/chat.
+"""
+import asyncio
+import logging
+from contextlib import aclosing, suppress
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from httpx import HTTPStatusError
+from pydantic import ValidationError
+
+from app.config import get_settings
+from app.history_cache import extend_history, get_history_cache
+from app.metrics import Counter, metrics_enabled
+from app.prompts import get_system_prompt
+from app.routes.chat import (
+    CHAT_CLIENT_DISCONNECTS,
+    _admit,
+    _cache_saved_messages,
+    _cached_reply,
+    _complete_turn,
+    _llm_error,
+    _reply_chunks,
+    _start_turn,
+)
+from app.schemas import ChatRequest
+from app.upstreams import NoUpstreamAvailable
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api", tags=["chat"])
+
+CHAT_CANCELS = Counter(
+    "chat_cancels_total",
+    "Ходов WebSocket-чата, отменённых клиентом кадром cancel (отключения — в chat_client_disconnects_total)",
+)
+
+
+class ConnectionState:
+    """
+    Состояние соединения: личность и история диалога. История действительна, пока ключ не сбрасывался
+    в кэше истории воркера (app.history_cache: исход записи неизвестен, событие другого воркера, новая
+    сводка); без кэша истории она перечитывается на каждом ходе.
+    Кадры отправляют и задача хода, и цикл приёма — отправка идёт через send() под общей блокировкой.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, dialog_id: str) -> None:
+        self.websocket = websocket
+        self.user_id = user_id
+        self.dialog_id = dialog_id
+        self._history: list[dict[str, str]] | None = None
+        self._version = 0
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(frame)
+
+    async def close(self, code: int) -> None:
+        async with self._send_lock:
+            await self.websocket.close(code=code)
+
+    def history(self) -> list[dict[str, str]] | None:
+        cache = get_history_cache()
+        key = (self.user_id, self.dialog_id)
+        if self._history is None or cache is None or cache.invalidated_since(key, self._version):
+            return None
+        return list(self._history)
+
+    def version(self) -> int:
+        cache = get_history_cache()
+        return cache.version if cache is not None else 0
+
+    def remember(self, history: list[dict[str, str]], version: int) -> None:
+        self._history = history
+        self._version = version
+
+    def extend(self, messages: list[dict[str, str]]) -> None:
+        if self._history is not None:
+            settings = get_settings()
+            self._history = extend_history(
+                self._history,
+                messages,
+                limit=settings.HISTORY_MAX_MESSAGES,
+                pinned=settings.HISTORY_PINNED_MESSAGES,
+            )
+
+
+def _error(status: int, detail: str, retry_after: int | None = None) -> dict:
+    frame = {"type": "error", "status": status, "detail": detail}
+    if retry_after is not None:
+        frame["retry_after"] = retry_after
+    return frame
+
+
+async def _turn(state: ConnectionState, body: ChatRequest) -> None:
+    """Один ход чата; отмена задачи (cancel или отключение) закрывает стрим LLM, частичный ответ не сохраняется."""
+    try:
+        await _run_turn(state, body)
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Ошибка хода WebSocket-чата")
+        with suppress(Exception):
+            await state.send(_error(500, "Внутренняя ошибка"))
+
+
+async def _run_turn(state: ConnectionState, body: ChatRequest) -> None:
+    try:
+        system_prompt = get_system_prompt(body.dialog_id)
+    except FileNotFoundError:
+        await state.send(_error(500, "Файл промпта недоступен"))
+        return
+    try:
+        release = await _admit(body.user_id)
+    except HTTPException as e:
+        retry_after = (e.headers or {}).get("Retry-After")
+        await state.send(_error(e.status_code, e.detail, int(retry_after) if retry_after else None))
+        return
+    try:
+        version = state.version()
+        dialog, history = await _start_turn(body, state.history())
+        state.remember(dialog, version)
+        state.extend([{"role": "user", "content": body.message}])
+        messages = [*history, {"role": "user", "content": body.message}]
+        key, cached = await _cached_reply(system_prompt, history, messages)
+        full_reply: list[str] = []
+        saved: list[dict[str, str]] | None = None
+        try:
+            async with aclosing(_reply_chunks(system_prompt, messages, cached)) as chunks:
+                async for chunk in chunks:
+                    full_reply.append(chunk)
+                    await state.send({"type": "chunk", "text": chunk})
+            await state.send({"type": "done"})
+            saved = await _complete_turn(body, system_prompt, key, cached, "".join(full_reply))
+            state.extend(saved)
+        except (HTTPStatusError, NoUpstreamAvailable) as e:
+            saved = []
+            await state.send(_error(*_llm_error(e)))
+        except (asyncio.CancelledError, WebSocketDisconnect):
+            saved = []
+            raise
+        finally:
+            _cache_saved_messages(body.user_id, body.dialog_id, saved)
+    finally:
+        if release is not None:
+            release()
+
+
+async def _cancel(task: asyncio.Task | None, *, disconnected: bool) -> bool:
+    """Отменяет ход, если он ещё идёт; True — ход был прерван. disconnected — клиент отключился, а не прислал cancel."""
+    if task is None or task.done():
+        return False
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+    if metrics_enabled():
+        (CHAT_CLIENT_DISCONNECTS if disconnected else CHAT_CANCELS).inc()
+    return True
+
+
+@router.websocket("/ws/chat")
+async def ws_chat(websocket: WebSocket, user_id: str = "", dialog_id: str = "default"):
+    """
+    Чат по WebSocket (протокол — в описании модуля). Ходы одного соединения идут по очереди;
+    при отключении клиента текущий ход отменяется. SSE-эндпоинт POST /api/chat остаётся.
+    """
+    if not 1 <= len(user_id) <= 255 or len(dialog_id) > 255:
+        await websocket.close(code=1008, reason="user_id и dialog_id обязательны (до 255 символов)")
+        return
+    await websocket.accept()
+    state = ConnectionState(websocket, user_id, dialog_id)
+    task: asyncio.Task | None = None
+    try:
+        while True:
+            frame = await websocket.receive_json()
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "cancel":
+                if await _cancel(task, disconnected=False):
+                    await state.send({"type": "cancelled"})
+            elif kind == "message":
+                if task is not None and not task.done():
+                    await state.send(_error(409, "Предыдущий ответ ещё генерируется"))
+                    continue
+                try:
+                    body = ChatRequest(user_id=user_id, dialog_id=dialog_id, message=frame.get("message", ""))
+                except ValidationError as e:
+                    await state.send(_error(422, e.errors()[0]["msg"]))
+                    continue
+                task = asyncio.create_task(_turn(state, body))
+            else:
+                await state.send(_error(400, "Неизвестный тип сообщения"))
+    except WebSocketDisconnect:
+        pass
+    except (ValueError, KeyError):
+        # Не JSON или бинарный кадр: соединение закрывается, текущий ход отменяется ниже
+        await state.close(1003)
+    finally:
+        await _cancel(task, disconnected=True)
@@ -0,0 +1,106 @@
+"""
+Полнотекстовый поиск по сообщениям для админки: вычисляемая колонка messages.search_vector
+(русская и английская конфигурации) и GIN-индекс ix_messages_search_vector.
+
+Страница ищется в два шага: сначала по индексу отбираются совпадения, ранжируются (ts_rank) и
+обрезаются до limit с keyset-условием по (rank, created_at, id); фрагменты с подсветкой (ts_headline —
+самая дорогая часть, разбирает исходный текст) строятся только для строк страницы.
+Без date_from поиск ограничен последними SEARCH_DEFAULT_DAYS днями: окно по created_at отсекает
+старые секции messages и держит число ранжируемых совпадений небольшим.
+"""
+import html
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal
+from uuid import UUID
+
+from sqlalchemy import Select, cast, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+
+from app.config import get_settings
+from app.models import Message
+from app.stats import day_start
+
+SEARCH_CONFIGS = ("russian", "english")
+# ts_headline работает с исходным текстом: совпадения отмечаются символами из области личного использования
+# Unicode, а в HTML (<mark>) они превращаются уже после экранирования текста — см. snippet_html
+_START_SEL = "\ue000"
+_STOP_SEL = "\ue001"
+HEADLINE_OPTIONS = f"StartSel={_START_SEL}, StopSel={_STOP_SEL}, MaxWords=35, MinWords=15, MaxFragments=2"
+
+Order = Literal["rank", "recent"]
+
+
+def search_tsquery(q: str):
+    """Запрос в синтаксисе веб-поиска («фраза», or, -исключение), разобранный обеими конфигурациями."""
+    parts = [func.websearch_to_tsquery(cast(literal(config), REGCONFIG), q) for config in SEARCH_CONFIGS]
+    return parts[0].op("||")(parts[1])
+
+
+def search_messages(
+    q: str,
+    limit: int,
+    *,
+    order: Order = "rank",
+    after: tuple | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    role: str | None = None,
+    user_id: str | None = None,
+    dialog_id: str | None = None,
+) -> Select:
+    """
+    Запрос страницы результатов. Ключ сортировки: (rank, created_at, id) по убыванию для order=rank,
+    (created_at, id) для order=recent; after — ключ последней строки предыдущей страницы.
+    Даты — дни в STATS_TIMEZONE, date_to включительно.
+    """
+    settings = get_settings()
+    tsquery = search_tsquery(q)
+    rank = func.ts_rank(Message.search_vector, tsquery).label("rank")
+    conditions = [Message.search_vector.op("@@")(tsquery)]
+    if date_from is not None:
+        conditions.append(Message.created_at >= day_start(date_from, settings.STATS_TIMEZONE))
+    elif settings.SEARCH_DEFAULT_DAYS > 0:
+        conditions.append(
+            Message.created_at >= datetime.now(timezone.utc) - timedelta(days=settings.SEARCH_DEFAULT_DAYS)
+        )
+    if date_to is not None:
+        conditions.append(Message.created_at < day_start(date_to + timedelta(days=1), settings.STATS_TIMEZONE))
+    if role is not None:
+        conditions.append(Message.role == role)
+    if user_id is not None:
+        conditions.append(Message.user_id == user_id)
+    if dialog_id is not None:
+        conditions.append(Message.dialog_id == dialog_id)
+
+    key = (rank, Message.created_at, Message.id) if order == "rank" else (Message.created_at, Message.id)
+    if after is not None:
+        conditions.append(tuple_(*key) < after)
+    page = (
+        select(Message.id, Message.user_id, Message.dialog_id, Message.role, Message.content, Message.created_at, rank)
+        .where(*conditions)
+        .order_by(*(k.desc() for k in key))
+        .limit(limit)
+        .subquery("page")
+    )
+    # Внешний запрос над уже обрезанной страницей: ts_headline вычисляется не более limit раз
+    headline = func.ts_headline(
+        cast(literal(SEARCH_CONFIGS[0]), REGCONFIG), page.c.content, tsquery, HEADLINE_OPTIONS
+    ).label("snippet")
+    return (
+        select(page.c.id, page.c.user_id, page.c.dialog_id, page.c.role, page.c.created_at, page.c.rank, headline)
+        .order_by(*((page.c.rank.desc(),) if order == "rank" else ()), page.c.created_at.desc(), page.c.id.desc())
+    )
+
+
+def snippet_html(headline: str | None) -> str:
+    """Фрагмент ts_headline в HTML: текст сообщения экранирован, совпадения — в <mark>…</mark>."""
+    escaped = html.escape(headline or "")
+    return escaped.replace(_START_SEL, "<mark>").replace(_STOP_SEL, "</mark>")
+
+
+def cursor_key(row, order: Order) -> tuple:
+    return (row.rank, row.created_at, row.id) if order == "rank" else (row.created_at, row.id)
+
+
+def cursor_types(order: Order) -> tuple[type, ...]:
+    return (float, datetime, UUID) if order == "rank" else (datetime, UUID)
@@ -0,0 +1,185 @@
+"""
+Server-Sent Events на уровне байтов: разбор потока LLM (data: {...}) и кадрирование ответа клиенту.
+JSON разбирается через orjson (requirements.txt; без него — сканер stdlib json, медленнее, но быстрее
+прежнего разбора по строкам); из события берётся только
+choices[0].delta.content. Фрагменты ответа можно склеивать в окна по времени/размеру (SSE_COALESCE_*),
+чтобы на один ответ приходилось меньше отправок ASGI. stop_when прерывает поток по внешнему событию
+(отключение клиента), не дожидаясь следующего фрагмента.
+"""
+import asyncio
+import contextlib
+import json
+import time
+from typing import AsyncIterator
+
+
+# Сканер stdlib json без обёрток json.loads/JSONDecoder.decode (проверки типа, регулярные выражения
+# для пробелов): на коротких событиях они сопоставимы по времени с самим разбором
+_scan_once = json.JSONDecoder().scan_once
+
+
+def _json_loads(data: bytes):
+    # json.loads(str) заметно быстрее json.loads(bytes) с автоопределением кодировки
+    text = data.decode("utf-8")
+    try:
+        value, end = _scan_once(text, 0)
+    except StopIteration:
+        end = -1
+    if end != len(text):
+        # Пробелы вокруг значения, лишние данные или не JSON — полный разбор (ValueError для некорректного)
+        return json.loads(text)
+    return value
+
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # orjson не обязателен
+    _loads = _json_loads
+
+SSE_DONE = b"data: [DONE]\n\n"
+_DATA = b"data:"
+_DONE = b"[DONE]"
+_CONTENT_KEY = b'"content"'
+
+
+async def iter_sse_data(chunks: AsyncIterator[bytes]) -> AsyncIterator[list[bytes]]:
+    """
+    Полезная нагрузка строк data: из байтового потока SSE (без декодирования в str), пачками —
+    по одной на сетевой фрагмент, чтобы не платить за переключение генератора на каждое событие.
+    Строки собираются через границы фрагментов; \\r\\n и \\n равнозначны; прочие поля SSE пропускаются.
+    """
+    tail = b""
+    async for chunk in chunks:
+        if tail:
+            chunk = tail + chunk
+        lines = chunk.split(b"\n")
+        tail = lines.pop()
+        batch = [_strip_data(line) for line in lines if line.startswith(_DATA)]
+        if batch:
+            yield batch
+    if tail.startswith(_DATA):
+        yield [_strip_data(tail)]
+
+
+def _strip_data(line: bytes) -> bytes:
+    value = line[5:]
+    if value[:1] == b" ":
+        value = value[1:]
+    return value.rstrip(b"\r")
+
+
+def is_done(data: bytes) -> bool:
+    """Маркер конца потока OpenAI/DeepSeek: data: [DONE]."""
+    return data.strip() == _DONE
+
+
+def delta_content(data: bytes) -> str | None:
+    """
+    choices[0].delta.content события chat/completions; None — события без текста (роль, finish_reason)
+    и некорректный JSON. События без ключа "content" отбрасываются без разбора JSON.
+    """
+    if _CONTENT_KEY not in data:
+        return None
+    try:
+        event = _loads(data)
+    except ValueError:
+        return None
+    try:
+        content = event["choices"][0]["delta"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    return content if isinstance(content, str) and content else None
+
+
+def sse_event(text: str, event_id: str | None = None) -> bytes:
+    """Одно событие SSE (data: <text>) для клиента; event_id — поле id: (клиент вернёт его в Last-Event-ID)."""
+    if event_id is not None:
+        return f"id: {event_id}\ndata: {text}\n\n".encode("utf-8")
+    return f"data: {text}\n\n".encode("utf-8")
+
+
+async def coalesce(chunks: AsyncIterator[str], window_s: float, max_bytes: int) -> AsyncIterator[str]:
+    """
+    Склеивает фрагменты, пришедшие в течение window_s после первого в окне, пока их размер меньше max_bytes.
+    Первый фрагмент ответа отдаётся сразу (TTFT не растёт). Ожидание следующего фрагмента не отменяется
+    по таймеру — исходный генератор не прерывается на середине чтения.
+    """
+    it = aiter(chunks)
+    first = True
+    buffer: list[str] = []
+    size = 0
+    deadline = 0.0
+    pending: asyncio.Task | None = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(it))
+            timeout = max(0.0, deadline - time.perf_counter()) if buffer else None
+            done, _ = await asyncio.wait((pending,), timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                continue
+            try:
+                chunk = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+            if first:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                deadline = time.perf_counter() + window_s
+            buffer.append(chunk)
+            if max_bytes:
+                size += len(chunk.encode("utf-8"))
+            if (max_bytes and size >= max_bytes) or time.perf_counter() >= deadline:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            # Клиент ушёл посреди ожидания: дожидаемся отмены шага, иначе aclose() упадёт на работающем генераторе
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration, Exception):
+                await pending
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def stop_when(chunks: AsyncIterator[str], stop: asyncio.Future) -> AsyncIterator[str]:
+    """
+    Отдаёт фрагменты chunks, пока не завершился stop (например, клиент отключился). Тогда ожидание
+    следующего фрагмента отменяется и chunks закрывается сразу, не дожидаясь очередного токена.
+    Почему закончился поток, вызывающий узнаёт по stop.done().
+    """
+    it = aiter(chunks)
+    pending: asyncio.Task | None = None
+    try:
+        while not stop.done():
+            pending = asyncio.ensure_future(anext(it))
+            await asyncio.wait((pending, stop), return_when=asyncio.FIRST_COMPLETED)
+            if not pending.done():
+                break
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration, Exception):
+                await pending
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()
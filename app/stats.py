@@ -0,0 +1,151 @@
+"""
+Статистика по дням для админки: завершённые дни — из таблицы daily_stats (заполняет фоновая задача),
+текущий день и ещё не свёрнутые дни — запросом по диапазону created_at (индекс ix_messages_created_at).
+День определяется в часовом поясе tz; свёртка ведётся для STATS_TIMEZONE, для другого пояса
+статистика считается на лету по запрошенному диапазону.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import session_scope
+from app.models import DailyStats, Message
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: при нескольких воркерах свёртку в каждый момент выполняет один
+_REFRESH_LOCK_KEY = 0x5354415453  # "STATS"
+
+
+def day_start(day: date, tz: str) -> datetime:
+    """Начало дня day в часовом поясе tz (aware datetime)."""
+    return datetime.combine(day, time.min, tzinfo=ZoneInfo(tz))
+
+
+def today_in(tz: str) -> date:
+    return datetime.now(ZoneInfo(tz)).date()
+
+
+async def compute_stats(session: AsyncSession, tz: str, first_day: date, last_day: date) -> list[dict]:
+    """Агрегаты по дням [first_day, last_day] напрямую из messages (только строки этого диапазона)."""
+    if first_day > last_day:
+        return []
+    day_col = func.date(func.timezone(tz, Message.created_at))
+    per_session = (
+        select(
+            Message.user_id,
+            Message.dialog_id,
+            day_col.label("day"),
+            func.count().label("messages"),
+        )
+        .where(
+            Message.created_at >= day_start(first_day, tz),
+            Message.created_at < day_start(last_day + timedelta(days=1), tz),
+        )
+        .group_by(Message.user_id, Message.dialog_id, day_col)
+    ).subquery()
+    q = select(
+        per_session.c.day,
+        func.count().label("sessions"),
+        func.count(func.distinct(per_session.c.user_id)).label("unique_users"),
+        func.sum(per_session.c.messages).label("messages"),
+    ).group_by(per_session.c.day)
+    rows = (await session.execute(q)).all()
+    return [
+        {"day": r.day, "sessions": r.sessions, "unique_users": r.unique_users, "messages": int(r.messages)}
+        for r in rows
+    ]
+
+
+async def _last_rolled_day(session: AsyncSession, tz: str) -> date | None:
+    return (await session.execute(select(func.max(DailyStats.day)).where(DailyStats.tz == tz))).scalar()
+
+
+async def refresh_daily_stats(session: AsyncSession, tz: str | None = None) -> int:
+    """
+    Сворачивает завершённые дни (до вчерашнего включительно) в daily_stats. Последние
+    STATS_RECOMPUTE_DAYS уже свёрнутых дней пересчитываются — на случай поздних записей
+    (например, из очереди write-behind). Возвращает число записанных дней.
+    """
+    settings = get_settings()
+    tz = tz or settings.STATS_TIMEZONE
+    locked = (await session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _REFRESH_LOCK_KEY})).scalar()
+    if not locked:
+        return 0
+    yesterday = today_in(tz) - timedelta(days=1)
+    last = await _last_rolled_day(session, tz)
+    if last is None:
+        first_at = (await session.execute(select(func.min(Message.created_at)))).scalar()
+        if first_at is None:
+            return 0
+        first_day = first_at.astimezone(ZoneInfo(tz)).date()
+    else:
+        first_day = last - timedelta(days=settings.STATS_RECOMPUTE_DAYS - 1)
+    rows = await compute_stats(session, tz, first_day, yesterday)
+    if not rows:
+        return 0
+    stmt = pg_insert(DailyStats).values([{"tz": tz, **r} for r in rows])
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DailyStats.tz, DailyStats.day],
+            set_={
+                "sessions": stmt.excluded.sessions,
+                "unique_users": stmt.excluded.unique_users,
+                "messages": stmt.excluded.messages,
+                "refreshed_at": func.now(),
+            },
+        )
+    )
+    return len(rows)
+
+
+async def get_stats(
+    session: AsyncSession,
+    tz: str,
+    date_from: date | None = None,
+    date_to: date | None = None,
+) -> list[dict]:
+    """
+    Статистика по дням, новые первыми: свёрнутые дни из daily_stats, остальное (текущий день,
+    ещё не свёрнутые дни, другой часовой пояс) — из messages только за недостающий диапазон.
+    """
+    today = today_in(tz)
+    date_to = min(date_to or today, today)
+    rolled: list[dict] = []
+    live_from = date_from
+    if tz == get_settings().STATS_TIMEZONE:
+        q = select(DailyStats).where(DailyStats.tz == tz, DailyStats.day <= date_to)
+        if date_from is not None:
+            q = q.where(DailyStats.day >= date_from)
+        rolled = [
+            {"day": r.day, "sessions": r.sessions, "unique_users": r.unique_users, "messages": r.messages}
+            for r in (await session.execute(q)).scalars().all()
+        ]
+        last = await _last_rolled_day(session, tz)
+        if last is not None:
+            live_from = max(date_from or last, last + timedelta(days=1))
+    if live_from is None:
+        first_at = (await session.execute(select(func.min(Message.created_at)))).scalar()
+        live_from = first_at.astimezone(ZoneInfo(tz)).date() if first_at else today
+    live = await compute_stats(session, tz, live_from, date_to)
+    return sorted([*rolled, *live], key=lambda r: r["day"], reverse=True)
+
+
+async def run_stats_refresher() -> None:
+    """Фоновая задача (из lifespan): периодически сворачивает завершённые дни."""
+    settings = get_settings()
+    while True:
+        try:
+            async with session_scope() as session:
+                days = await refresh_daily_stats(session)
+            if days:
+                logger.info("Статистика свёрнута: %d дн.", days)
+        except Exception:
+            logger.exception("Ошибка свёртки статистики")
+        await asyncio.sleep(settings.STATS_REFRESH_INTERVAL)
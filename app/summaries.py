@@ -0,0 +1,230 @@
+"""
+Сводка длинных диалогов: ранние сообщения сжимаются LLM в одну запись dialog_summaries,
+в контекст хода идут сводка и последние сообщения — размер промпта не растёт с длиной диалога.
+
+Сжатие идёт в фоновых задачах воркера (очередь в процессе): ход только ставит диалог в очередь,
+когда несжатая история длиннее SUMMARY_TRIGGER_TOKENS, и никогда не ждёт LLM-вызова сводки.
+Вызов сводки (app.llm.complete_background) не попадает в метрики чата и не влияет на breaker'ы апстримов.
+Во время вызова LLM соединение с БД не удерживается. Сводка пишется UPSERT'ом, который не откатывает
+более свежую сводку (параллельный воркер), после записи кэш истории диалога сбрасывается.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.context import SUMMARY_ROLE, message_tokens
+from app.database import session_scope
+from app.history_cache import HistoryKey, get_history_cache
+from app.llm import complete_background
+from app.metrics import Counter, Histogram, metrics_enabled, observe_time
+from app.models import DialogSummary, Message
+from app.partitions import dialog_filter
+from app.prompts import get_prompt_store
+from app.pubsub import publish_dialogs
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_RUNS = Counter(
+    "dialog_summaries_total",
+    "Сжатий диалогов: done — сводка обновлена, skipped — нечего сжимать, failed — ошибка, dropped — очередь заполнена",
+    ("result",),
+)
+SUMMARY_SECONDS = Histogram("dialog_summary_seconds", "Длительность сжатия диалога (чтение, вызов LLM, запись)")
+
+# Сколько несжатых сообщений читать за один шаг (сверх оставляемых без сжатия)
+_BATCH_MESSAGES = 500
+# Пауза перед повторной попыткой после ошибки сжатия диалога (сек)
+_RETRY_AFTER = 60.0
+_ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+async def load_summary(session: AsyncSession, user_id: str, dialog_id: str) -> DialogSummary | None:
+    return await session.get(DialogSummary, (user_id, dialog_id))
+
+
+def _transcript(previous: str | None, rows: list) -> str:
+    parts = []
+    if previous:
+        parts.append(f"Сводка предыдущей части диалога:\n{previous}\n")
+    parts.append("Новые сообщения:")
+    parts.extend(f"{_ROLE_NAMES.get(row.role, row.role)}: {row.content}" for row in rows)
+    return "\n".join(parts)
+
+
+class DialogSummarizer:
+    def __init__(
+        self,
+        *,
+        trigger_tokens: int,
+        keep_messages: int,
+        input_tokens: int,
+        workers: int,
+        max_queue: int,
+    ) -> None:
+        self.trigger_tokens = trigger_tokens
+        self.keep_messages = keep_messages
+        self.input_tokens = input_tokens
+        self.workers = workers
+        self._queue: asyncio.Queue[HistoryKey] = asyncio.Queue(maxsize=max_queue)
+        self._pending: set[HistoryKey] = set()
+        self._retry_at: dict[HistoryKey, float] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(max(1, self.workers))]
+
+    async def stop(self) -> None:
+        """Останавливает задачи; недосжатые диалоги будут поставлены в очередь снова на следующем ходе."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def maybe_schedule(self, key: HistoryKey, history: list[dict[str, str]]) -> bool:
+        """
+        Ставит диалог в очередь, если его несжатая часть длиннее порога. Вызывается на пути запроса:
+        только подсчёт по уже загруженной истории и put_nowait, без ожидания.
+        """
+        if key in self._pending:
+            return False
+        tokens = sum(message_tokens(m) for m in history if m["role"] != SUMMARY_ROLE)
+        if tokens <= self.trigger_tokens:
+            return False
+        retry_at = self._retry_at.get(key)
+        if retry_at is not None:
+            if retry_at > time.monotonic():
+                return False
+            del self._retry_at[key]
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self._count("dropped")
+            return False
+        self._pending.add(key)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                with observe_time(SUMMARY_SECONDS):
+                    summarized = await self.summarize(*key)
+                self._count("done" if summarized else "skipped")
+            except Exception:
+                logger.exception("Не удалось сжать диалог %s", key)
+                self._retry_at[key] = time.monotonic() + _RETRY_AFTER
+                self._count("failed")
+            finally:
+                self._pending.discard(key)
+
+    async def summarize(self, user_id: str, dialog_id: str) -> int:
+        """
+        Сжимает несжатую часть диалога, кроме последних keep_messages сообщений, шагами не больше
+        input_tokens, пока остаток не станет короче порога. Возвращает число сжатых сообщений.
+        """
+        summarized = 0
+        while True:
+            async with session_scope() as session:
+                current = await load_summary(session, user_id, dialog_id)
+                query = select(Message.role, Message.content, Message.created_at).where(
+                    *dialog_filter(user_id, dialog_id)
+                )
+                if current is not None:
+                    query = query.where(Message.created_at > current.covered_until)
+                limit = _BATCH_MESSAGES + self.keep_messages
+                rows = (await session.execute(query.order_by(Message.created_at).limit(limit))).all()
+            complete = len(rows) < limit
+            if complete and sum(message_tokens(r._mapping) for r in rows) <= self.trigger_tokens:
+                return summarized
+            old = rows[: len(rows) - self.keep_messages] if complete else rows
+            chunk, used = [], 0
+            for row in old:
+                used += message_tokens(row._mapping)
+                if chunk and used > self.input_tokens:
+                    break
+                chunk.append(row)
+            if not chunk:
+                return summarized
+
+            previous = current.summary if current is not None else None
+            prompt = get_prompt_store().get(get_settings().summary_prompt_path)
+            messages = [{"role": "user", "content": _transcript(previous, chunk)}]
+            summary = (await complete_background(messages, system_prompt=prompt)).strip()
+            if not summary:
+                raise ValueError("LLM вернула пустую сводку")
+
+            covered = (current.covered_messages if current is not None else 0) + len(chunk)
+            if not await self._store(user_id, dialog_id, summary, chunk[-1].created_at, covered):
+                # Параллельно записана более свежая сводка — продолжит тот, кто её записал
+                return summarized
+            summarized += len(chunk)
+            cache = get_history_cache()
+            if cache is not None:
+                cache.invalidate((user_id, dialog_id))
+
+    @staticmethod
+    async def _store(user_id: str, dialog_id: str, summary: str, covered_until: datetime, covered: int) -> bool:
+        stmt = pg_insert(DialogSummary).values(
+            user_id=user_id,
+            dialog_id=dialog_id,
+            summary=summary,
+            covered_until=covered_until,
+            covered_messages=covered,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DialogSummary.user_id, DialogSummary.dialog_id],
+            set_={
+                "summary": stmt.excluded.summary,
+                "covered_until": stmt.excluded.covered_until,
+                "covered_messages": stmt.excluded.covered_messages,
+                "updated_at": func.now(),
+            },
+            where=DialogSummary.covered_until < stmt.excluded.covered_until,
+        )
+        async with session_scope() as session:
+            result = await session.execute(stmt)
+            if result.rowcount > 0:
+                await publish_dialogs(session, [(user_id, dialog_id)])
+        return result.rowcount > 0
+
+    @staticmethod
+    def _count(result: str) -> None:
+        if metrics_enabled():
+            SUMMARY_RUNS.inc(result=result)
+
+
+_summarizer: DialogSummarizer | None = None
+
+
+def get_summarizer() -> DialogSummarizer | None:
+    """Фоновое сжатие диалогов, если оно запущено (SUMMARY_ENABLED=true), иначе None."""
+    return _summarizer
+
+
+async def start_summarizer() -> DialogSummarizer:
+    global _summarizer
+    if _summarizer is None:
+        settings = get_settings()
+        _summarizer = DialogSummarizer(
+            trigger_tokens=settings.SUMMARY_TRIGGER_TOKENS,
+            keep_messages=settings.SUMMARY_KEEP_MESSAGES,
+            input_tokens=settings.SUMMARY_INPUT_TOKENS,
+            workers=settings.SUMMARY_WORKERS,
+            max_queue=settings.SUMMARY_QUEUE_MAX,
+        )
+        _summarizer.start()
+    return _summarizer
+
+
+async def stop_summarizer() -> None:
+    global _summarizer
+    if _summarizer is not None:
+        summarizer, _summarizer = _summarizer, None
+        await summarizer.stop()
@@ -0,0 +1,271 @@
+"""
+Пул апстримов LLM: выбор по весам, учёт здоровья (circuit breaker), повторы и хеджирование до первого токена.
+
+Пока клиенту не отдан ни один фрагмент, ошибку апстрима (5xx, 429, сетевую, таймаут) можно скрыть —
+запрос повторяется на другом апстриме (не больше LLM_RETRIES раз). Если первого токена нет дольше
+LLM_HEDGE_AFTER_MS, параллельно запускается запрос к другому апстриму: остаётся тот, что ответил первым,
+второй отменяется. После первого токена ошибка пробрасывается как есть.
+
+Фоновые запросы (сводки диалогов, track=False) идут через тот же выбор и повторы, но не учитываются
+ни в breaker'ах, ни в метриках апстримов: их ошибки не исключают апстрим из пользовательского чата.
+"""
+import asyncio
+import contextlib
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+import httpx
+
+from app.config import Settings, UpstreamConfig, get_settings
+from app.metrics import Counter, metrics_enabled
+
+LLM_UPSTREAM_ATTEMPTS = Counter(
+    "llm_upstream_attempts_total",
+    "Запросы к апстримам LLM: won — ответ отдан клиенту, failed — ошибка до первого токена, cancelled — проиграл хедж",
+    ("upstream", "result"),
+)
+LLM_HEDGES = Counter("llm_hedges_total", "Хеджирующих запросов из-за долгого ожидания первого токена")
+LLM_BREAKER_OPENED = Counter("llm_breaker_opened_total", "Исключений апстрима circuit breaker'ом", ("upstream",))
+
+
+class NoUpstreamAvailable(Exception):
+    """Все апстримы исключены circuit breaker'ом."""
+
+
+class CircuitBreaker:
+    """
+    failures ошибок подряд — апстрим исключается на cooldown секунд; затем пропускается один пробный запрос
+    (half-open): успех закрывает breaker, ошибка снова открывает его.
+    """
+
+    def __init__(self, failures: int, cooldown: float) -> None:
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def available(self) -> bool:
+        if self.consecutive_failures < self.failures:
+            return True
+        return time.monotonic() >= self.open_until and not self.probing
+
+    def on_start(self) -> None:
+        if self.consecutive_failures >= self.failures:
+            self.probing = True
+
+    def on_abandon(self) -> None:
+        """Запрос закончился без исхода (отмена, проигранный хедж, ошибка клиента 4xx) — пробу можно повторить."""
+        self.probing = False
+
+    def on_success(self) -> None:
+        self.consecutive_failures = 0
+        self.probing = False
+
+    def on_failure(self) -> bool:
+        """Учитывает ошибку; True — breaker только что открылся."""
+        self.probing = False
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failures:
+            self.open_until = time.monotonic() + self.cooldown
+            return True
+        return False
+
+
+@dataclass
+class Upstream:
+    config: UpstreamConfig
+    breaker: CircuitBreaker
+
+    @property
+    def name(self) -> str:
+        return self.config.name or self.config.url
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Ошибки, которые имеет смысл повторить на другом апстриме."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, httpx.TransportError)
+
+
+@dataclass
+class _Attempt:
+    upstream: Upstream
+    chunks: AsyncIterator[str]
+    first: asyncio.Task
+
+
+async def _close(attempt: _Attempt) -> None:
+    """Отменяет ожидание первого фрагмента и закрывает стрим (соединение с апстримом разрывается)."""
+    attempt.first.cancel()
+    with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration, Exception):
+        await attempt.first
+    aclose = getattr(attempt.chunks, "aclose", None)
+    if aclose is not None:
+        with contextlib.suppress(Exception):
+            await aclose()
+
+
+class UpstreamPool:
+    def __init__(
+        self,
+        configs: list[UpstreamConfig],
+        *,
+        retries: int,
+        hedge_after: float,
+        breaker_failures: int,
+        breaker_cooldown: float,
+    ) -> None:
+        self.upstreams = [Upstream(c, CircuitBreaker(breaker_failures, breaker_cooldown)) for c in configs]
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self._random = random.Random()
+
+    def pick(self, exclude: set[int] = frozenset()) -> Upstream | None:
+        """Случайный апстрим по весам среди доступных (breaker закрыт или можно пробовать) и не из exclude (id апстримов)."""
+        candidates = [u for u in self.upstreams if id(u) not in exclude and u.breaker.available()]
+        if not candidates:
+            return None
+        return self._random.choices(candidates, weights=[max(u.config.weight, 0.0) or 1e-9 for u in candidates])[0]
+
+    def _start(
+        self, upstream: Upstream, open_stream: Callable[[Upstream], AsyncIterator[str]], track: bool
+    ) -> _Attempt:
+        if track:
+            upstream.breaker.on_start()
+        chunks = open_stream(upstream)
+        return _Attempt(upstream, chunks, asyncio.ensure_future(anext(chunks)))
+
+    def _failed(self, upstream: Upstream, track: bool) -> None:
+        if not track:
+            return
+        opened = upstream.breaker.on_failure()
+        if metrics_enabled():
+            LLM_UPSTREAM_ATTEMPTS.inc(upstream=upstream.name, result="failed")
+            if opened:
+                LLM_BREAKER_OPENED.inc(upstream=upstream.name)
+
+    async def stream(
+        self,
+        open_stream: Callable[[Upstream], AsyncIterator[str]],
+        *,
+        track: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Фрагменты ответа от первого успешно начавшего отвечать апстрима.
+        open_stream(upstream) открывает стрим к одному апстриму (см. app.llm.stream_chat).
+        track=False — фоновый запрос: breaker'ы и метрики апстримов не обновляются.
+        """
+        enabled = track and metrics_enabled()
+        tried: set[int] = set()
+        started: list[Upstream] = []
+        attempts: list[_Attempt] = []
+        budget = 1 + self.retries
+        last_error: BaseException | None = None
+        winner: _Attempt | None = None
+        first_chunk: str | None = None
+        hedged = False
+
+        def start_next(hedge: bool = False) -> bool:
+            # Хедж не расходует повторы: это дополнительный запрос, а не замена упавшего
+            nonlocal budget
+            upstream = self.pick(tried)
+            if upstream is None or (budget <= 0 and not hedge):
+                return False
+            if not hedge:
+                budget -= 1
+            tried.add(id(upstream))
+            started.append(upstream)
+            attempts.append(self._start(upstream, open_stream, track))
+            return True
+
+        try:
+            if not start_next():
+                raise NoUpstreamAvailable("Нет доступных апстримов LLM")
+            while winner is None:
+                if not attempts:
+                    raise last_error or NoUpstreamAvailable("Нет доступных апстримов LLM")
+                can_hedge = self.hedge_after > 0 and not hedged and len(attempts) == 1
+                done, _ = await asyncio.wait(
+                    [a.first for a in attempts],
+                    timeout=self.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedged = True
+                    if start_next(hedge=True) and enabled:
+                        LLM_HEDGES.inc()
+                    continue
+                for attempt in [a for a in attempts if a.first in done]:
+                    attempts.remove(attempt)
+                    try:
+                        first_chunk = attempt.first.result()
+                    except StopAsyncIteration:
+                        first_chunk = None
+                    except Exception as e:
+                        await _close(attempt)
+                        if not is_retryable(e):
+                            raise
+                        self._failed(attempt.upstream, track)
+                        last_error = e
+                        if not attempts:
+                            start_next()
+                        continue
+                    winner = attempt
+                    break
+            for loser in attempts:
+                await _close(loser)
+                if enabled:
+                    LLM_UPSTREAM_ATTEMPTS.inc(upstream=loser.upstream.name, result="cancelled")
+                # Проигравший хедж ошибкой не считается
+                if track:
+                    loser.upstream.breaker.on_abandon()
+            attempts.clear()
+
+            if first_chunk is not None:
+                yield first_chunk
+                try:
+                    async for chunk in winner.chunks:
+                        yield chunk
+                except Exception as e:
+                    if is_retryable(e):
+                        self._failed(winner.upstream, track)
+                    raise
+            if track:
+                winner.upstream.breaker.on_success()
+            if enabled:
+                LLM_UPSTREAM_ATTEMPTS.inc(upstream=winner.upstream.name, result="won")
+        finally:
+            for attempt in attempts:
+                await _close(attempt)
+            if winner is not None:
+                aclose = getattr(winner.chunks, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            # Проба, прерванная отменой, aclose() или ошибкой 4xx, не должна исключить апстрим навсегда
+            if track:
+                for upstream in started:
+                    upstream.breaker.on_abandon()
+
+
+_pool: UpstreamPool | None = None
+_pool_settings: Settings | None = None
+
+
+def get_upstream_pool() -> UpstreamPool:
+    """Пул апстримов процесса; пересоздаётся, если настройки перечитаны (get_settings.cache_clear())."""
+    global _pool, _pool_settings
+    settings = get_settings()
+    if _pool is None or _pool_settings is not settings:
+        _pool = UpstreamPool(
+            settings.llm_upstreams,
+            retries=settings.LLM_RETRIES,
+            hedge_after=settings.LLM_HEDGE_AFTER_MS / 1000,
+            breaker_failures=settings.LLM_BREAKER_FAILURES,
+            breaker_cooldown=settings.LLM_BREAKER_COOLDOWN,
+        )
+        _pool_settings = settings
+    return _pool
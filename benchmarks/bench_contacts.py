@@ -0,0 +1,89 @@
+"""
+Бенчмарк извлечения контактов на корпусе из 100 000 синтетических сообщений русскоязычного чата
+(~5% с телефоном или почтой): исходная реализация против однопроходной с предварительной проверкой.
+Перед замером проверяется, что результаты совпадают на всём корпусе.
+
+Запуск:
+    python -m benchmarks.bench_contacts --messages 100000
+"""
+import argparse
+import random
+import time
+
+from app.leads import EMAIL_RE, PHONE_RE, _extract_contact_parts, _normalize_contact
+
+QUESTIONS = [
+    "Здравствуйте! Сколько стоит внедрение ИИ-агента?",
+    "А можно интегрировать бота с нашей CRM?",
+    "Мы интернет-магазин, у нас около 300 обращений в день.",
+    "Какие сроки запуска проекта?",
+    "Есть ли пробный период на 14 дней?",
+    "Работаете с Битрикс24 и amoCRM?",
+    "Нам нужен бот для поддержки, отвечать на вопросы о доставке.",
+    "Спасибо, подумаю и вернусь к вам в понедельник.",
+    "Сколько операторов можно разгрузить? У нас смена из 5 человек.",
+    "Покажите примеры кейсов в сфере недвижимости, пожалуйста.",
+    "ок",
+    "Да, интересно",
+]
+CONTACTS = [
+    "Мой телефон +7 (927) 678-34-54, звоните после 18:00",
+    "Запишите: 8 912 345 67 89, Анна",
+    "Пишите на ivan.petrov@mail.ru",
+    "Почта sales@example.com, телефон 8-800-555-35-35",
+    "Можно в WhatsApp +7 900 123 45 67",
+]
+
+
+def build_corpus(n: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        if rng.random() < 0.05:
+            corpus.append(rng.choice(CONTACTS))
+        else:
+            corpus.append(" ".join(rng.sample(QUESTIONS, rng.randint(1, 3))))
+    return corpus
+
+
+def reference_extract_contact_parts(text: str) -> list[str]:
+    """Исходная реализация: оба регулярных выражения на каждом сообщении, посимвольная нормализация."""
+    parts = []
+    seen = set()
+    for m in EMAIL_RE.finditer(text):
+        s = m.group(0).strip().lower()
+        if s and s not in seen:
+            seen.add(s)
+            parts.append(m.group(0).strip())
+    for m in PHONE_RE.finditer(text):
+        s = _normalize_contact(m.group(0))
+        if s and s not in seen:
+            seen.add(s)
+            parts.append(m.group(0).strip())
+    return parts
+
+
+def _timeit(fn, corpus: list[str]) -> float:
+    started = time.perf_counter()
+    for text in corpus:
+        fn(text)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    mismatches = sum(_extract_contact_parts(t) != reference_extract_contact_parts(t) for t in corpus)
+    assert mismatches == 0, f"{mismatches} расхождений с исходной реализацией"
+
+    size_mb = sum(len(t.encode("utf-8")) for t in corpus) / 1e6
+    for name, fn in (("reference", reference_extract_contact_parts), ("single-pass", _extract_contact_parts)):
+        elapsed = min(_timeit(fn, corpus) for _ in range(3))
+        print(f"{name:<12} {elapsed * 1000:8.1f} ms  {len(corpus) / elapsed:10.0f} msg/s  {size_mb / elapsed:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Бенчмарк истории диалога для LLM на диалогах из 10, 1 000 и 10 000 сообщений:
+полная история (как раньше) против хвоста с LIMIT и окна по бюджету токенов.
+
+Без флагов — только сборка контекста в памяти (время и размер тела запроса к LLM).
+С --db — дополнительно запросы к PostgreSQL из .env: в таблицу messages добавляются
+синтетические диалоги пользователя bench-context, после замера они удаляются.
+
+Запуск:
+    python -m benchmarks.bench_context_window
+    python -m benchmarks.bench_context_window --db
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.config import get_settings
+from app.context import build_context_window
+
+SIZES = (10, 1_000, 10_000)
+USER_ID = "bench-context"
+SAMPLE = "Подскажите, пожалуйста, сколько стоит внедрение ИИ-агента для отдела продаж?"
+
+
+def _dialog(n: int) -> list[dict[str, str]]:
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}. {SAMPLE}"} for i in range(n)]
+
+
+def _timeit(fn, repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def bench_memory() -> None:
+    settings = get_settings()
+    print(f"budget={settings.HISTORY_TOKEN_BUDGET} tokens, limit={settings.HISTORY_MAX_MESSAGES} messages")
+    for n in SIZES:
+        history = _dialog(n)
+        full = lambda: json.dumps(history, ensure_ascii=False)  # noqa: E731
+        tail = history[-settings.HISTORY_MAX_MESSAGES:]
+        window = lambda: json.dumps(  # noqa: E731
+            build_context_window(tail, settings.HISTORY_TOKEN_BUDGET, pinned=settings.HISTORY_PINNED_MESSAGES),
+            ensure_ascii=False,
+        )
+        print(
+            f"n={n:>6}  full: {_timeit(full):7.3f} ms {len(full().encode()):>9} B  |  "
+            f"window: {_timeit(window):7.3f} ms {len(window().encode()):>7} B"
+        )
+
+
+async def bench_db() -> None:
+    from sqlalchemy import delete, insert, select
+
+    from app.database import async_session_factory, engine
+    from app.models import Message
+    from app.routes.chat import _get_history
+
+    settings = get_settings()
+    now = datetime.now(timezone.utc)
+    async with async_session_factory() as session:
+        for n in SIZES:
+            dialog_id = f"dialog-{n}"
+            rows = [
+                {
+                    "user_id": USER_ID,
+                    "dialog_id": dialog_id,
+                    "role": m["role"],
+                    "content": m["content"],
+                    "created_at": now - timedelta(seconds=n - i),
+                }
+                for i, m in enumerate(_dialog(n))
+            ]
+            await session.execute(insert(Message), rows)
+        await session.commit()
+        try:
+            for n in SIZES:
+                dialog_id = f"dialog-{n}"
+                full_q = (
+                    select(Message.role, Message.content)
+                    .where(Message.user_id == USER_ID, Message.dialog_id == dialog_id)
+                    .order_by(Message.created_at)
+                )
+                best_full = best_window = float("inf")
+                for _ in range(10):
+                    t0 = time.perf_counter()
+                    (await session.execute(full_q)).all()
+                    best_full = min(best_full, time.perf_counter() - t0)
+                    t0 = time.perf_counter()
+                    await _get_history(session, USER_ID, dialog_id)
+                    best_window = min(best_window, time.perf_counter() - t0)
+                print(f"n={n:>6}  db full: {best_full * 1000:7.2f} ms  |  db tail+window: {best_window * 1000:7.2f} ms")
+        finally:
+            await session.execute(delete(Message).where(Message.user_id == USER_ID))
+            await session.commit()
+    await engine.dispose()
+    print(f"(limit={settings.HISTORY_MAX_MESSAGES})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", action="store_true", help="замерить также запросы к PostgreSQL")
+    args = parser.parse_args()
+    bench_memory()
+    if args.db:
+        asyncio.run(bench_db())
+
+
+if __name__ == "__main__":
+    main()
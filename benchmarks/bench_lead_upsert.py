@@ -0,0 +1,75 @@
+"""
+Микробенчмарк сохранения лида: прежний путь (SELECT лида, слияние контактов в Python, UPDATE/INSERT)
+против одного INSERT ... ON CONFLICT DO UPDATE.
+
+Нужен PostgreSQL из .env (с применёнными миграциями). Лиды пользователя bench-lead удаляются после замера.
+
+Запуск:
+    python -m benchmarks.bench_lead_upsert --iterations 2000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from sqlalchemy import delete, select
+
+from app.database import engine, session_scope
+from app.leads import _contact_keys, _extract_contact_parts, save_lead_if_contact
+from app.models import Lead
+
+USER_ID = "bench-lead"
+
+
+async def legacy_save_lead(db, user_id: str, dialog_id: str, user_message: str) -> bool:
+    """Прежняя реализация: два запроса и слияние в Python."""
+    new_parts = _extract_contact_parts(user_message)
+    if not new_parts:
+        return False
+    existing = (
+        await db.execute(select(Lead).where(Lead.user_id == user_id, Lead.dialog_id == dialog_id))
+    ).scalar_one_or_none()
+    now = datetime.now(timezone.utc)
+    if existing:
+        parts, keys = _contact_keys([*existing.contact_text.split(" | "), *new_parts])
+        merged = " | ".join(parts)
+        if merged == existing.contact_text:
+            return False
+        existing.contact_text = merged
+        existing.contact_keys = keys
+        existing.updated_at = now
+        await db.flush()
+        return True
+    parts, keys = _contact_keys(new_parts)
+    db.add(Lead(id=uuid4(), user_id=user_id, dialog_id=dialog_id, contact_text=" | ".join(parts),
+                contact_keys=keys, created_at=now, updated_at=now))
+    await db.flush()
+    return True
+
+
+async def _run(iterations: int, save) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        async with session_scope() as session:
+            # 10 диалогов, в каждом контакты накапливаются
+            await save(session, USER_ID, f"d{i % 10}", f"Мой номер 8 900 {i % 1000:03d} {i % 100:02d} 00")
+    return iterations / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    try:
+        for name, save in (("select+update", legacy_save_lead), ("on conflict", save_lead_if_contact)):
+            rate = await _run(args.iterations, save)
+            print(f"{name:<14} {rate:8.0f} saves/s")
+            async with session_scope() as session:
+                await session.execute(delete(Lead).where(Lead.user_id == USER_ID))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
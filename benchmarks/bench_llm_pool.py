@@ -0,0 +1,73 @@
+"""
+Бенчмарк TTFT (time to first token) stream_chat: общий пул соединений против нового клиента на каждый запрос.
+Поднимает локальный SSE-стаб benchmarks.llm_stub, совместимый с DeepSeek/OpenAI chat/completions.
+Стоимость установки соединения (TCP+TLS до внешнего API) имитируется задержкой --handshake-ms на каждое новое соединение.
+
+Запуск:
+    python -m benchmarks.bench_llm_pool --requests 200 --concurrency 10 --handshake-ms 80
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.llm_stub import StubConfig, start_stub
+
+TOKENS = ["Здравствуйте", "!", " Чем", " могу", " помочь", "?"]
+
+
+async def _measure(total: int, concurrency: int) -> list[float]:
+    from app.llm import stream_chat
+
+    ttft: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            first = True
+            async for _ in stream_chat([{"role": "user", "content": "Привет"}], system_prompt="bench"):
+                if first:
+                    ttft.append(time.perf_counter() - t0)
+                    first = False
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return ttft
+
+
+def _report(name: str, values: list[float]) -> None:
+    values = sorted(values)
+    p = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000  # noqa: E731
+    print(
+        f"{name:<12} n={len(values):<5} mean={statistics.mean(values) * 1000:7.2f} ms  "
+        f"p50={p(0.50):7.2f} ms  p95={p(0.95):7.2f} ms  p99={p(0.99):7.2f} ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--handshake-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    server = await start_stub(StubConfig(tokens=TOKENS, handshake_s=args.handshake_ms / 1000))
+    port = server.sockets[0].getsockname()[1]
+    os.environ["LLM_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("LLM_API_KEY", "bench")
+
+    from app import llm
+
+    async with server:
+        _report("no pool", await _measure(args.requests, args.concurrency))
+        await llm.init_llm_client()
+        try:
+            await _measure(args.concurrency, args.concurrency)  # прогрев пула
+            _report("pooled", await _measure(args.requests, args.concurrency))
+        finally:
+            await llm.close_llm_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Бенчмарк записи сообщений: транзакция на каждое сообщение (PERSIST_MODE=sync) против
+очереди write-behind с пакетной записью, в сообщениях в секунду.
+
+Нужен PostgreSQL из .env (с применёнными миграциями). Пишутся сообщения пользователя bench-persist,
+после замера удаляются.
+
+Запуск:
+    python -m benchmarks.bench_persistence --messages 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import delete
+
+from app.database import engine, session_scope
+from app.models import Message
+from app.persistence import MessageWriter, message_row, write_messages
+
+USER_ID = "bench-persist"
+
+
+async def _run(total: int, concurrency: int, write) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with sem:
+            await write(message_row(USER_ID, f"d{i % 100}", "user", f"Сообщение номер {i}"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--flush-interval-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    async def per_request(row: dict) -> None:
+        async with session_scope() as session:
+            await write_messages(session, [row])
+
+    try:
+        rate = await _run(args.messages, args.concurrency, per_request)
+        print(f"per-request commit:              {rate:9.0f} msg/s")
+        for wait in (True, False):
+            writer = MessageWriter(args.batch_size, args.flush_interval_ms / 1000, wait, max_queue=args.messages)
+            writer.start()
+            started = time.perf_counter()
+            await _run(args.messages, args.concurrency, lambda row: writer.submit([row]))
+            await writer.stop()
+            rate = args.messages / (time.perf_counter() - started)
+            mode = "wait_for_flush" if wait else "fire-and-forget"
+            print(f"write-behind ({mode:<15}): {rate:9.0f} msg/s in {writer.batches} batches")
+    finally:
+        async with session_scope() as session:
+            await session.execute(delete(Message).where(Message.user_id == USER_ID))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
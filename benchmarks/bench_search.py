@@ -0,0 +1,114 @@
+"""
+Бенчмарк поиска по сообщениям (/api/admin/search): латентность p50/p95 запроса страницы
+для редкого и частого слова, фразы, фильтра по роли и второй страницы по курсору.
+
+Нужен PostgreSQL из .env (с применёнными миграциями). Скрипт добавляет --rows синтетических сообщений
+пользователя bench-search (русские и английские слова, даты за последние 180 дней) и удаляет их после
+замера (--keep — оставить для повторных прогонов с --rows 0).
+
+Запуск:
+    python -m benchmarks.bench_search --rows 1000000 --repeat 20
+    python -m benchmarks.bench_search --rows 20000000 --keep   # десятки миллионов строк
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import delete, text
+
+from app.database import engine, session_scope
+from app.models import Message
+from app.search import cursor_key, search_messages
+
+USER_ID = "bench-search"
+BATCH = 1_000_000
+
+# Частые слова повторяются в словаре, редкие встречаются по разу
+_WORDS = (
+    "доставка доставка доставка заказ заказ цена цена оплата оплата возврат гарантия скидка "
+    "курьер склад менеджер телефон почта адрес самовывоз рассрочка delivery delivery order order "
+    "price refund invoice warranty discount courier manager support шестерёнка kaleidoscope"
+).split()
+
+_FILL = text(
+    """
+    INSERT INTO messages (id, user_id, dialog_id, role, content, created_at)
+    SELECT gen_random_uuid(), :user_id, 'd' || (g % 100000),
+           CASE WHEN g % 2 = 0 THEN 'user' ELSE 'assistant' END,
+           array_to_string(ARRAY(
+               SELECT (CAST(:words AS text[]))[1 + floor(random() * cardinality(CAST(:words AS text[])))::int]
+               FROM generate_series(1, 8 + g % 24)
+           ), ' '),
+           now() - random() * interval '180 days'
+    FROM generate_series(:start, :stop) g
+    """
+)
+
+QUERIES = {
+    "rare word": {"q": "шестерёнка"},
+    "common word": {"q": "доставка"},
+    "phrase": {"q": '"delivery order"'},
+    "two langs": {"q": "refund or возврат"},
+    "role=user": {"q": "скидка", "role": "user"},
+}
+
+
+async def _fill(rows: int) -> None:
+    for start in range(1, rows + 1, BATCH):
+        stop = min(start + BATCH - 1, rows)
+        async with session_scope() as session:
+            await session.execute(_FILL, {"user_id": USER_ID, "words": _WORDS, "start": start, "stop": stop})
+        print(f"  inserted {stop}/{rows}")
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE messages"))
+
+
+async def _measure(params: dict, repeat: int, limit: int, order: str) -> tuple[list[float], list[float]]:
+    first, second = [], []
+    for _ in range(repeat):
+        async with session_scope() as session:
+            started = time.perf_counter()
+            rows = (await session.execute(search_messages(limit=limit, order=order, **params))).all()
+            first.append((time.perf_counter() - started) * 1000)
+            if len(rows) == limit:
+                started = time.perf_counter()
+                after = cursor_key(rows[-1], order)
+                await session.execute(search_messages(limit=limit, order=order, after=after, **params))
+                second.append((time.perf_counter() - started) * 1000)
+    return first, second
+
+
+def _fmt(samples: list[float]) -> str:
+    if not samples:
+        return "        -"
+    p95 = statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else samples[0]
+    return f"{statistics.median(samples):6.1f}/{p95:6.1f}"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+    try:
+        if args.rows:
+            print(f"Filling {args.rows} messages...")
+            await _fill(args.rows)
+        print(f"{'query':<12} {'order':<7} {'page1 p50/p95 ms':>17} {'page2 p50/p95 ms':>17}")
+        for name, params in QUERIES.items():
+            for order in ("rank", "recent"):
+                first, second = await _measure(params, args.repeat, args.limit, order)
+                print(f"{name:<12} {order:<7} {_fmt(first):>17} {_fmt(second):>17}")
+    finally:
+        if not args.keep:
+            async with session_scope() as session:
+                await session.execute(delete(Message).where(Message.user_id == USER_ID))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
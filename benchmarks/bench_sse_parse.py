@@ -0,0 +1,137 @@
+"""
+Микробенчмарк разбора потока LLM в МБ/с: прежний путь (aiter_lines, str, json.loads на каждую строку)
+против байтового разбора app.sse (aiter_bytes, фильтр по "content", orjson при наличии).
+Поток — события chat/completions с короткими фрагментами, нарезанный на сетевые куски по --chunk-bytes.
+Отдельно — число событий SSE на ответ клиенту без склейки фрагментов и с окном SSE_COALESCE_MS/BYTES.
+
+Запуск:
+    python -m benchmarks.bench_sse_parse --mb 20 --chunk-bytes 1024
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from app import sse
+from app.sse import coalesce, delta_content, is_done, iter_sse_data, sse_event
+
+TOKENS = ["Здравствуйте", "!", " Чем", " могу", " помочь", "?", " Уточните", ",", " пожалуйста", "."]
+
+
+def _payload(size: int) -> bytes:
+    events = [b'data: {"id":"c1","object":"chat.completion.chunk","choices":[{"index":0,"delta":{"role":"assistant"}}]}\n\n']
+    for i, token in enumerate(TOKENS * (size // 900 + 1)):
+        event = {
+            "id": "c1",
+            "object": "chat.completion.chunk",
+            "created": 1700000000 + i,
+            "model": "deepseek-chat",
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        }
+        events.append(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+    events.append(b"data: [DONE]\n\n")
+    return b"".join(events)
+
+
+def _response(payload: bytes, chunk_bytes: int) -> httpx.Response:
+    async def body():
+        for i in range(0, len(payload), chunk_bytes):
+            yield payload[i : i + chunk_bytes]
+
+    return httpx.Response(200, content=body())
+
+
+async def _lines_json(response: httpx.Response) -> int:
+    """Прежняя реализация stream_chat."""
+    n = 0
+    done = False
+    async for line in response.aiter_lines():
+        if done or not line or line.strip() != line:
+            continue
+        if line.startswith("data: "):
+            data = line[6:].strip()
+            if data == "[DONE]":
+                done = True
+                continue
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                n += 1
+    return n
+
+
+async def _bytes(response: httpx.Response) -> int:
+    n = 0
+    done = False
+    async for batch in iter_sse_data(response.aiter_bytes()):
+        if done:
+            continue
+        for data in batch:
+            if is_done(data):
+                done = True
+                break
+            if delta_content(data):
+                n += 1
+    return n
+
+
+async def _measure(name: str, parse, payload: bytes, chunk_bytes: int, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        response = _response(payload, chunk_bytes)
+        started = time.perf_counter()
+        tokens = await parse(response)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<28} {len(payload) / best / 1e6:8.1f} MB/s  ({tokens} tokens, best of {repeat})")
+
+
+async def _coalescing(tokens: int, gap_s: float, window_s: float, max_bytes: int) -> None:
+    """Сколько событий SSE (отправок ASGI) уходит клиенту на ответ с окном склейки и без."""
+
+    async def upstream():
+        for i in range(tokens):
+            await asyncio.sleep(gap_s)
+            yield TOKENS[i % len(TOKENS)]
+
+    started = time.perf_counter()
+    events = [sse_event(c) async for c in coalesce(upstream(), window_s, max_bytes)]
+    elapsed = time.perf_counter() - started
+    print(
+        f"coalesce {window_s * 1000:4.0f} ms/{max_bytes:<5} {tokens} tokens -> {len(events)} events "
+        f"({sum(map(len, events))} bytes, {elapsed:.2f}s)"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=20.0)
+    parser.add_argument("--chunk-bytes", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tokens", type=int, default=300, help="токенов в ответе для замера склейки")
+    parser.add_argument("--gap-ms", type=float, default=5.0, help="интервал между токенами апстрима")
+    parser.add_argument("--window-ms", type=float, default=30.0, help="окно склейки SSE_COALESCE_MS")
+    args = parser.parse_args()
+
+    payload = _payload(int(args.mb * 1e6))
+    await _measure("aiter_lines + json", _lines_json, payload, args.chunk_bytes, args.repeat)
+    loads = sse._loads
+    sse._loads = sse._json_loads
+    await _measure("aiter_bytes + json", _bytes, payload, args.chunk_bytes, args.repeat)
+    sse._loads = loads
+    if loads is not sse._json_loads:
+        await _measure("aiter_bytes + orjson", _bytes, payload, args.chunk_bytes, args.repeat)
+    await _coalescing(args.tokens, args.gap_ms / 1000, 0.0, 0)
+    await _coalescing(args.tokens, args.gap_ms / 1000, args.window_ms / 1000, 0)
+    await _coalescing(args.tokens, args.gap_ms / 1000, args.window_ms / 1000, 64)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""
+Локальный стаб LLM, совместимый с DeepSeek/OpenAI chat/completions (stream=True): отвечает SSE-потоком
+с настраиваемым временем до первого токена, скоростью, размером фрагментов и внедрением ошибок/зависаний.
+Поведение детерминировано (--seed): одинаковые параметры дают одинаковые ответы и одинаковые сбои.
+
+Приложение переключается на стаб через LLM_URL:
+    python -m benchmarks.llm_stub --port 8081 --ttft-ms 300 --tokens-per-sec 40 --error-rate 0.01
+    LLM_URL=http://127.0.0.1:8081 uvicorn app.main:app
+
+В docker-compose — профиль loadtest (сервис llm-stub, LLM_URL=http://llm-stub:8081).
+"""
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import dataclass, field
+
+WORDS = ["Здравствуйте", "!", " Чем", " могу", " помочь", "?", " Уточните", ",", " пожалуйста", ",", " детали", "."]
+
+
+@dataclass
+class StubConfig:
+    """Параметры стаба. tokens задаёт ответ явно; иначе ответ — reply_tokens слов из WORDS по кругу."""
+
+    ttft_s: float = 0.0
+    tokens_per_sec: float = 0.0
+    reply_tokens: int = 50
+    chunk_tokens: int = 1
+    handshake_s: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    timeout_rate: float = 0.0
+    seed: int = 0
+    tokens: list[str] | None = None
+    rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.rng = random.Random(self.seed)
+
+    def reply(self) -> list[str]:
+        """Фрагменты content ответа: по chunk_tokens слов в одном SSE-событии."""
+        tokens = self.tokens or [WORDS[i % len(WORDS)] for i in range(self.reply_tokens)]
+        step = max(1, self.chunk_tokens)
+        return ["".join(tokens[i : i + step]) for i in range(0, len(tokens), step)]
+
+
+def _chunk(payload: bytes) -> bytes:
+    return f"{len(payload):x}\r\n".encode() + payload + b"\r\n"
+
+
+async def _read_request(reader: asyncio.StreamReader) -> bool:
+    """Читает один HTTP/1.1 запрос (строка, заголовки, тело по Content-Length). False — соединение закрыто."""
+    request_line = await reader.readline()
+    if not request_line:
+        return False
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    if length:
+        await reader.readexactly(length)
+    return True
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, config: StubConfig) -> None:
+    """
+    Минимальный HTTP/1.1 keep-alive сервер: на каждый POST отвечает SSE-потоком (chunked).
+    handshake_s имитирует установку нового соединения (TCP+TLS до внешнего API).
+    """
+    await asyncio.sleep(config.handshake_s)
+    try:
+        while await _read_request(reader):
+            roll = config.rng.random()
+            if roll < config.error_rate:
+                body = json.dumps({"error": {"message": "stub error", "type": "server_error"}}).encode()
+                writer.write(
+                    f"HTTP/1.1 {config.error_status} Error\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+                continue
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/event-stream\r\n"
+                b"Transfer-Encoding: chunked\r\n"
+                b"Connection: keep-alive\r\n\r\n"
+            )
+            await writer.drain()
+            if roll < config.error_rate + config.timeout_rate:
+                # Зависший апстрим: заголовки отданы, токенов нет, пока клиент не закроет соединение по read timeout
+                await reader.read()
+                return
+            if config.ttft_s:
+                await asyncio.sleep(config.ttft_s)
+            delay = 1 / config.tokens_per_sec if config.tokens_per_sec else 0.0
+            for i, content in enumerate(config.reply()):
+                if delay and i:
+                    await writer.drain()
+                    await asyncio.sleep(delay * max(1, config.chunk_tokens))
+                event = {"choices": [{"index": 0, "delta": {"content": content}}]}
+                writer.write(_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")))
+            writer.write(_chunk(b"data: [DONE]\n\n") + b"0\r\n\r\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_stub(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+    """Запускает стаб; фактический порт — server.sockets[0].getsockname()[1]."""
+    return await asyncio.start_server(lambda r, w: handle_connection(r, w, config), host, port)
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """Параметры стаба в командной строке (общие для стаба и нагрузочного теста)."""
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="задержка до первого токена")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="скорость выдачи (0 — без задержек)")
+    parser.add_argument("--reply-tokens", type=int, default=50, help="токенов в ответе")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="токенов в одном SSE-событии")
+    parser.add_argument("--handshake-ms", type=float, default=0.0, help="задержка на каждое новое соединение")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой HTTP")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="доля зависших ответов (без токенов)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def stub_config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        ttft_s=args.ttft_ms / 1000,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        chunk_tokens=args.chunk_tokens,
+        handshake_s=args.handshake_ms / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = await start_stub(stub_config_from_args(args), args.host, args.port)
+    print(f"LLM stub listening on http://{args.host}:{args.port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
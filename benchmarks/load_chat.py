@@ -0,0 +1,234 @@
+"""
+Сквозной нагрузочный тест POST /api/chat: N одновременных пользователей ведут многоходовые диалоги,
+LLM — локальный стаб benchmarks.llm_stub. Отчёт: TTFT p50/p95/p99 (до первого SSE-события у клиента),
+токенов/с на стрим и суммарно, ошибки по статусам, состояние пула БД (по /metrics во время теста).
+
+По умолчанию приложение поднимается в процессе (uvicorn на свободном порту) вместе со встроенным стабом; нужен
+PostgreSQL из .env с применёнными миграциями (например, `docker-compose up -d postgres` и `alembic upgrade head`).
+Данные пишутся пользователям load-<run>-*, после теста удаляются (--keep — оставить).
+
+С --url нагружается уже запущенное приложение, LLM_URL которого указывает на стаб
+(`docker-compose --profile loadtest up` с LLM_URL=http://llm-stub:8081); параметры стаба тогда задаются при его запуске.
+
+Запуск:
+    python -m benchmarks.load_chat --users 50 --turns 3 --ttft-ms 300 --tokens-per-sec 40
+    python -m benchmarks.load_chat --url http://localhost:8000 --users 200 --turns 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+import httpx
+
+from benchmarks.llm_stub import add_stub_arguments, start_stub, stub_config_from_args
+
+MESSAGES = [
+    "Привет! Расскажите, чем вы занимаетесь?",
+    "Сколько стоит подключение?",
+    "А есть скидки для небольших компаний?",
+    "Как с вами связаться? Мой телефон +7 900 123-45-67",
+    "Спасибо, жду звонка.",
+]
+
+
+@dataclass
+class Results:
+    ttft: list[float] = field(default_factory=list)
+    stream_rates: list[float] = field(default_factory=list)
+    tokens: int = 0
+    turns: int = 0
+    errors: Counter = field(default_factory=Counter)
+    pool_peak: dict[str, float] = field(default_factory=dict)
+
+
+async def _turn(client: httpx.AsyncClient, results: Results, user_id: str, message: str) -> None:
+    started = time.perf_counter()
+    first = last = 0.0
+    tokens = 0
+    done = False
+    try:
+        async with client.stream(
+            "POST", "/api/chat", json={"user_id": user_id, "message": message, "dialog_id": "load"}
+        ) as response:
+            if response.status_code != 200:
+                results.errors[str(response.status_code)] += 1
+                await response.aread()
+                return
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if line == "data: [DONE]":
+                    done = True
+                    continue
+                last = time.perf_counter()
+                if not tokens:
+                    first = last
+                tokens += 1
+    except httpx.HTTPError as e:
+        results.errors[type(e).__name__] += 1
+        return
+    if not done:
+        # Заголовки 200 уже отданы, поток оборвался (ошибка LLM после начала ответа)
+        results.errors["incomplete"] += 1
+        return
+    results.turns += 1
+    results.tokens += tokens
+    if tokens:
+        results.ttft.append(first - started)
+    if tokens > 1 and last > first:
+        results.stream_rates.append((tokens - 1) / (last - first))
+
+
+async def _user(client: httpx.AsyncClient, results: Results, user_id: str, turns: int, think_s: float) -> None:
+    for i in range(turns):
+        await _turn(client, results, user_id, MESSAGES[i % len(MESSAGES)])
+        if think_s:
+            await asyncio.sleep(think_s)
+
+
+def _parse_metrics(text: str) -> dict[str, float]:
+    """Сэмплы без меток (db_pool_checked_out 3) из текстового формата Prometheus."""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "{" in line:
+            continue
+        name, _, value = line.partition(" ")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+async def _fetch_metrics(client: httpx.AsyncClient) -> dict[str, float]:
+    try:
+        token = os.environ.get("METRICS_TOKEN", "")
+        r = await client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+    except httpx.HTTPError:
+        return {}
+    return _parse_metrics(r.text) if r.status_code == 200 else {}
+
+
+async def _sample_pool(client: httpx.AsyncClient, results: Results, interval_s: float) -> None:
+    """Пиковые значения gauge пула БД во время теста."""
+    while True:
+        for name, value in (await _fetch_metrics(client)).items():
+            if name in ("db_pool_checked_out", "db_pool_overflow"):
+                results.pool_peak[name] = max(results.pool_peak.get(name, 0), value)
+        await asyncio.sleep(interval_s)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def _report(args: argparse.Namespace, results: Results, elapsed: float, before: dict, after: dict) -> None:
+    ms = lambda v: f"{v * 1000:8.1f} ms"  # noqa: E731
+    print(f"users={args.users} turns={args.turns} wall={elapsed:.2f}s turns/s={results.turns / elapsed:.1f}")
+    print(
+        f"TTFT          p50={ms(_percentile(results.ttft, 0.50))} p95={ms(_percentile(results.ttft, 0.95))} "
+        f"p99={ms(_percentile(results.ttft, 0.99))}"
+    )
+    rate = statistics.median(results.stream_rates) if results.stream_rates else float("nan")
+    print(f"tokens/s      per stream (median)={rate:8.1f}  total={results.tokens / elapsed:8.1f}")
+    failed = sum(results.errors.values())
+    print(f"errors        {failed} of {failed + results.turns}  {dict(results.errors) or ''}")
+    if not after:
+        print("db pool       n/a (/metrics недоступен, METRICS_ENABLED=false или не задан METRICS_TOKEN)")
+        return
+    waits = after.get("db_pool_wait_seconds_count", 0) - before.get("db_pool_wait_seconds_count", 0)
+    wait_sum = after.get("db_pool_wait_seconds_sum", 0) - before.get("db_pool_wait_seconds_sum", 0)
+    timeouts = after.get("db_pool_timeouts_total", 0) - before.get("db_pool_timeouts_total", 0)
+    print(
+        f"db pool       size={after.get('db_pool_size', 0):.0f} "
+        f"peak checked out={results.pool_peak.get('db_pool_checked_out', 0):.0f} "
+        f"peak overflow={results.pool_peak.get('db_pool_overflow', 0):.0f} "
+        f"checkouts={waits:.0f} mean wait={(wait_sum / waits * 1000 if waits else 0):.2f} ms timeouts={timeouts:.0f}"
+    )
+
+
+async def _run(client: httpx.AsyncClient, args: argparse.Namespace, run_id: str) -> None:
+    results = Results()
+    before = await _fetch_metrics(client)
+    sampler = asyncio.create_task(_sample_pool(client, results, args.sample_ms / 1000))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(_user(client, results, f"load-{run_id}-{i}", args.turns, args.think_ms / 1000) for i in range(args.users))
+        )
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - started
+    _report(args, results, elapsed, before, await _fetch_metrics(client))
+
+
+async def _cleanup(run_id: str) -> None:
+    from sqlalchemy import delete
+
+    from app.database import session_scope
+    from app.models import ChatSession, Lead, Message
+
+    pattern = f"load-{run_id}-%"
+    async with session_scope() as session:
+        for model in (Message, Lead, ChatSession):
+            await session.execute(delete(model).where(model.user_id.like(pattern)))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="одновременных пользователей")
+    parser.add_argument("--turns", type=int, default=3, help="ходов диалога на пользователя")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="пауза пользователя между ходами")
+    parser.add_argument("--url", help="нагружать запущенное приложение вместо поднятия в процессе")
+    parser.add_argument("--sample-ms", type=float, default=200.0, help="период опроса /metrics")
+    parser.add_argument("--keep", action="store_true", help="не удалять данные load-* после теста")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    timeout = httpx.Timeout(None)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits) as client:
+            await _run(client, args, run_id)
+        return
+
+    server = await start_stub(stub_config_from_args(args))
+    os.environ["LLM_URL"] = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    os.environ.setdefault("LLM_API_KEY", "load")
+    os.environ.setdefault("METRICS_TOKEN", "load")
+
+    import uvicorn
+
+    from app.main import app
+
+    # Настоящий HTTP-сервер, а не ASGITransport: тот буферизует тело ответа целиком, и TTFT не измерить
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    uv = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    async with server:
+        serving = asyncio.create_task(uv.serve(sockets=[sock]))
+        while not uv.started:
+            if serving.done():
+                return await serving
+            await asyncio.sleep(0.05)
+        base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+                await _run(client, args, run_id)
+        finally:
+            if not args.keep:
+                await _cleanup(run_id)
+            uv.should_exit = True
+            await serving
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Нагрузочный тест: число одновременных SSE-стримов /api/chat не ограничено размером пула БД.
+Пул намеренно маленький (DB_POOL_SIZE=2, DB_MAX_OVERFLOW=0), LLM — локальный медленный стаб.
+Если бы сессия БД удерживалась на время стрима, N стримов по T секунд шли бы волнами по 2
+и заняли бы ~N/2*T; при коротких транзакциях все N идут одновременно и укладываются в ~T.
+
+Нужен PostgreSQL из .env (с применёнными миграциями). Данные пишутся пользователям load-*.
+
+Запуск:
+    python -m benchmarks.load_concurrent_streams --streams 20 --stream-seconds 2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--stream-seconds", type=float, default=2.0)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    from benchmarks.bench_llm_pool import TOKENS
+    from benchmarks.llm_stub import StubConfig, start_stub
+
+    server = await start_stub(StubConfig(tokens=TOKENS, tokens_per_sec=len(TOKENS) / args.stream_seconds))
+    os.environ["LLM_URL"] = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    os.environ["HISTORY_CACHE_ENABLED"] = "false"
+
+    import httpx
+    from sqlalchemy import delete
+
+    from app.database import engine, session_scope
+    from app.main import app
+    from app.models import Lead, Message
+    from app.routes import chat as chat_module
+
+    in_flight = 0
+    peak_streams = 0
+    peak_checked_out = 0
+    original_stream_chat = chat_module.stream_chat
+
+    async def counting_stream_chat(*a, **kw):
+        nonlocal in_flight, peak_streams, peak_checked_out
+        in_flight += 1
+        peak_streams = max(peak_streams, in_flight)
+        try:
+            async for chunk in original_stream_chat(*a, **kw):
+                peak_checked_out = max(peak_checked_out, engine.pool.checkedout())
+                yield chunk
+        finally:
+            in_flight -= 1
+
+    chat_module.stream_chat = counting_stream_chat
+
+    async def one(client: httpx.AsyncClient, i: int) -> None:
+        r = await client.post("/api/chat", json={"user_id": f"load-{i}", "message": "Привет", "dialog_id": "load"})
+        r.raise_for_status()
+
+    async with server, app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(one(client, i) for i in range(args.streams)))
+            elapsed = time.perf_counter() - started
+        async with session_scope() as session:
+            await session.execute(delete(Message).where(Message.user_id.like("load-%")))
+            await session.execute(delete(Lead).where(Lead.user_id.like("load-%")))
+
+    bound = args.streams / args.pool_size * args.stream_seconds
+    print(f"streams={args.streams} pool_size={args.pool_size} stream={args.stream_seconds:.1f}s")
+    print(f"peak concurrent streams: {peak_streams}")
+    print(f"peak pool checked out during streaming: {peak_checked_out}")
+    print(f"wall time: {elapsed:.2f}s (session held for the stream would need >= {bound:.1f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -91,9 +91,101 @@
   }
 
   var MAX_MESSAGE_LENGTH = 1000;
+  var RESUME_ATTEMPTS = 3;
+  var RESUME_DELAY_MS = 1000;
   var MAX_LENGTH_MSG = 'Размер сообщения ограничен 1000 символами.';
   var MAX_LENGTH_BOT_REPLY = 'Сообщение превышает допустимый размер (1000 символов). Сократите текст и отправьте снова.';
 
+  // Вывод ответа «печатной машинкой»: фрагменты копятся и выводятся по несколько символов
+  function startTypewriter(botEl) {
+    var streamedText = '';
+    var pendingBuffer = '';
+    var streamEnded = false;
+    var typewriterMs = 18;
+    var typewriterCharsPerTick = 2;
+
+    function drainTypewriter() {
+      if (pendingBuffer.length === 0) {
+        if (streamEnded) clearInterval(typewriterInterval);
+        return;
+      }
+      var take = Math.min(typewriterCharsPerTick, pendingBuffer.length);
+      streamedText += pendingBuffer.slice(0, take);
+      pendingBuffer = pendingBuffer.slice(take);
+      botEl.text.innerHTML = formatBold(streamedText);
+      chatBody.scrollTo({ top: chatBody.scrollHeight, behavior: 'smooth' });
+    }
+
+    var typewriterInterval = setInterval(drainTypewriter, typewriterMs);
+    return {
+      append: function (chunk) { pendingBuffer += chunk; },
+      end: function () {
+        streamEnded = true;
+        if (pendingBuffer.length === 0) clearInterval(typewriterInterval);
+      },
+      stop: function () { clearInterval(typewriterInterval); },
+    };
+  }
+
+  // WebSocket-транспорт (/api/ws/chat): одно соединение на все сообщения диалога.
+  // Если соединение не открылось, страница отправляет сообщения через POST /api/chat (SSE)
+  var socket = null;
+  var socketFailed = false;
+  var socketHandler = null;
+
+  function openSocket() {
+    if (socketFailed || typeof WebSocket === 'undefined') return Promise.resolve(null);
+    if (socket && socket.readyState === WebSocket.OPEN) return Promise.resolve(socket);
+    return new Promise(function (resolve) {
+      var proto = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+      var ws = new WebSocket(proto + '//' + window.location.host + '/api/ws/chat?user_id=' + encodeURIComponent(userId) + '&dialog_id=' + encodeURIComponent(sessionId));
+      var opened = false;
+      ws.onopen = function () {
+        opened = true;
+        socket = ws;
+        resolve(ws);
+      };
+      ws.onmessage = function (e) {
+        if (socketHandler) socketHandler(JSON.parse(e.data));
+      };
+      ws.onclose = function () {
+        if (socket === ws) socket = null;
+        if (!opened) {
+          socketFailed = true;
+          resolve(null);
+        } else if (socketHandler) {
+          socketHandler({ type: 'error', detail: 'Соединение прервано' });
+        }
+      };
+    });
+  }
+
+  function sendViaSocket(ws, text, botEl) {
+    return new Promise(function (resolve) {
+      var typewriter = null;
+      botEl.wrap.classList.remove('thinking');
+      botEl.text.innerHTML = '';
+      socketHandler = function (frame) {
+        if (frame.type === 'chunk') {
+          if (!typewriter) typewriter = startTypewriter(botEl);
+          typewriter.append(frame.text);
+          return;
+        }
+        socketHandler = null;
+        if (frame.type === 'error') {
+          if (typewriter) typewriter.stop();
+          var errMsg = frame.status === 422 ? MAX_LENGTH_BOT_REPLY : toDisplayableError(frame.detail);
+          botEl.text.textContent = errMsg;
+          errorEl.textContent = frame.status === 422 ? MAX_LENGTH_MSG : errMsg;
+        } else if (typewriter) {
+          typewriter.end();
+        }
+        resolve();
+      };
+      ws.send(JSON.stringify({ type: 'message', message: text }));
+    });
+  }
+
   async function handleSend(e) {
     e.preventDefault();
     const text = messageInput.value.trim();
@@ -121,6 +213,7 @@
     chatBody.scrollTo({ top: chatBody.scrollHeight, behavior: 'smooth' });
 
     sendBtn.disabled = true;
+    var typewriter = null;
 
     try {
       if (text.length > MAX_MESSAGE_LENGTH) {
@@ -130,6 +223,11 @@
         sendBtn.disabled = false;
         return;
       }
+      var ws = await openSocket();
+      if (ws) {
+        await sendViaSocket(ws, text, botEl);
+        return;
+      }
       const res = await fetch('/api/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
@@ -153,54 +251,65 @@
         return;
       }
 
-      var streamedText = '';
-      var pendingBuffer = '';
-      var streamEnded = false;
-      var typewriterMs = 18;
-      var typewriterCharsPerTick = 2;
+      typewriter = startTypewriter(botEl);
 
-      function appendChunk(chunk) {
-        pendingBuffer += chunk;
-      }
+      // Возобновляемый ответ (SSE_RESUME_ENABLED): id генерации и последнего события для переподключения
+      var generationId = res.headers.get('X-Generation-Id');
+      var lastEventId = '';
+      var gotDone = false;
 
-      function drainTypewriter() {
-        if (pendingBuffer.length === 0) {
-          if (streamEnded) clearInterval(typewriterInterval);
-          return;
+      async function readEvents(response) {
+        const reader = response.body.getReader();
+        const dec = new TextDecoder();
+        let buffer = '';
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += dec.decode(value, { stream: true });
+          const lines = buffer.split('\n');
+          buffer = lines.pop() || '';
+          for (const line of lines) {
+            if (line.startsWith('id: ')) {
+              lastEventId = line.slice(4).replace(/\r$/, '');
+            } else if (line.startsWith('data: ')) {
+              var data = line.slice(6).replace(/\r?\n$/, '');
+              if (data.trim() === '[DONE]') {
+                gotDone = true;
+                continue;
+              }
+              typewriter.append(data);
+            }
+          }
         }
-        var take = Math.min(typewriterCharsPerTick, pendingBuffer.length);
-        streamedText += pendingBuffer.slice(0, take);
-        pendingBuffer = pendingBuffer.slice(take);
-        botEl.text.innerHTML = formatBold(streamedText);
-        chatBody.scrollTo({ top: chatBody.scrollHeight, behavior: 'smooth' });
       }
 
-      var typewriterInterval = setInterval(drainTypewriter, typewriterMs);
-
-      const reader = res.body.getReader();
-      const dec = new TextDecoder();
-      let buffer = '';
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-        buffer += dec.decode(value, { stream: true });
-        const lines = buffer.split('\n');
-        buffer = lines.pop() || '';
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            var data = line.slice(6).replace(/\r?\n$/, '');
-            if (data.trim() === '[DONE]') continue;
-            appendChunk(data);
-          }
+      var readError = null;
+      try {
+        await readEvents(res);
+      } catch (err) {
+        readError = err;
+      }
+      // Соединение оборвалось до [DONE]: дочитываем ответ с места обрыва (Last-Event-ID)
+      for (var attempt = 1; !gotDone && generationId && attempt <= RESUME_ATTEMPTS; attempt++) {
+        await new Promise(function (resolve) { setTimeout(resolve, RESUME_DELAY_MS * attempt); });
+        try {
+          var resumed = await fetch('/api/chat/' + encodeURIComponent(generationId) + '/stream?user_id=' + encodeURIComponent(userId), {
+            headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+          });
+          if (!resumed.ok) break;
+          readError = null;
+          await readEvents(resumed);
+        } catch (err) {
+          readError = err;
         }
       }
-      streamEnded = true;
-      if (pendingBuffer.length === 0) clearInterval(typewriterInterval);
+      if (readError && !gotDone) throw readError;
+      typewriter.end();
     } catch (err) {
       botEl.wrap.classList.remove('thinking');
       botEl.text.textContent = 'Ошибка: ' + (err.message || 'сеть');
       errorEl.textContent = err.message || 'Ошибка запроса';
-      if (typeof typewriterInterval !== 'undefined') clearInterval(typewriterInterval);
+      if (typewriter) typewriter.stop();
     } finally {
       sendBtn.disabled = false;
       chatBody.scrollTo({ top: chatBody.scrollHeight, behavior: 'smooth' });
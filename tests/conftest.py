@@ -1,3 +1,14 @@
 """
 Общие фикстуры для тестов.
 """
+import pytest
+
+from app.config import get_settings
+
+
+@pytest.fixture(autouse=True)
+def _fresh_settings():
+    """Settings мемоизирован — каждый тест читает переменные окружения заново."""
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
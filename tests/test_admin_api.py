@@ -0,0 +1,158 @@
+"""
+Тесты админ API: доступ по ключу, keyset-курсор (X-Next-Cursor), поиск, потоковая выгрузка NDJSON/CSV.
+БД подменяется моками.
+"""
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from uuid import UUID, uuid4
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.dialects import postgresql
+
+from app.database import get_db
+from app.main import app
+from app.routes import admin
+from app.routes.admin import _decode_cursor, _encode_cursor
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("ADMIN_KEY", "secret")
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test", headers={"X-Admin-Key": "secret"})
+
+
+@pytest.fixture
+def db_rows():
+    """Строки, которые вернёт следующий SELECT через get_db."""
+    rows: list = []
+    session = MagicMock()
+    result = MagicMock()
+    result.all.side_effect = lambda: rows
+    result.scalars.return_value.all.side_effect = lambda: rows
+    session.execute = AsyncMock(return_value=result)
+
+    async def override():
+        yield session
+
+    app.dependency_overrides[get_db] = override
+    yield rows, session
+    app.dependency_overrides.pop(get_db, None)
+
+
+def test_cursor_roundtrip():
+    at = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert _decode_cursor(_encode_cursor(at, "u1", "d1"), datetime, str, str) == (at, "u1", "d1")
+
+
+@pytest.mark.asyncio
+async def test_admin_requires_key(client):
+    r = await client.get("/api/admin/sessions", headers={"X-Admin-Key": "wrong"})
+    assert r.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_is_400(client, db_rows):
+    r = await client.get("/api/admin/sessions", params={"after": "not-a-cursor"})
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_sessions_full_page_returns_next_cursor(client, db_rows):
+    rows, session = db_rows
+    at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows.extend(
+        SimpleNamespace(user_id=f"u{i}", dialog_id="d", first_at=at, last_at=at, message_count=2, has_lead=False)
+        for i in range(2)
+    )
+    r = await client.get("/api/admin/sessions", params={"limit": 2})
+    assert r.status_code == 200
+    assert [s["user_id"] for s in r.json()] == ["u0", "u1"]
+    assert _decode_cursor(r.headers["X-Next-Cursor"], datetime, str, str) == (at, "u1", "d")
+
+    r = await client.get("/api/admin/sessions", params={"limit": 3, "after": r.headers["X-Next-Cursor"]})
+    assert "X-Next-Cursor" not in r.headers
+    sql = str(session.execute.await_args.args[0])
+    assert "FROM sessions" in sql
+    assert "GROUP BY" not in sql
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+async def test_export_leads_streams_partitions(client, monkeypatch, fmt):
+    at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def partitions():
+        yield [("id1", "u1", "d1", "a@b.ru", at, at)]
+        yield [("id2", "u2", "d2", "8 900 000 00 00", at, at)]
+
+    stream_result = MagicMock()
+    stream_result.partitions = partitions
+
+    @asynccontextmanager
+    async def fake_scope():
+        session = MagicMock()
+        session.stream = AsyncMock(return_value=stream_result)
+        yield session
+
+    monkeypatch.setattr(admin, "session_scope", fake_scope)
+    r = await client.get("/api/admin/export/leads", params={"format": fmt})
+    assert r.status_code == 200
+    lines = r.text.strip().splitlines()
+    if fmt == "ndjson":
+        assert [json.loads(line)["contact_text"] for line in lines] == ["a@b.ru", "8 900 000 00 00"]
+    else:
+        assert lines[0] == "id,user_id,dialog_id,contact_text,created_at,updated_at"
+        assert len(lines) == 3
+
+
+@pytest.mark.asyncio
+async def test_search_ranks_by_index_and_pages_by_rank_cursor(client, db_rows):
+    rows, session = db_rows
+    at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    ids = [uuid4(), uuid4()]
+    rows.extend(
+        SimpleNamespace(id=i, user_id="u", dialog_id="d", role="user", created_at=at, rank=0.5 - n / 10,
+                        snippet="хочу \ue000доставку\ue001")
+        for n, i in enumerate(ids)
+    )
+    r = await client.get("/api/admin/search", params={"q": "доставка", "limit": 2, "role": "user"})
+    assert r.status_code == 200
+    assert r.json()[0]["snippet"] == "хочу <mark>доставку</mark>"
+    assert _decode_cursor(r.headers["X-Next-Cursor"], float, datetime, UUID) == (0.4, at, ids[1])
+    sql = str(session.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "messages.search_vector @@" in sql
+    assert "ts_headline(" not in sql.split("FROM (SELECT", 1)[1]  # фрагменты — только для строк страницы
+    assert "messages.role =" in sql
+
+    r = await client.get("/api/admin/search", params={"q": "доставка", "after": r.headers["X-Next-Cursor"]})
+    assert r.status_code == 200
+    sql = str(session.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "(ts_rank(messages.search_vector" in sql and ") < (" in sql
+
+
+@pytest.mark.asyncio
+async def test_search_validates_query_and_cursor_order(client, db_rows):
+    assert (await client.get("/api/admin/search", params={"q": ""})).status_code == 422
+    assert (await client.get("/api/admin/search", params={"q": "x", "role": "system"})).status_code == 422
+    recent = _encode_cursor(datetime(2026, 1, 1, tzinfo=timezone.utc), uuid4())
+    assert (await client.get("/api/admin/search", params={"q": "x", "after": recent})).status_code == 400
+    r = await client.get("/api/admin/search", params={"q": "x", "order": "recent", "after": recent})
+    assert r.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_search_snippet_escapes_message_markup(client, db_rows):
+    rows, _ = db_rows
+    rows.append(
+        SimpleNamespace(id=uuid4(), user_id="u", dialog_id="d", role="user",
+                        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc), rank=0.1,
+                        snippet='<script>alert(1)</script> \ue000доставка\ue001 <img src=x onerror="x">')
+    )
+    r = await client.get("/api/admin/search", params={"q": "доставка"})
+    assert r.json()[0]["snippet"] == (
+        "&lt;script&gt;alert(1)&lt;/script&gt; <mark>доставка</mark> &lt;img src=x onerror=&quot;x&quot;&gt;"
+    )
@@ -0,0 +1,115 @@
+"""
+Тесты допуска к чату: token bucket, слоты на пользователя и воркер, очередь с таймаутом, 429 с Retry-After.
+"""
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.admission import Admission, AdmissionRejected, MemoryTokenBucket
+
+
+@pytest.mark.asyncio
+async def test_memory_token_bucket_burst_then_retry_after(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.admission.time.monotonic", lambda: now[0])
+    bucket = MemoryTokenBucket(rate=1.0, burst=2)
+    assert await bucket.take("u1") == 0
+    assert await bucket.take("u1") == 0
+    assert await bucket.take("u1") == pytest.approx(1.0)
+    assert await bucket.take("u2") == 0
+    now[0] += 0.5
+    assert await bucket.take("u1") == pytest.approx(0.5)
+    now[0] += 0.5
+    assert await bucket.take("u1") == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_request_is_rejected_without_taking_a_slot():
+    admission = Admission(
+        max_streams=10,
+        max_streams_per_user=10,
+        queue_timeout=1,
+        queue_max=10,
+        rate_limiter=MemoryTokenBucket(rate=0.1, burst=1),
+    )
+    await admission.acquire("u1")
+    with pytest.raises(AdmissionRejected) as exc:
+        await admission.acquire("u1")
+    assert exc.value.reason == "rate" and exc.value.retry_after > 0
+    assert admission.active == 1
+
+
+@pytest.mark.asyncio
+async def test_per_user_slot_is_handed_to_waiter_fifo():
+    admission = Admission(max_streams=10, max_streams_per_user=1, queue_timeout=1, queue_max=10)
+    first = await admission.acquire("u1")
+    other_user = await admission.acquire("u2")
+    waiter = asyncio.ensure_future(admission.acquire("u1"))
+    await asyncio.sleep(0)
+    assert admission.waiting == 1 and not waiter.done()
+
+    first.release()
+    first.release()  # повторное освобождение ничего не меняет
+    second = await waiter
+    assert admission.active == 2 and admission.waiting == 0
+    second.release()
+    other_user.release()
+    assert admission.active == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_and_full_queue_are_rejected():
+    admission = Admission(max_streams=1, max_streams_per_user=0, queue_timeout=0.05, queue_max=1)
+    ticket = await admission.acquire("u1")
+    waiter = asyncio.ensure_future(admission.acquire("u2"))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as full:
+        await admission.acquire("u3")
+    assert full.value.reason == "concurrency"
+    with pytest.raises(AdmissionRejected) as timeout:
+        await waiter
+    assert timeout.value.reason == "timeout"
+    assert admission.waiting == 0 and admission.active == 1
+    ticket.release()
+    assert admission.active == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_handed_over_at_timeout_is_returned(monkeypatch):
+    admission = Admission(max_streams=1, max_streams_per_user=0, queue_timeout=0.05, queue_max=1)
+    ticket = await admission.acquire("u1")
+
+    async def wait_for(future, timeout):
+        # Слот освобождается в тот же момент, когда истекает таймаут ожидания
+        ticket.release()
+        assert future.done()
+        raise asyncio.TimeoutError
+
+    monkeypatch.setattr("app.admission.asyncio.wait_for", wait_for)
+    with pytest.raises(AdmissionRejected) as timeout:
+        await admission.acquire("u2")
+    assert timeout.value.reason == "timeout"
+    assert admission.active == 0 and admission.waiting == 0
+    await admission.acquire("u3")
+
+
+@pytest.mark.asyncio
+async def test_chat_returns_429_with_retry_after(monkeypatch):
+    from app.main import app
+    from app.routes import chat as chat_module
+
+    admission = Admission(
+        max_streams=10,
+        max_streams_per_user=1,
+        queue_timeout=0,
+        queue_max=10,
+        rate_limiter=MemoryTokenBucket(rate=1 / 30, burst=1),
+    )
+    monkeypatch.setattr(chat_module, "get_admission", lambda: admission)
+    await admission.acquire("u1")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        r = await client.post("/api/chat", json={"user_id": "u1", "message": "hi", "dialog_id": "d1"})
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == "30"
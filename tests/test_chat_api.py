@@ -73,3 +73,102 @@ async def test_chat_prompt_file_not_found_returns_500(client, monkeypatch):
         assert "detail" in data
     finally:
         app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.mark.asyncio
+async def test_chat_does_not_hold_db_session_while_streaming(client, prompt_file, monkeypatch):
+    """Во время стриминга ответа LLM ни одна сессия БД не открыта; ответ сохраняется отдельной транзакцией."""
+    from contextlib import asynccontextmanager
+
+    from app.routes import chat as chat_module
+
+    open_sessions = 0
+    saved = []
+
+    @asynccontextmanager
+    async def fake_scope():
+        nonlocal open_sessions
+        result = MagicMock()
+        result.all.return_value = []
+
+        async def execute(statement, rows=None):
+            saved.extend((r["role"], r["content"]) for r in rows or [])
+            return result
+
+        session = MagicMock()
+        session.execute = execute
+        open_sessions += 1
+        try:
+            yield session
+        finally:
+            open_sessions -= 1
+
+    sessions_during_stream = []
+
+    async def fake_stream_chat(messages, *, system_prompt):
+        for token in ("Здравствуйте", "!"):
+            sessions_during_stream.append(open_sessions)
+            yield token
+
+    monkeypatch.setattr(chat_module, "session_scope", fake_scope)
+    monkeypatch.setattr(chat_module, "stream_chat", fake_stream_chat)
+    monkeypatch.setenv("HISTORY_CACHE_ENABLED", "false")
+    commits = chat_module.CHAT_STAGE_SECONDS.count(stage="reply_commit")
+
+    r = await client.post("/api/chat", json={"user_id": "u1", "message": "Привет", "dialog_id": "d1"})
+    assert r.status_code == 200
+    assert r.text == "data: Здравствуйте\n\ndata: !\n\ndata: [DONE]\n\n"
+    assert sessions_during_stream == [0, 0]
+    assert saved == [("user", "Привет"), ("assistant", "Здравствуйте!")]
+    assert chat_module.CHAT_STAGE_SECONDS.count(stage="reply_commit") == commits + 1
+
+
+@pytest.mark.asyncio
+async def test_chat_client_disconnect_cancels_upstream(prompt_file, monkeypatch):
+    """Отключение клиента посреди ожидания токена: стрим LLM закрыт сразу, частичный ответ не сохранён."""
+    import asyncio
+
+    from app.routes import chat as chat_module
+    from app.schemas import ChatRequest
+
+    upstream_closed = asyncio.Event()
+    saved_replies = []
+
+    async def fake_stream_chat(messages, *, system_prompt):
+        try:
+            yield "Здравствуйте"
+            await asyncio.sleep(60)
+            yield "!"
+        finally:
+            upstream_closed.set()
+
+    async def fake_begin_turn(body):
+        return []
+
+    async def fake_save_reply(body, reply):
+        saved_replies.append(reply)
+
+    client_gone = asyncio.Event()
+
+    async def receive():
+        await client_gone.wait()
+        return {"type": "http.disconnect"}
+
+    monkeypatch.setattr(chat_module, "stream_chat", fake_stream_chat)
+    monkeypatch.setattr(chat_module, "_begin_turn", fake_begin_turn)
+    monkeypatch.setattr(chat_module, "_save_reply", fake_save_reply)
+    monkeypatch.setenv("HISTORY_CACHE_ENABLED", "false")
+    request = MagicMock()
+    request.receive = receive
+    disconnects = chat_module.CHAT_CLIENT_DISCONNECTS.value()
+
+    response = await chat_module.chat(ChatRequest(user_id="u1", message="Привет", dialog_id="d1"), request)
+    body = response.body_iterator
+    assert await anext(body) == "data: Здравствуйте\n\n".encode()
+    client_gone.set()
+    rest = [chunk async for chunk in body]
+
+    assert rest == []
+    assert upstream_closed.is_set()
+    assert saved_replies == []
+    assert chat_module.CHAT_CLIENT_DISCONNECTS.value() == disconnects + 1
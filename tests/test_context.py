@@ -0,0 +1,42 @@
+"""
+Тесты окна контекста: оценка токенов, выбор последних сообщений по бюджету, закреплённый префикс.
+"""
+from app.context import MESSAGE_OVERHEAD_TOKENS, build_context_window, estimate_tokens
+
+
+def _msgs(n: int, size: int = 40) -> list[dict[str, str]]:
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i:04d}" + "x" * (size - 4)} for i in range(n)]
+
+
+def test_estimate_tokens_counts_utf8_bytes():
+    """Кириллица оценивается дороже латиницы той же длины."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("абвг") == 2
+
+
+def test_window_keeps_newest_messages_within_budget():
+    """В окно попадают самые новые сообщения, порядок хронологический."""
+    history = _msgs(100)
+    per_message = estimate_tokens(history[0]["content"]) + MESSAGE_OVERHEAD_TOKENS
+    window = build_context_window(history, per_message * 10)
+    assert window == history[-10:]
+
+
+def test_window_returns_everything_when_it_fits():
+    history = _msgs(5)
+    assert build_context_window(history, 10_000) == history
+
+
+def test_window_keeps_pinned_prefix():
+    """Закреплённые первые сообщения остаются, остальное — хвост диалога."""
+    history = _msgs(100)
+    per_message = estimate_tokens(history[0]["content"]) + MESSAGE_OVERHEAD_TOKENS
+    window = build_context_window(history, per_message * 10, pinned=2)
+    assert window == [*history[:2], *history[-8:]]
+
+
+def test_window_is_contiguous():
+    """Большое сообщение, не влезающее в бюджет, обрывает окно — более старые не добавляются."""
+    history = [{"role": "user", "content": "a"}, {"role": "user", "content": "b" * 4000}, {"role": "user", "content": "c"}]
+    assert build_context_window(history, 100) == [history[-1]]
@@ -0,0 +1,116 @@
+"""
+Тесты возобновляемых стримов: буфер генерации, id событий, продолжение по Last-Event-ID,
+генерация без клиента (сохраняется, если успела; отменяется по истечении grace).
+"""
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import generations
+from app.generations import Generation, ReplayGap
+from app.main import app
+from app.routes import chat as chat_module
+from app.schemas import ChatRequest
+
+
+def test_buffer_replays_after_offset_and_reports_evicted_part():
+    generation = Generation("u", "d", max_bytes=10)
+    for chunk in ("один", "два", "три"):
+        generation.push(chunk)
+    assert generation.event_id(3) == f"{generation.id}:3"
+    assert generation.events_after(2) == [(3, "три")]
+    assert generation.events_after(3) == []
+    with pytest.raises(ReplayGap):
+        generation.events_after(0)  # «один» (8 байт) вытеснен
+    with pytest.raises(ReplayGap):
+        generation.events_after(5)
+
+
+@pytest.fixture
+def resumable(monkeypatch):
+    """Чат с возобновлением: LLM отдаёт два фрагмента с паузой, сохранённые ответы — в списке."""
+    monkeypatch.setenv("SSE_RESUME_ENABLED", "true")
+    monkeypatch.setenv("SSE_RESUME_GRACE", "0.2")
+    monkeypatch.setenv("HISTORY_CACHE_ENABLED", "false")
+    monkeypatch.setattr(generations, "_registry", None)
+    state = {"saved": [], "upstream_closed": asyncio.Event(), "pause": 0.05}
+
+    async def fake_stream_chat(messages, *, system_prompt):
+        try:
+            yield "Здравствуйте"
+            await asyncio.sleep(state["pause"])
+            yield "!"
+        finally:
+            state["upstream_closed"].set()
+
+    async def fake_begin_turn(body):
+        return []
+
+    async def fake_save_reply(body, reply):
+        state["saved"].append(reply)
+
+    monkeypatch.setattr(chat_module, "stream_chat", fake_stream_chat)
+    monkeypatch.setattr(chat_module, "_begin_turn", fake_begin_turn)
+    monkeypatch.setattr(chat_module, "_save_reply", fake_save_reply)
+    monkeypatch.setattr(chat_module, "get_system_prompt", lambda dialog_id: "Test assistant.")
+    yield state
+
+
+def _request(gone: asyncio.Event) -> MagicMock:
+    async def receive():
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    request = MagicMock()
+    request.receive = receive
+    return request
+
+
+@pytest.mark.asyncio
+async def test_reply_survives_disconnect_and_resumes_from_last_event_id(resumable):
+    gone = asyncio.Event()
+    response = await chat_module.chat(ChatRequest(user_id="u1", message="Привет", dialog_id="d1"), _request(gone))
+    generation_id = response.headers["X-Generation-Id"]
+    body = response.body_iterator
+    first = await anext(body)
+    assert first == f"id: {generation_id}:1\ndata: Здравствуйте\n\n".encode()
+    gone.set()
+    assert [chunk async for chunk in body] == []
+
+    await asyncio.sleep(0.1)
+    assert resumable["saved"] == ["Здравствуйте!"]  # генерация дошла до конца без клиента
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        r = await client.get(
+            f"/api/chat/{generation_id}/stream",
+            params={"user_id": "u1"},
+            headers={"Last-Event-ID": f"{generation_id}:1"},
+        )
+        assert r.status_code == 200
+        assert r.text == f"id: {generation_id}:2\ndata: !\n\ndata: [DONE]\n\n"
+
+        r = await client.get(f"/api/chat/{generation_id}/stream", params={"user_id": "other"})
+        assert r.status_code == 404
+        r = await client.get(
+            f"/api/chat/{generation_id}/stream", params={"user_id": "u1"}, headers={"Last-Event-ID": "x:1"}
+        )
+        assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_generation_without_client_is_cancelled_after_grace(resumable):
+    resumable["pause"] = 60
+    gone = asyncio.Event()
+    response = await chat_module.chat(ChatRequest(user_id="u1", message="Привет", dialog_id="d1"), _request(gone))
+    body = response.body_iterator
+    await anext(body)
+    gone.set()
+    assert [chunk async for chunk in body] == []
+    assert not resumable["upstream_closed"].is_set()
+
+    await asyncio.wait_for(resumable["upstream_closed"].wait(), 2)
+    assert resumable["saved"] == []
+    generation = generations.get_generation_registry().get(response.headers["X-Generation-Id"])
+    assert generation.finished and generation.error is not None
@@ -0,0 +1,78 @@
+"""
+Тесты кэша истории диалогов: LRU-вытеснение по размеру, TTL, сквозная запись, счётчики;
+повторное чтение истории того же диалога не обращается к БД.
+"""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import history_cache
+from app.history_cache import HistoryCache
+from app.routes.chat import _cache_saved_messages, _get_history
+
+
+def _msg(content: str, role: str = "user") -> dict[str, str]:
+    return {"role": role, "content": content}
+
+
+def test_get_put_counts_hits_and_misses():
+    cache = HistoryCache(max_bytes=10_000, ttl=60)
+    assert cache.get(("u", "d")) is None
+    cache.put(("u", "d"), [_msg("hi")])
+    assert cache.get(("u", "d")) == [_msg("hi")]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_by_total_bytes():
+    cache = HistoryCache(max_bytes=1_000, ttl=60)
+    cache.put(("u", "1"), [_msg("a" * 150)])
+    cache.put(("u", "2"), [_msg("b" * 150)])
+    cache.get(("u", "1"))
+    cache.put(("u", "3"), [_msg("c" * 150)])
+    assert cache.get(("u", "2")) is None
+    assert cache.get(("u", "1")) is not None
+    assert cache.evictions == 1
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    cache = HistoryCache(max_bytes=10_000, ttl=10)
+    now = 1000.0
+    monkeypatch.setattr(history_cache.time, "monotonic", lambda: now)
+    cache.put(("u", "d"), [_msg("hi")])
+    now = 1011.0
+    assert cache.get(("u", "d")) is None
+    assert len(cache) == 0
+
+
+def test_append_keeps_pinned_prefix_and_limit():
+    cache = HistoryCache(max_bytes=100_000, ttl=60)
+    cache.put(("u", "d"), [_msg(str(i)) for i in range(5)])
+    cache.append(("u", "d"), [_msg("5"), _msg("6", "assistant")], limit=4, pinned=1)
+    assert [m["content"] for m in cache.get(("u", "d"))] == ["0", "3", "4", "5", "6"]
+
+
+def test_append_without_entry_does_not_create_partial_history():
+    cache = HistoryCache(max_bytes=10_000, ttl=60)
+    cache.append(("u", "d"), [_msg("hi")], limit=10)
+    assert cache.get(("u", "d")) is None
+
+
+@pytest.mark.asyncio
+async def test_get_history_skips_select_on_cache_hit(monkeypatch):
+    """Второй ход того же диалога берёт историю из кэша после сквозной записи."""
+    monkeypatch.setattr(history_cache, "_cache", HistoryCache(max_bytes=10_000, ttl=60))
+    result = MagicMock()
+    result.all.return_value = []
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=result)
+
+    assert await _get_history(session, "u1", "d1") == []
+    _cache_saved_messages("u1", "d1", [_msg("привет"), _msg("здравствуйте", "assistant")])
+    assert await _get_history(session, "u1", "d1") == [_msg("привет"), _msg("здравствуйте", "assistant")]
+    assert session.execute.await_count == 1
+
+    _cache_saved_messages("u1", "d1", None)
+    await _get_history(session, "u1", "d1")
+    assert session.execute.await_count == 2
@@ -0,0 +1,139 @@
+"""
+Тесты лидов: извлечение контактов (сравнение с исходной реализацией на случайных сообщениях),
+дедупликация по нормализованному ключу, upsert одним запросом.
+Конкурентный тест выполняется на реальном PostgreSQL, если задан TEST_DATABASE_URL
+(postgresql+asyncpg://...), иначе пропускается.
+"""
+import asyncio
+import os
+import random
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.leads import (
+    EMAIL_RE,
+    PHONE_RE,
+    _contact_keys,
+    _extract_contact_parts,
+    _normalize_contact,
+    save_lead_if_contact,
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def _reference_extract_contact_parts(text: str) -> list[str]:
+    """Исходная реализация извлечения (до однопроходной версии) — эталон для сравнения."""
+    parts = []
+    seen = set()
+    for m in EMAIL_RE.finditer(text):
+        s = m.group(0).strip().lower()
+        if s and s not in seen:
+            seen.add(s)
+            parts.append(m.group(0).strip())
+    for m in PHONE_RE.finditer(text):
+        s = _normalize_contact(m.group(0))
+        if s and s not in seen:
+            seen.add(s)
+            parts.append(m.group(0).strip())
+    return parts
+
+
+_ALPHABET = (
+    list("0123456789") * 4
+    + list(" -()+@._%") * 2
+    + list("abcxyzKIVAN")
+    + list("приветзвонитепочта")
+    + ["\u00a0", "\t", "\n", "\u2009", "\u3000", "٣", "３", "²", "\u212a"]
+)
+_FRAGMENTS = [
+    "+7 (927) 678-34-54", "8 927 678 34 54", "927-678-34-54", "+44 20 7946 0958", "+375 29 123 45 67",
+    "ivan.petrov@mail.ru", "89276783454@yandex.ru", "Sales@Example.COM", "тел.", "почта:", "ИНН 7707083893",
+]
+
+
+def _random_message(rng: random.Random) -> str:
+    chunks = []
+    for _ in range(rng.randint(1, 8)):
+        if rng.random() < 0.4:
+            chunks.append(rng.choice(_FRAGMENTS))
+        else:
+            chunks.append("".join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 25))))
+    return rng.choice(["", " ", ", "]).join(chunks)
+
+
+def test_extract_contact_parts_matches_reference_implementation():
+    """Свойство: на случайных сообщениях результат совпадает с исходной реализацией."""
+    rng = random.Random(20261018)
+    for _ in range(20_000):
+        text = _random_message(rng)
+        assert _extract_contact_parts(text) == _reference_extract_contact_parts(text), text
+
+
+def test_extract_skips_messages_without_contacts():
+    assert _extract_contact_parts("Здравствуйте! Сколько стоит бот в 2024 году?") == []
+
+
+def test_contact_keys_dedup_by_normalized_form():
+    parts, keys = _contact_keys(["8 927 678 34 54", "+7 (927) 678-34-54", "Ivan@Mail.ru"])
+    assert parts == ["8 927 678 34 54", "Ivan@Mail.ru"]
+    assert keys == ["89276783454", "ivan@mail.ru"]
+
+
+@pytest.mark.asyncio
+async def test_save_lead_without_contacts_does_not_touch_db():
+    db = MagicMock()
+    db.execute = AsyncMock()
+    assert await save_lead_if_contact(db, "u", "d", "Сколько стоит внедрение?") is False
+    db.execute.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_save_lead_merges_in_one_statement():
+    """Слияние контактов — один upsert; второй запрос только отмечает has_lead у сессии."""
+    result = MagicMock()
+    result.first.return_value = ("id",)
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=result)
+    assert await save_lead_if_contact(db, "u", "d", "Мой телефон +7 927 678-34-54, почта a@b.ru") is True
+    upsert, mark = db.execute.await_args_list
+    assert "ON CONFLICT" in str(upsert.args[0])
+    assert "has_lead" in str(mark.args[0])
+    params = upsert.args[1]
+    assert params["parts"] == ["a@b.ru", "+7 927 678-34-54"]
+    assert params["contact_keys"] == ["a@b.ru", "89276783454"]
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+@pytest.mark.asyncio
+async def test_concurrent_upserts_merge_all_contacts():
+    """Параллельные сообщения одного диалога: один лид, ни один контакт не потерян, без ошибок уникальности."""
+    from sqlalchemy import delete, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from app.models import Base, Lead
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def send(i: int) -> None:
+        async with factory() as session:
+            await save_lead_if_contact(session, "lead-test", "race", f"Звоните: 8 900 000 00 {i:02d}")
+            await session.commit()
+
+    try:
+        await asyncio.gather(*(send(i) for i in range(20)))
+        await send(3)
+        async with factory() as session:
+            leads = (await session.execute(select(Lead).where(Lead.user_id == "lead-test"))).scalars().all()
+        assert len(leads) == 1
+        assert sorted(leads[0].contact_keys) == [f"89000000{i:02d}" for i in range(20)]
+        assert len(leads[0].contact_text.split(" | ")) == 20
+    finally:
+        async with factory() as session:
+            await session.execute(delete(Lead).where(Lead.user_id == "lead-test"))
+            await session.commit()
+        await engine.dispose()
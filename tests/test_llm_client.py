@@ -0,0 +1,103 @@
+"""
+Тесты общего клиента LLM: пул соединений из конфигурации, повторное использование клиента в stream_chat.
+"""
+import httpx
+import pytest
+
+from app import llm
+from app.config import get_settings
+
+
+def _sse_body(*tokens: str) -> bytes:
+    lines = [f'data: {{"choices": [{{"delta": {{"content": "{t}"}}}}]}}\n\n' for t in tokens]
+    return ("".join(lines) + "data: [DONE]\n\n").encode("utf-8")
+
+
+def test_create_llm_client_uses_settings(monkeypatch):
+    """Таймауты пула берутся из Settings."""
+    monkeypatch.setenv("LLM_CONNECT_TIMEOUT", "1.5")
+    monkeypatch.setenv("LLM_READ_TIMEOUT", "42")
+    client = llm.create_llm_client(get_settings())
+    assert client.timeout.connect == 1.5
+    assert client.timeout.read == 42
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_uses_shared_client(monkeypatch):
+    """stream_chat использует общий клиент, созданный в lifespan, и не закрывает его."""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, content=_sse_body("При", "вет"), headers={"Content-Type": "text/event-stream"})
+
+    shared = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "_client", shared)
+    try:
+        for _ in range(2):
+            chunks = [c async for c in llm.stream_chat([{"role": "user", "content": "hi"}], system_prompt="s")]
+            assert chunks == ["При", "вет"]
+        assert calls == ["/chat/completions", "/chat/completions"]
+        assert not shared.is_closed
+    finally:
+        await shared.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_records_latency_and_errors(monkeypatch):
+    """Замеры TTFT/интервалов и счётчик ошибок по статусу; при METRICS_ENABLED=false ничего не пишется."""
+    status = 200
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(status, content=_sse_body("a", "b", "c"), headers={"Content-Type": "text/event-stream"})
+
+    shared = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "_client", shared)
+    ttft, gaps, tokens = llm.LLM_TTFT_SECONDS.count(), llm.LLM_TOKEN_GAP_SECONDS.count(), llm.LLM_TOKENS.value()
+    try:
+        [c async for c in llm.stream_chat([], system_prompt="s")]
+        assert llm.LLM_TTFT_SECONDS.count() == ttft + 1
+        assert llm.LLM_TOKEN_GAP_SECONDS.count() == gaps + 2
+        assert llm.LLM_TOKENS.value() == tokens + 3
+
+        status = 503
+        errors = llm.LLM_ERRORS.value(status="503")
+        with pytest.raises(httpx.HTTPStatusError):
+            [c async for c in llm.stream_chat([], system_prompt="s")]
+        assert llm.LLM_ERRORS.value(status="503") == errors + 1
+
+        status = 200
+        monkeypatch.setenv("METRICS_ENABLED", "false")
+        get_settings.cache_clear()
+        [c async for c in llm.stream_chat([], system_prompt="s")]
+        assert llm.LLM_TOKENS.value() == tokens + 3
+    finally:
+        await shared.aclose()
+
+
+@pytest.mark.asyncio
+async def test_complete_background_skips_chat_metrics_and_breakers(monkeypatch):
+    """Фоновый вызов (сводки) не пишет метрики чата и не учитывается в breaker'ах апстримов."""
+    status = 200
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(status, content=_sse_body("a", "b"), headers={"Content-Type": "text/event-stream"})
+
+    shared = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "_client", shared)
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "1")
+    get_settings.cache_clear()
+    ttft, tokens, streams = llm.LLM_TTFT_SECONDS.count(), llm.LLM_TOKENS.value(), llm.LLM_STREAM_SECONDS.count()
+    errors = llm.LLM_ERRORS.value(status="503")
+    try:
+        assert await llm.complete_background([], system_prompt="s") == "ab"
+        status = 503
+        with pytest.raises(httpx.HTTPStatusError):
+            await llm.complete_background([], system_prompt="s")
+        assert llm.LLM_TTFT_SECONDS.count() == ttft
+        assert llm.LLM_TOKENS.value() == tokens
+        assert llm.LLM_STREAM_SECONDS.count() == streams
+        assert llm.LLM_ERRORS.value(status="503") == errors
+        assert all(u.breaker.available() for u in llm.get_upstream_pool().upstreams)
+    finally:
+        await shared.aclose()
@@ -0,0 +1,97 @@
+"""
+Тесты метрик: текстовый формат Prometheus, гистограммы, метрики пула БД на /metrics.
+"""
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.config import get_settings
+from app.main import app
+from app.metrics import Counter, Histogram, _registry, observe_time
+
+
+@pytest.fixture
+def isolated_registry():
+    before = list(_registry)
+    yield
+    _registry[:] = before
+
+
+def test_counter_with_labels(isolated_registry):
+    c = Counter("test_errors_total", "Ошибки", ("status",))
+    c.inc(status="502")
+    c.inc(2, status="502")
+    assert c.value(status="502") == 3
+    assert 'test_errors_total{status="502"} 3' in c.render()
+
+
+def test_histogram_buckets_are_cumulative(isolated_registry):
+    h = Histogram("test_latency_seconds", "Задержка", buckets=(0.1, 1.0))
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(5)
+    text = h.render()
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+    assert h.count() == 3
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_exposes_db_pool_gauges(monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "secret")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        r = await client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE db_pool_checked_out gauge" in r.text
+    assert "db_pool_overflow " in r.text
+    assert "# TYPE db_pool_wait_seconds histogram" in r.text
+
+
+@pytest.mark.asyncio
+async def test_metrics_require_token(monkeypatch):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        r = await client.get("/metrics", headers={"Authorization": "Bearer "})
+        assert r.status_code == 403  # токен не задан — эндпоинт закрыт
+        monkeypatch.setenv("METRICS_TOKEN", "secret")
+        get_settings.cache_clear()
+        assert (await client.get("/metrics")).status_code == 403
+        assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 403
+        assert (await client.get("/metrics", headers={"Authorization": "Bearer secret"})).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_metrics_disabled_returns_404_and_skips_observations(monkeypatch, isolated_registry):
+    monkeypatch.setenv("METRICS_ENABLED", "false")
+    h = Histogram("test_stage_seconds", "Этап")
+    with observe_time(h):
+        pass
+    assert h.count() == 0
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        r = await client.get("/metrics")
+    assert r.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_metrics_expose_history_cache_stats(monkeypatch):
+    from app import history_cache
+
+    monkeypatch.setenv("METRICS_TOKEN", "secret")
+    monkeypatch.setenv("HISTORY_CACHE_ENABLED", "true")
+    monkeypatch.setenv("HISTORY_CACHE_MAX_BYTES", "1000")
+    monkeypatch.setattr(history_cache, "_cache", None)
+    cache = history_cache.get_history_cache()
+    cache.get(("u", "a"))
+    cache.put(("u", "a"), [{"role": "user", "content": "x"}])
+    cache.get(("u", "a"))
+    cache.put(("u", "b"), [{"role": "user", "content": "y" * 350}])  # вытесняет ("u", "a")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        r = await client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert "# TYPE history_cache_hits_total counter" in r.text
+    assert "history_cache_hits_total 1\n" in r.text
+    assert "history_cache_misses_total 1\n" in r.text
+    assert "history_cache_evictions_total 1\n" in r.text
+    assert "history_cache_entries 1\n" in r.text
+    assert f"history_cache_bytes {cache.total_bytes}\n" in r.text
@@ -0,0 +1,75 @@
+"""
+Тесты секций messages: имена и границы месяцев, создание будущих секций, срок хранения,
+нижняя граница created_at в выборках диалога (для отсечения секций).
+"""
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.config import get_settings
+from app.models import Message
+from app.partitions import add_months, dialog_filter, maintain_partitions, partition_month, partition_name
+
+
+def test_month_helpers():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partition_name(date(2026, 3, 1)) == "messages_y2026m03"
+    assert partition_month("messages_y2026m03") == date(2026, 3, 1)
+    assert partition_month("messages_default") is None
+
+
+def test_dialog_filter_bounds_created_at_by_session_start():
+    sql = str(select(Message.content).where(*dialog_filter("u", "d")).compile(dialect=postgresql.dialect()))
+    assert "messages.created_at >= coalesce((SELECT sessions.first_at" in sql
+
+
+def _session(existing: list[str]) -> MagicMock:
+    statements = []
+
+    async def execute(statement, params=None):
+        sql = str(statement)
+        statements.append(sql)
+        result = MagicMock()
+        result.scalar.return_value = True
+        result.scalars.return_value.all.return_value = [*existing, "messages_default"]
+        return result
+
+    session = MagicMock()
+    session.execute = AsyncMock(side_effect=execute)
+    session.statements = statements
+    return session
+
+
+@pytest.mark.asyncio
+async def test_maintenance_creates_future_partitions_and_detaches_expired(monkeypatch):
+    monkeypatch.setenv("PARTITION_MONTHS_AHEAD", "2")
+    monkeypatch.setenv("PARTITION_RETENTION_MONTHS", "3")
+    session = _session(["messages_y2026m06", "messages_y2026m07", "messages_y2026m10"])
+
+    created, removed = await maintain_partitions(session, today=date(2026, 10, 18))
+
+    assert created == ["messages_y2026m11", "messages_y2026m12"]
+    assert removed == ["messages_y2026m06"]
+    attach = [s for s in session.statements if "ATTACH PARTITION" in s]
+    assert "FOR VALUES FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00')" in attach[-1]
+    assert any("DELETE FROM messages_default" in s for s in session.statements)
+    assert any(s == "ALTER TABLE messages DETACH PARTITION messages_y2026m06" for s in session.statements)
+    assert any(s.startswith("DELETE FROM sessions") for s in session.statements)
+
+
+@pytest.mark.asyncio
+async def test_maintenance_drop_mode_and_no_retention(monkeypatch):
+    monkeypatch.setenv("PARTITION_RETENTION_MONTHS", "1")
+    monkeypatch.setenv("PARTITION_RETENTION_MODE", "drop")
+    session = _session(["messages_y2026m08", "messages_y2026m09", "messages_y2026m10", "messages_y2026m11", "messages_y2026m12"])
+    assert await maintain_partitions(session, today=date(2026, 10, 18)) == ([], ["messages_y2026m08"])
+    assert "DROP TABLE messages_y2026m08" in session.statements
+
+    monkeypatch.setenv("PARTITION_RETENTION_MONTHS", "0")
+    get_settings.cache_clear()
+    session = _session(["messages_y2020m01", "messages_y2026m10", "messages_y2026m11", "messages_y2026m12"])
+    assert await maintain_partitions(session, today=date(2026, 10, 18)) == ([], [])
@@ -0,0 +1,145 @@
+"""
+Тесты очереди write-behind: запись пачками, ожидание коммита, дописывание очереди при остановке,
+изоляция ошибок лидов, сброс кэша истории при неудачной пачке.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock
+
+import pytest
+
+from app import history_cache, persistence
+from app.history_cache import HistoryCache
+from app.persistence import MessageWriter, message_row
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Подменяет session_scope: каждая «транзакция» — список вставленных строк."""
+    transactions: list[list[dict]] = []
+    leads: list[tuple] = []
+
+    @asynccontextmanager
+    async def fake_scope():
+        rows: list[dict] = []
+
+        async def execute(statement, params=None):
+            rows.extend(params or [])
+
+        @asynccontextmanager
+        async def begin_nested():
+            yield
+
+        session = MagicMock()
+        session.execute = execute
+        session.begin_nested = begin_nested
+        yield session
+        transactions.append(rows)
+
+    async def fake_save_lead(session, user_id, dialog_id, text):
+        if dialog_id == "bad-lead":
+            raise RuntimeError("lead upsert failed")
+        leads.append((user_id, dialog_id, text))
+        return True
+
+    monkeypatch.setattr(persistence, "session_scope", fake_scope)
+    monkeypatch.setattr(persistence, "save_lead_if_contact", fake_save_lead)
+    return transactions, leads
+
+
+def test_message_row_keeps_order():
+    first = message_row("u", "d", "user", "a")
+    second = message_row("u", "d", "assistant", "b")
+    assert first["created_at"] <= second["created_at"]
+    assert first["id"] != second["id"]
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_by_size(fake_db):
+    transactions, leads = fake_db
+    writer = MessageWriter(batch_size=3, flush_interval=0.05, wait_for_flush=True, max_queue=100)
+    writer.start()
+    try:
+        await asyncio.gather(
+            *(writer.submit([message_row("u", str(i), "user", "hi")], lead=("u", str(i), "hi")) for i in range(5))
+        )
+    finally:
+        await writer.stop()
+    assert [len(t) for t in transactions] == [3, 2]
+    assert len(leads) == 5
+    assert writer.rows_written == 5
+
+
+@pytest.mark.asyncio
+async def test_failed_lead_does_not_roll_back_batch_messages(fake_db):
+    transactions, leads = fake_db
+    writer = MessageWriter(batch_size=3, flush_interval=0.05, wait_for_flush=True, max_queue=100)
+    writer.start()
+    try:
+        await asyncio.gather(
+            *(writer.submit([message_row("u", d, "user", "8 900 000 00 00")], lead=("u", d, "8 900 000 00 00"))
+              for d in ("a", "bad-lead", "b"))
+        )
+    finally:
+        await writer.stop()
+    assert sorted(r["dialog_id"] for t in transactions for r in t) == ["a", "b", "bad-lead"]
+    assert [lead[1] for lead in leads] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_writer_drains_queue_on_stop(fake_db):
+    transactions, _ = fake_db
+    writer = MessageWriter(batch_size=100, flush_interval=10, wait_for_flush=False, max_queue=100)
+    writer.start()
+    for i in range(4):
+        await writer.submit([message_row("u", "d", "user", str(i))])
+    await writer.stop()
+    assert [r["content"] for t in transactions for r in t] == ["0", "1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_writer_reports_flush_error_to_waiter(monkeypatch):
+    @asynccontextmanager
+    async def failing_scope():
+        raise RuntimeError("db down")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(persistence, "session_scope", failing_scope)
+    cache = HistoryCache(max_bytes=10_000, ttl=60)
+    monkeypatch.setattr(history_cache, "_cache", cache)
+    cache.put(("u", "d"), [{"role": "user", "content": "hi"}])
+    writer = MessageWriter(batch_size=10, flush_interval=0.01, wait_for_flush=True, max_queue=10)
+    writer.start()
+    try:
+        with pytest.raises(RuntimeError):
+            await writer.submit([message_row("u", "d", "user", "hi")])
+    finally:
+        await writer.stop()
+    # Кэш уже содержал сообщение, которого нет в БД: история диалога перечитается
+    assert cache.get(("u", "d")) is None
+
+
+@pytest.mark.asyncio
+async def test_write_messages_updates_session_summary():
+    """Сводка сессий: одна строка upsert на диалог, со счётчиком и границами по времени."""
+    from sqlalchemy.dialects import postgresql
+
+    statements = []
+
+    async def execute(statement, params=None):
+        statements.append((statement, params))
+
+    session = MagicMock()
+    session.execute = execute
+    rows = [message_row("u", "a", "user", "1"), message_row("u", "b", "user", "2"), message_row("u", "a", "assistant", "3")]
+    await persistence.write_messages(session, rows)
+
+    (_, inserted), (upsert, _) = statements
+    assert inserted == rows
+    compiled = upsert.compile(dialect=postgresql.dialect())
+    assert "ON CONFLICT (user_id, dialog_id) DO UPDATE" in str(compiled)
+    params = compiled.params
+    assert (params["dialog_id_m0"], params["message_count_m0"]) == ("a", 2)
+    assert (params["dialog_id_m1"], params["message_count_m1"]) == ("b", 1)
+    assert params["first_at_m0"] == rows[0]["created_at"]
+    assert params["last_at_m0"] == rows[2]["created_at"]
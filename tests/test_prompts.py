@@ -0,0 +1,53 @@
+"""
+Тесты хранилища промптов: чтение один раз, перечитывание при изменении файла, промпты по префиксу dialog_id.
+"""
+import os
+
+import pytest
+
+from app import prompts
+from app.config import get_settings
+from app.prompts import PromptStore, get_system_prompt
+
+
+def test_store_reads_file_once(tmp_path, monkeypatch):
+    p = tmp_path / "p.txt"
+    p.write_text(" first ", encoding="utf-8")
+    store = PromptStore(reload_interval=60)
+    assert store.get(p) == "first"
+    monkeypatch.setattr(prompts, "load_system_prompt", lambda path: pytest.fail("повторное чтение с диска"))
+    assert store.get(p) == "first"
+
+
+def test_store_reloads_when_mtime_changes(tmp_path):
+    p = tmp_path / "p.txt"
+    p.write_text("first", encoding="utf-8")
+    store = PromptStore(reload_interval=0)
+    assert store.get(p) == "first"
+    p.write_text("second", encoding="utf-8")
+    st = p.stat()
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert store.get(p) == "second"
+
+
+def test_store_missing_file_raises(tmp_path):
+    store = PromptStore(reload_interval=0)
+    with pytest.raises(FileNotFoundError):
+        store.get(tmp_path / "missing.txt")
+
+
+def test_named_prompt_by_dialog_prefix(tmp_path, monkeypatch):
+    default = tmp_path / "system.txt"
+    default.write_text("default", encoding="utf-8")
+    sales = tmp_path / "sales.txt"
+    sales.write_text("sales", encoding="utf-8")
+    monkeypatch.setenv("PROMPT_FILE_PATH", str(default))
+    monkeypatch.setenv("PROMPT_ROUTES", f'{{"sales-": "{sales}"}}')
+    assert get_settings().prompt_path_for("sales-42") == sales
+    assert get_system_prompt("sales-42") == "sales"
+    assert get_system_prompt("support-1") == "default"
+    assert get_system_prompt(None) == "default"
+
+
+def test_settings_are_memoized():
+    assert get_settings() is get_settings()
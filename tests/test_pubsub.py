@@ -0,0 +1,94 @@
+"""
+Тесты согласования кэшей через LISTEN/NOTIFY: разбор событий, пропуск своих, отложенная доставка до коммита.
+"""
+import asyncio
+import json
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import history_cache, pubsub
+from app.config import get_settings
+from app.history_cache import HistoryCache
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def _event(kind: str, origin: str = "other-worker", **data) -> str:
+    return json.dumps({"origin": origin, "kind": kind, **data})
+
+
+def test_dialog_event_from_other_worker_invalidates_history(monkeypatch):
+    cache = HistoryCache(max_bytes=10_000, ttl=60)
+    monkeypatch.setattr(history_cache, "_cache", cache)
+    cache.put(("u", "d"), [{"role": "user", "content": "hi"}])
+    cache.put(("u", "other"), [{"role": "user", "content": "hi"}])
+
+    pubsub.dispatch(_event("dialog", origin=pubsub.WORKER_ID, keys=[["u", "d"]]))
+    assert cache.get(("u", "d")) is not None
+
+    pubsub.dispatch(_event("dialog", keys=[["u", "d"]]))
+    assert cache.get(("u", "d")) is None
+    assert cache.get(("u", "other")) is not None
+    pubsub.dispatch("не json")
+
+
+def test_history_read_before_invalidation_is_not_cached():
+    """История, прочитанная из БД до события другого воркера, в кэш не попадает."""
+    cache = HistoryCache(max_bytes=10_000, ttl=60)
+    version = cache.version
+    cache.invalidate(("u", "d"))
+    cache.put(("u", "d"), [{"role": "user", "content": "старое"}], since=version)
+    assert cache.get(("u", "d")) is None
+    cache.put(("u", "d"), [{"role": "user", "content": "новое"}], since=cache.version)
+    assert cache.get(("u", "d")) is not None
+
+
+@pytest.mark.asyncio
+async def test_publish_is_noop_when_disabled_and_chunks_keys(monkeypatch):
+    session = MagicMock()
+    session.execute = AsyncMock()
+    await pubsub.publish_dialogs(session, [("u", "d")])
+    session.execute.assert_not_awaited()
+
+    monkeypatch.setenv("PUBSUB_ENABLED", "true")
+    get_settings.cache_clear()
+    keys = [("пользователь" * 20, f"диалог-{i}" * 25) for i in range(25)] + [("u", "d"), ("u", "d")]
+    await pubsub.publish_dialogs(session, keys)
+    payloads = [json.loads(call.args[1]["payload"]) for call in session.execute.await_args_list]
+    assert len(payloads) > 1
+    assert sum(len(p["keys"]) for p in payloads) == 26
+    assert all(p["origin"] == pubsub.WORKER_ID and p["kind"] == "dialog" for p in payloads)
+    assert all(len(call.args[1]["payload"].encode()) < 8000 for call in session.execute.await_args_list)
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+@pytest.mark.asyncio
+async def test_notify_is_delivered_after_commit_only(monkeypatch):
+    """Два «воркера» на одной БД: событие приходит слушателю после коммита писателя и не приходит при откате."""
+    import asyncpg
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    monkeypatch.setenv("PUBSUB_ENABLED", "true")
+    monkeypatch.setenv("PUBSUB_CHANNEL", "aichatbot_events_test")
+    received: asyncio.Queue[str] = asyncio.Queue()
+    listener = await asyncpg.connect(TEST_DATABASE_URL.replace("postgresql+asyncpg", "postgresql"))
+    await listener.add_listener("aichatbot_events_test", lambda *args: received.put_nowait(args[-1]))
+    engine = create_async_engine(TEST_DATABASE_URL)
+    factory = async_sessionmaker(engine)
+    try:
+        async with factory() as session:
+            await pubsub.publish(session, "lead", user_id="u", dialog_id="rolled-back")
+            await session.rollback()
+        async with factory() as session:
+            await pubsub.publish(session, "lead", user_id="u", dialog_id="d")
+            await asyncio.sleep(0.1)
+            assert received.empty()
+            await session.commit()
+        event = json.loads(await asyncio.wait_for(received.get(), 5))
+        assert event["dialog_id"] == "d"
+        assert received.empty()
+    finally:
+        await listener.close()
+        await engine.dispose()
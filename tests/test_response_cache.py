@@ -0,0 +1,95 @@
+"""
+Тесты кэша ответов: ключ с нормализацией, LRU и TTL в памяти, сброс при смене промпта, отдача из кэша в /api/chat.
+"""
+import os
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.prompts import PromptStore
+from app.response_cache import ResponseCache, cache_key, prompt_hash, replay_chunks
+
+
+def _key(content, prompt="p", temperature=0.7):
+    return cache_key("deepseek-chat", temperature, prompt_hash(prompt), [{"role": "user", "content": content}])
+
+
+def test_cache_key_normalizes_case_and_whitespace():
+    assert _key("Сколько стоит?") == _key("  сколько   СТОИТ? ")
+    assert _key("Сколько стоит?") != _key("Сколько стоит?", prompt="другой промпт")
+    assert _key("Сколько стоит?") != _key("Сколько стоит?", temperature=0.0)
+
+
+@pytest.mark.asyncio
+async def test_memory_tier_lru_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.response_cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=60, use_db=False)
+    await cache.put("a", "h", "ответ a")
+    await cache.put("b", "h", "ответ b")
+    assert await cache.get("a") == "ответ a"
+    await cache.put("c", "h", "ответ c")  # вытесняет b — к нему дольше всего не обращались
+    assert await cache.get("b") is None
+    now[0] += 61
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_prompt_change_drops_entries_for_old_prompt(tmp_path):
+    path = tmp_path / "system.txt"
+    path.write_text("Старый промпт", encoding="utf-8")
+    store = PromptStore(reload_interval=0)
+    cache = ResponseCache(max_entries=10, ttl=60, use_db=False)
+    store.add_listener(cache.on_prompt_changed)
+    await cache.put("k", prompt_hash(store.get(path)), "ответ")
+
+    path.write_text("Новый промпт!", encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert store.get(path) == "Новый промпт!"
+    assert await cache.get("k") is None
+
+
+@pytest.mark.asyncio
+async def test_replay_chunks_preserves_text():
+    reply = "Тариф «Старт» — 990 ₽ в месяц.\nПодключение бесплатно."
+    chunks = [c async for c in replay_chunks(reply, 8)]
+    assert "".join(chunks) == reply
+    assert len(chunks) > 1
+
+
+@pytest.mark.asyncio
+async def test_chat_replays_cached_first_turn(monkeypatch):
+    from app.main import app
+    from app.routes import chat as chat_module
+
+    cache = ResponseCache(max_entries=10, ttl=60, use_db=False)
+    llm_calls = []
+    saved = []
+
+    async def fake_stream_chat(messages, *, system_prompt):
+        llm_calls.append(messages)
+        for token in ("Тариф", " 990", " ₽"):
+            yield token
+
+    async def fake_begin_turn(body):
+        return []
+
+    async def fake_save_reply(body, reply):
+        saved.append(reply)
+
+    monkeypatch.setattr(chat_module, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(chat_module, "stream_chat", fake_stream_chat)
+    monkeypatch.setattr(chat_module, "_begin_turn", fake_begin_turn)
+    monkeypatch.setattr(chat_module, "_save_reply", fake_save_reply)
+    monkeypatch.setenv("HISTORY_CACHE_ENABLED", "false")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        first = await client.post("/api/chat", json={"user_id": "u1", "message": "Сколько стоит?", "dialog_id": "d1"})
+        assert first.status_code == 200 and len(llm_calls) == 1  # промах: ответ получен от LLM
+        second = await client.post("/api/chat", json={"user_id": "u2", "message": "сколько стоит?", "dialog_id": "d2"})
+
+    assert len(llm_calls) == 1
+    assert second.status_code == 200
+    assert second.text.endswith("data: [DONE]\n\n")
+    assert saved == ["Тариф 990 ₽", "Тариф 990 ₽"]
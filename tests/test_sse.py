@@ -0,0 +1,98 @@
+"""
+Тесты SSE: разбор байтового потока через границы фрагментов, извлечение delta.content, склейка фрагментов.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app import sse
+from app.sse import coalesce, delta_content, is_done, iter_sse_data, sse_event
+
+
+async def _aiter(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+def _event(content):
+    return json.dumps({"choices": [{"index": 0, "delta": {"content": content}}]}, ensure_ascii=False)
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_data_across_chunk_boundaries():
+    raw = f"data: {_event('При')}\r\n\r\n: keep-alive\n\ndata:{_event('вет')}\n\ndata: [DONE]\n\n".encode()
+    # Режем посреди многобайтового символа и посреди "data:"
+    pieces = [raw[i : i + 7] for i in range(0, len(raw), 7)]
+    data = [d async for batch in iter_sse_data(_aiter(pieces)) for d in batch]
+    assert [delta_content(d) for d in data[:2]] == ["При", "вет"]
+    assert is_done(data[2]) and len(data) == 3
+
+
+def test_delta_content_ignores_events_without_text():
+    assert delta_content(b'{"choices":[{"delta":{"role":"assistant"}}]}') is None
+    assert delta_content(b'{"choices":[{"delta":{"content":null}}]}') is None
+    assert delta_content(b'{"choices":[],"content":1}') is None
+    assert delta_content(b'{"content": broken') is None
+    assert delta_content(_event('a "b"\n').encode()) == 'a "b"\n'
+
+
+def test_delta_content_without_orjson(monkeypatch):
+    """Путь stdlib json: тот же результат, включая пробелы вокруг JSON и лишние данные после него."""
+    monkeypatch.setattr(sse, "_loads", sse._json_loads)
+    assert delta_content(_event("Привет").encode()) == "Привет"
+    assert delta_content(f" {_event('x')} ".encode()) == "x"
+    assert delta_content(f"{_event('x')} junk".encode()) is None
+    assert delta_content(b'{"content": broken') is None
+
+
+def test_sse_event_framing():
+    assert sse_event("Привет") == "data: Привет\n\n".encode()
+
+
+@pytest.mark.asyncio
+async def test_coalesce_first_chunk_immediately_then_windows():
+    out = [c async for c in coalesce(_aiter(["a", "b", "c", "d"], delay=0.005), window_s=10.0, max_bytes=0)]
+    assert out == ["a", "bcd"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_by_size_and_by_timer():
+    out = [c async for c in coalesce(_aiter(["a", "bb", "cc", "d"]), window_s=10.0, max_bytes=4)]
+    assert out == ["a", "bbcc", "d"]
+
+    async def slow():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.2)
+        yield "c"
+
+    # Окно истекает, пока следующий фрагмент ещё не пришёл: "b" не ждёт "c"
+    out = [c async for c in coalesce(slow(), window_s=0.02, max_bytes=0)]
+    assert out == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_closes_upstream_on_early_exit():
+    closed = False
+
+    async def upstream():
+        nonlocal closed
+        try:
+            yield "a"
+            await asyncio.sleep(10)
+            yield "b"
+        finally:
+            closed = True
+
+    gen = coalesce(upstream(), window_s=0.01, max_bytes=0)
+    assert await anext(gen) == "a"
+    task = asyncio.ensure_future(anext(gen))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await gen.aclose()
+    assert closed
@@ -0,0 +1,77 @@
+"""
+Тесты статистики по дням: границы дня в часовом поясе, объединение свёрнутых дней и расчёта на лету.
+"""
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import stats
+from app.stats import day_start, get_stats
+
+
+def test_day_start_in_timezone():
+    assert day_start(date(2026, 3, 1), "Europe/Moscow") == datetime(2026, 2, 28, 21, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def frozen(monkeypatch):
+    """Сегодня — 10 марта; свёрнуты дни по 8 марта включительно."""
+    monkeypatch.setattr(stats, "today_in", lambda tz: date(2026, 3, 10))
+    monkeypatch.setattr(stats, "_last_rolled_day", AsyncMock(return_value=date(2026, 3, 8)))
+    live_calls = []
+
+    async def fake_compute(session, tz, first_day, last_day):
+        live_calls.append((tz, first_day, last_day))
+        return [
+            {"day": d, "sessions": 1, "unique_users": 1, "messages": 2}
+            for d in (date(2026, 3, 9), date(2026, 3, 10))
+            if first_day <= d <= last_day
+        ]
+
+    monkeypatch.setattr(stats, "compute_stats", fake_compute)
+    rolled = [SimpleNamespace(day=date(2026, 3, d), sessions=5, unique_users=3, messages=20) for d in (7, 8)]
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = rolled
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=result)
+    return session, live_calls
+
+
+@pytest.mark.asyncio
+async def test_rolled_days_plus_live_tail(frozen):
+    session, live_calls = frozen
+    rows = await get_stats(session, "UTC", date(2026, 3, 7))
+    assert [r["day"].day for r in rows] == [10, 9, 8, 7]
+    assert rows[-1]["sessions"] == 5
+    # На лету считаются только не свёрнутые дни: вчера и сегодня
+    assert live_calls == [("UTC", date(2026, 3, 9), date(2026, 3, 10))]
+
+
+@pytest.mark.asyncio
+async def test_other_timezone_is_computed_live(frozen):
+    session, live_calls = frozen
+    rows = await get_stats(session, "Europe/Moscow", date(2026, 3, 9), date(2026, 3, 9))
+    assert [r["day"].day for r in rows] == [9]
+    assert live_calls == [("Europe/Moscow", date(2026, 3, 9), date(2026, 3, 9))]
+
+
+@pytest.mark.asyncio
+async def test_stats_endpoint_rejects_unknown_timezone(monkeypatch):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.database import get_db
+    from app.main import app
+
+    async def no_db():
+        yield MagicMock()
+
+    monkeypatch.setenv("ADMIN_KEY", "secret")
+    app.dependency_overrides[get_db] = no_db
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            r = await client.get("/api/admin/stats", params={"tz": "Mars/Olympus"}, headers={"X-Admin-Key": "secret"})
+        assert r.status_code == 400
+    finally:
+        app.dependency_overrides.pop(get_db, None)
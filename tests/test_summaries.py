@@ -0,0 +1,119 @@
+"""
+Тесты сводки длинных диалогов: постановка в очередь по порогу, история «сводка + хвост»,
+сжатие всего, кроме последних сообщений, без обращения к LLM на пути запроса.
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import summaries
+from app.context import summary_message
+from app.history_cache import HistoryCache
+from app.routes.chat import _get_history
+from app.summaries import DialogSummarizer
+
+_T0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+def _msg(content: str, role: str = "user") -> dict[str, str]:
+    return {"role": role, "content": content}
+
+
+def _summarizer(**kwargs) -> DialogSummarizer:
+    params = {"trigger_tokens": 50, "keep_messages": 2, "input_tokens": 1000, "workers": 1, "max_queue": 10}
+    return DialogSummarizer(**{**params, **kwargs})
+
+
+def _rows(count: int, size: int = 40) -> list:
+    rows = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        rows.append(SimpleNamespace(role=role, content=f"{i}:" + "x" * size, created_at=_T0 + timedelta(seconds=i)))
+        rows[-1]._mapping = {"role": role, "content": rows[-1].content}
+    return rows
+
+
+@pytest.mark.asyncio
+async def test_schedules_only_long_dialogs_once():
+    summarizer = _summarizer()
+    assert not summarizer.maybe_schedule(("u", "d"), [_msg("коротко")])
+    long_history = [summary_message("x" * 1000), *[_msg("y" * 40) for _ in range(5)]]
+    assert summarizer.maybe_schedule(("u", "d"), long_history)
+    assert not summarizer.maybe_schedule(("u", "d"), long_history)
+    assert summarizer._queue.qsize() == 1
+    # Сводка в подсчёт не входит: она уже сжата
+    assert not summarizer.maybe_schedule(("u", "other"), [summary_message("x" * 1000)])
+
+
+def test_append_keeps_summary_in_front():
+    cache = HistoryCache(max_bytes=100_000, ttl=60)
+    cache.put(("u", "d"), [summary_message("ранее"), _msg("1"), _msg("2")])
+    cache.append(("u", "d"), [_msg("3"), _msg("4", "assistant")], limit=2, pinned=0)
+    history = cache.get(("u", "d"))
+    assert history[0] == summary_message("ранее")
+    assert [m["content"] for m in history[1:]] == ["3", "4"]
+
+
+@pytest.mark.asyncio
+async def test_get_history_returns_summary_and_tail(monkeypatch):
+    monkeypatch.setenv("SUMMARY_ENABLED", "true")
+    monkeypatch.setenv("HISTORY_CACHE_ENABLED", "false")
+    monkeypatch.setenv("HISTORY_TOKEN_BUDGET", "120")
+    summarizer = _summarizer(trigger_tokens=10)
+    monkeypatch.setattr(summaries, "_summarizer", summarizer)
+    session = MagicMock()
+    session.get = AsyncMock(return_value=SimpleNamespace(summary="ранее", covered_until=_T0))
+    result = MagicMock()
+    result.all.return_value = [
+        SimpleNamespace(role="user", content="новое", created_at=_T0 + timedelta(seconds=2)),
+        SimpleNamespace(role="assistant", content="y" * 400, created_at=_T0 + timedelta(seconds=1)),
+    ]
+    session.execute = AsyncMock(return_value=result)
+
+    history = await _get_history(session, "u", "d")
+    # Сводка закреплена, старший непоместившийся ответ отброшен бюджетом
+    assert history == [summary_message("ранее"), _msg("новое")]
+    assert "created_at >" in str(session.execute.await_args.args[0])
+    assert summarizer._queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_summarize_keeps_recent_messages(monkeypatch):
+    rows = _rows(8)
+    session = MagicMock()
+    session.get = AsyncMock(return_value=None)
+    result = MagicMock()
+    result.all.return_value = rows
+    session.execute = AsyncMock(return_value=result)
+
+    @asynccontextmanager
+    async def session_scope():
+        yield session
+
+    prompts = []
+
+    async def fake_complete(messages, *, system_prompt):
+        prompts.append(messages[0]["content"])
+        return "сводка"
+
+    stored = []
+
+    async def fake_store(user_id, dialog_id, summary, covered_until, covered):
+        stored.append((summary, covered_until, covered))
+        # Следующий шаг видит только несжатый хвост
+        result.all.return_value = rows[covered:]
+        session.get.return_value = SimpleNamespace(summary=summary, covered_until=covered_until, covered_messages=covered)
+        return True
+
+    monkeypatch.setattr(summaries, "session_scope", session_scope)
+    monkeypatch.setattr(summaries, "complete_background", fake_complete)
+    monkeypatch.setattr(summaries.get_prompt_store(), "get", lambda path: "сожми")
+    summarizer = _summarizer()
+    monkeypatch.setattr(summarizer, "_store", fake_store)
+
+    assert await summarizer.summarize("u", "d") == 6
+    assert stored == [("сводка", rows[5].created_at, 6)]
+    assert "Пользователь: 0:" in prompts[0] and "5:" in prompts[0] and "6:" not in prompts[0]
@@ -0,0 +1,238 @@
+"""
+Тесты пула апстримов LLM: переключение при ошибке до первого токена, circuit breaker, хеджирование.
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import llm
+from app.config import UpstreamConfig, get_settings
+from app.upstreams import CircuitBreaker, NoUpstreamAvailable, UpstreamPool
+
+
+def _sse_body(*tokens: str) -> bytes:
+    lines = [f'data: {{"choices": [{{"delta": {{"content": "{t}"}}}}]}}\n\n' for t in tokens]
+    return ("".join(lines) + "data: [DONE]\n\n").encode("utf-8")
+
+
+def _use_upstreams(monkeypatch, *hosts: str, **env: str) -> None:
+    upstreams = [{"url": f"http://{h}", "name": h} for h in hosts]
+    monkeypatch.setenv("LLM_UPSTREAMS", json.dumps(upstreams))
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def shared_client(monkeypatch):
+    """Общий клиент LLM на MockTransport; handler задаётся тестом по хосту апстрима."""
+    handlers = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return await handlers[request.url.host](request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "_client", client)
+    yield handlers
+
+
+def test_settings_upstreams_default_to_llm_url(monkeypatch):
+    monkeypatch.setenv("LLM_URL", "http://single")
+    monkeypatch.setenv("LLM_MODEL", "m")
+    get_settings.cache_clear()
+    [upstream] = get_settings().llm_upstreams
+    assert (upstream.url, upstream.model, upstream.name) == ("http://single", "m", "http://single")
+
+
+@pytest.mark.asyncio
+async def test_failover_before_first_token(monkeypatch, shared_client):
+    """503 первого апстрима скрыт от клиента: ответ отдаёт второй, модель — из конфигурации апстрима."""
+    _use_upstreams(monkeypatch, "a", "b", LLM_RETRIES="1")
+    models = []
+
+    async def broken(request):
+        return httpx.Response(503)
+
+    async def healthy(request):
+        models.append(json.loads(request.content)["model"])
+        return httpx.Response(200, content=_sse_body("ok"))
+
+    shared_client.update(a=broken, b=healthy)
+    for _ in range(3):
+        assert [c async for c in llm.stream_chat([], system_prompt="s")] == ["ok"]
+    assert models and set(models) == {get_settings().LLM_MODEL}
+
+
+@pytest.mark.asyncio
+async def test_client_error_is_not_retried(monkeypatch, shared_client):
+    _use_upstreams(monkeypatch, "a", "b", LLM_RETRIES="1")
+    calls = []
+
+    async def bad_request(request):
+        calls.append(request.url.host)
+        return httpx.Response(400)
+
+    shared_client.update(a=bad_request, b=bad_request)
+    with pytest.raises(httpx.HTTPStatusError):
+        [c async for c in llm.stream_chat([], system_prompt="s")]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_rejects(monkeypatch, shared_client):
+    """После LLM_BREAKER_FAILURES ошибок подряд апстрим не вызывается до конца паузы."""
+    _use_upstreams(monkeypatch, "a", LLM_RETRIES="0", LLM_BREAKER_FAILURES="2", LLM_BREAKER_COOLDOWN="60")
+    calls = []
+
+    async def broken(request):
+        calls.append(request.url.host)
+        raise httpx.ConnectError("refused", request=request)
+
+    shared_client.update(a=broken)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            [c async for c in llm.stream_chat([], system_prompt="s")]
+    with pytest.raises(NoUpstreamAvailable):
+        [c async for c in llm.stream_chat([], system_prompt="s")]
+    assert calls == ["a", "a"]
+
+
+def test_breaker_half_open_probe(monkeypatch):
+    breaker = CircuitBreaker(failures=1, cooldown=0.0)
+    assert breaker.on_failure()
+    assert breaker.available()
+    breaker.on_start()
+    assert not breaker.available()  # пробный запрос один
+    breaker.on_success()
+    assert breaker.available() and breaker.consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_interrupted_half_open_probe_does_not_exclude_upstream():
+    """Проба, прерванная aclose(), отменой или ошибкой 4xx, не оставляет апстрим исключённым навсегда."""
+    pool = UpstreamPool(
+        [UpstreamConfig(url="http://a", name="a")], retries=0, hedge_after=0, breaker_failures=1, breaker_cooldown=0
+    )
+    [upstream] = pool.upstreams
+    upstream.breaker.on_failure()
+    status = 200
+
+    async def open_stream(upstream):
+        request = httpx.Request("POST", "http://a/chat/completions")
+        if status != 200:
+            raise httpx.HTTPStatusError("bad request", request=request, response=httpx.Response(status, request=request))
+        yield "part"
+        await asyncio.sleep(10)
+        yield "!"
+
+    chunks = pool.stream(open_stream)
+    assert await anext(chunks) == "part"
+    assert not upstream.breaker.available()  # идёт проба
+    await chunks.aclose()
+    assert pool.pick() is upstream
+
+    async def consume():
+        async for _ in pool.stream(open_stream):
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert pool.pick() is upstream
+
+    status = 400
+    with pytest.raises(httpx.HTTPStatusError):
+        [c async for c in pool.stream(open_stream)]
+    assert pool.pick() is upstream
+    assert upstream.breaker.consecutive_failures == 1  # исхода пробы не было: breaker остаётся в half-open
+
+
+@pytest.mark.asyncio
+async def test_hedge_keeps_first_streaming_and_cancels_loser():
+    """Первый апстрим молчит дольше порога — запускается второй; его ответ отдаётся, первый закрывается."""
+    pool = UpstreamPool(
+        [UpstreamConfig(url="http://slow", name="slow"), UpstreamConfig(url="http://fast", name="fast")],
+        retries=0,
+        hedge_after=0.02,
+        breaker_failures=5,
+        breaker_cooldown=30,
+    )
+    pool.pick = lambda exclude=frozenset(): next(u for u in pool.upstreams if id(u) not in exclude)
+    closed = []
+
+    async def open_stream(upstream):
+        try:
+            if upstream.name == "slow":
+                await asyncio.sleep(10)
+            yield upstream.name
+            yield "!"
+        finally:
+            closed.append(upstream.name)
+
+    assert [c async for c in pool.stream(open_stream)] == ["fast", "!"]
+    assert sorted(closed) == ["fast", "slow"]
+
+
+@pytest.mark.asyncio
+async def test_no_retry_after_first_token():
+    pool = UpstreamPool(
+        [UpstreamConfig(url="http://a", name="a"), UpstreamConfig(url="http://b", name="b")],
+        retries=1,
+        hedge_after=0,
+        breaker_failures=5,
+        breaker_cooldown=30,
+    )
+    started = []
+
+    async def open_stream(upstream):
+        started.append(upstream.name)
+        yield "part"
+        raise httpx.ReadError("reset")
+
+    received = []
+    with pytest.raises(httpx.ReadError):
+        async for chunk in pool.stream(open_stream):
+            received.append(chunk)
+    assert received == ["part"] and len(started) == 1
+
+
+def test_duplicate_upstream_names_are_rejected(monkeypatch):
+    """Один url с разными моделями без name — одинаковые метки метрик, конфигурация отклоняется."""
+    from pydantic import ValidationError
+
+    upstreams = [{"url": "http://a", "model": "m1"}, {"url": "http://a", "model": "m2"}]
+    monkeypatch.setenv("LLM_UPSTREAMS", json.dumps(upstreams))
+    get_settings.cache_clear()
+    with pytest.raises(ValidationError, match="http://a"):
+        get_settings()
+
+    upstreams[1]["name"] = "a-m2"
+    monkeypatch.setenv("LLM_UPSTREAMS", json.dumps(upstreams))
+    get_settings.cache_clear()
+    assert [u.name for u in get_settings().llm_upstreams] == ["http://a", "a-m2"]
+
+
+@pytest.mark.asyncio
+async def test_retry_tells_upstreams_apart_by_identity():
+    """Повтор идёт на другой апстрим, даже если имена совпадают (пул создан в обход проверки настроек)."""
+    pool = UpstreamPool(
+        [UpstreamConfig(url="http://a", model="m1"), UpstreamConfig(url="http://a", model="m2")],
+        retries=1,
+        hedge_after=0,
+        breaker_failures=5,
+        breaker_cooldown=30,
+    )
+    models = []
+
+    async def open_stream(upstream):
+        models.append(upstream.config.model)
+        if len(models) == 1:
+            raise httpx.ConnectError("refused")
+        yield "ok"
+
+    assert [c async for c in pool.stream(open_stream)] == ["ok"]
+    assert sorted(models) == ["m1", "m2"]
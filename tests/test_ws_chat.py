@@ -0,0 +1,106 @@
+"""
+Тесты WebSocket-чата: ходы одного соединения без повторного чтения истории, отмена генерации,
+ошибки в кадрах error. Конвейер хода (БД, LLM) подменяется.
+"""
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.routes import chat as chat_module
+from app.routes import ws_chat
+
+
+@pytest.fixture
+def turn(monkeypatch):
+    """Начало хода и LLM подменены; в state — прочитанные истории, сохранённые ответы и закрытие стрима."""
+    state = {"loaded": 0, "windows": [], "saved": [], "pause": 0.0, "upstream_closed": 0}
+
+    async def fake_start_turn(body, history=None):
+        if history is None:
+            state["loaded"] += 1
+            history = []
+        state["windows"].append(list(history))
+        return history, history
+
+    async def fake_stream_chat(messages, *, system_prompt):
+        try:
+            yield "Здравствуйте"
+            await asyncio.sleep(state["pause"])
+            yield "!"
+        finally:
+            state["upstream_closed"] += 1
+
+    async def fake_save_reply(body, reply):
+        state["saved"].append(reply)
+
+    monkeypatch.setattr(ws_chat, "_start_turn", fake_start_turn)
+    monkeypatch.setattr(ws_chat, "get_system_prompt", lambda dialog_id: "Test assistant.")
+    monkeypatch.setattr(chat_module, "stream_chat", fake_stream_chat)
+    monkeypatch.setattr(chat_module, "_save_reply", fake_save_reply)
+    return state
+
+
+def _reply(ws) -> list[dict]:
+    frames = []
+    while not frames or frames[-1]["type"] not in ("done", "error", "cancelled"):
+        frames.append(ws.receive_json())
+    return frames
+
+
+def test_turns_share_connection_history(turn):
+    with TestClient(app).websocket_connect("/api/ws/chat?user_id=u1&dialog_id=d1") as ws:
+        ws.send_json({"type": "message", "message": "Привет"})
+        assert _reply(ws) == [
+            {"type": "chunk", "text": "Здравствуйте"},
+            {"type": "chunk", "text": "!"},
+            {"type": "done"},
+        ]
+        ws.send_json({"type": "message", "message": "Как дела?"})
+        assert _reply(ws)[-1] == {"type": "done"}
+
+    assert turn["loaded"] == 1
+    assert turn["windows"][1] == [
+        {"role": "user", "content": "Привет"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+    assert turn["saved"] == ["Здравствуйте!", "Здравствуйте!"]
+
+
+def test_cancel_stops_generation_without_saving(turn):
+    turn["pause"] = 60
+    cancels, disconnects = ws_chat.CHAT_CANCELS.value(), chat_module.CHAT_CLIENT_DISCONNECTS.value()
+    with TestClient(app).websocket_connect("/api/ws/chat?user_id=u1&dialog_id=d1") as ws:
+        ws.send_json({"type": "message", "message": "Привет"})
+        assert ws.receive_json() == {"type": "chunk", "text": "Здравствуйте"}
+        ws.send_json({"type": "message", "message": "Ещё"})
+        assert ws.receive_json()["status"] == 409
+        ws.send_json({"type": "cancel"})
+        assert ws.receive_json() == {"type": "cancelled"}
+        ws.send_json({"type": "message", "message": ""})
+        assert ws.receive_json()["status"] == 422
+
+    assert turn["upstream_closed"] == 1
+    assert turn["saved"] == []
+    assert ws_chat.CHAT_CANCELS.value() == cancels + 1
+    assert chat_module.CHAT_CLIENT_DISCONNECTS.value() == disconnects
+
+
+def test_connection_requires_user_id():
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with TestClient(app).websocket_connect("/api/ws/chat") as ws:
+            ws.receive_json()
+    assert exc.value.code == 1008
+
+
+def test_binary_frame_closes_connection_with_1003(turn):
+    from starlette.websockets import WebSocketDisconnect
+
+    with TestClient(app).websocket_connect("/api/ws/chat?user_id=u1&dialog_id=d1") as ws:
+        ws.send_bytes(b"\x00\x01")
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1003